@@ -1,7 +1,13 @@
+import os
 import sys
+import threading
 from src.postgres_server import postgres_server
 from src.mongo_server import mongo_server
 from src.neo4j_server import neo4j_server 
+from src.merge_scheduler import merge_scheduler
+from src.merkle import merkle_sync
+from src.network_server import network_server, DEFAULT_PORT
+from src.metrics import stats_report, prometheus_text
 
 def main():
     # Initialize servers
@@ -17,14 +23,41 @@ def main():
         sys.exit(1)
 
     try:
+        # 'python main.py serve [port]' serves the three servers over TCP instead of the prompt
+        if len(sys.argv) > 1 and sys.argv[1] == "serve":
+            port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT
+            network_server([pg_server, m_server, neo_server], port=port).serve_forever()
+            return
+
         while True:
-            command = input("Enter command ('query', 'update', 'merge', 'recover') and server ('postgres', 'mongo', 'neo4j'), followed by arguments:\n").split()
+            command = input("Enter command ('query', 'update', 'merge', 'recover', 'sync', 'load', 'compact', 'snapshot', 'stats') and server ('postgres', 'mongo', 'neo4j', or 'all' for merge), followed by arguments:\n").split()
             if (len(command) == 1 and (command[0] == "exit" or command[0] == "quit")):
                 break
 
-            
+            if command and command[0] == "stats":
+                # Latency percentiles, merge counters and replication lag of all three servers;
+                # 'stats prometheus [file]' gives them in the Prometheus text format instead
+                servers = [pg_server, m_server, neo_server]
+                if len(command) > 1 and command[1] == "prometheus":
+                    text = prometheus_text(servers)
+                    if len(command) > 2:
+                        with open(command[2], "w") as file:
+                            file.write(text)
+                        print(f"Wrote metrics to '{command[2]}'.")
+                    else:
+                        print(text)
+                else:
+                    print(stats_report(servers))
+                continue
+
             action, server_name, *args = command
 
+            if action == "merge" and server_name == "all":
+                # Every pair with unread log records is merged, independent pairs in parallel
+                report = merge_scheduler([pg_server, m_server, neo_server]).run()
+                print(f"Merged all servers in {report.rounds} rounds: {report.records} log records read in {report.seconds:.2f}s.")
+                continue
+
             if server_name == "postgres":
                 server = pg_server
             elif server_name == "mongo":
@@ -72,6 +105,31 @@ def main():
                 server.merge(*args)
                 server2.merge(server_name)
             
+            elif action == "sync":
+                if len(args) != 1:
+                    print("Invalid number of arguments for 'sync'. Please provide the server name.")
+                    continue
+                if args[0] == server_name:
+                    print("Server is already synced with itself.")
+                    continue
+
+                if args[0] == "postgres":
+                    server2 = pg_server
+                elif args[0] == "mongo":
+                    server2 = m_server
+                elif args[0] == "neo4j":
+                    server2 = neo_server
+                else:
+                    print("Invalid server. Please choose 'postgres', 'mongo', or 'neo4j'.")
+                    continue
+
+                # Compares Merkle trees and transfers only the triples of divergent buckets
+                report = merkle_sync(server, server2)
+                if report.divergent_buckets == 0:
+                    print(f"'{server_name}' and '{args[0]}' hold the same triples.")
+                else:
+                    print(f"Repaired {report.divergent_buckets} divergent buckets: sent {report.sent} and received {report.received} triples, {report.changed} applied in {report.seconds:.2f}s.")
+
             elif action == "recover":
                 if len(args) > 0:
                     print("Invalid number of arguments for 'recover'.")
@@ -79,8 +137,36 @@ def main():
 
                 server.recover()
 
+            elif action == "load":
+                if len(args) != 1:
+                    print("Invalid number of arguments for 'load'. Please provide the path of a triple file.")
+                    continue
+                if not os.path.isfile(args[0]):
+                    print(f"File '{args[0]}' not found.")
+                    continue
+
+                loaded = server.load(args[0])
+                print(f"Loaded {loaded} triples into '{server_name}'.")
+
+            elif action == "snapshot":
+                if len(args) > 0:
+                    print("Invalid number of arguments for 'snapshot'.")
+                    continue
+
+                # The dump runs in the background so the prompt stays usable
+                threading.Thread(target=server.snapshot, daemon=True).start()
+                print(f"Snapshot of '{server_name}' started.")
+
+            elif action == "compact":
+                if len(args) > 0:
+                    print("Invalid number of arguments for 'compact'.")
+                    continue
+
+                dropped = server.compact_log()
+                print(f"Dropped {dropped} superseded log entries from '{server_name}'.")
+
             else:
-                print("Invalid action. Please choose 'query', 'update', 'merge', or 'recover'.")
+                print("Invalid action. Please choose 'query', 'update', 'merge', 'recover', 'sync', 'load', 'compact', 'snapshot', or 'stats'.")
 
     finally:
         # Disconnect servers
@@ -0,0 +1,122 @@
+import asyncio
+import time
+import os
+from .async_server_interface import async_server, replay_log
+from .server_interface import log_replay
+from .log_reader import log_reader
+from .log_writer import log_writer, FSYNC_INTERVAL
+from .log_format import TEXT_FORMAT, newest_per_key
+
+
+class async_memory_server (async_server):
+    """In-process stand-in for an async backend, for exercising merges without databases.
+
+    Triples and log positions live in dictionaries, but the server writes and reads real
+    log shards in logs_dir with the same log_writer / log_reader, so it merges with other
+    stand-ins (or real servers pointed at the same logs) exactly like a database does.
+    Every request takes latency_ms and at most max_in_flight of them run at once, which
+    simulates the round trips the real backends pay.
+    """
+
+    def __init__(self, server_name, logs_dir, latency_ms=1, max_in_flight=8, merge_batch_size=1000, log_format=TEXT_FORMAT,
+                 fsync_policy=FSYNC_INTERVAL, fsync_every=100, fsync_interval_ms=50,
+                 segment_bytes=64 * 1024 * 1024, segment_records=None):
+        self.server_name = server_name
+        self.logs_dir = logs_dir
+        self.latency_ms = latency_ms
+        self.max_in_flight = max_in_flight
+        self.in_flight = None
+        self.triples = {}
+        self.log_positions = {}
+        self.version_vector = {}
+        self.merge_lock = asyncio.Lock()
+        self.log_file = os.path.join(logs_dir, server_name)
+        self.log_writer = None
+        self.segment_bytes = segment_bytes
+        self.segment_records = segment_records
+        self.log_file_exenstion = ".log"
+        self.log_format = log_format
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval_ms = fsync_interval_ms
+        self.log_readers = {}
+        self.merge_batch_size = merge_batch_size
+
+    @property
+    def sequence_number(self):
+        return self.log_writer.sequence_number if self.log_writer else None
+
+    async def _round_trip(self):
+        async with self.in_flight:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    async def connect(self):
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        os.makedirs(self.logs_dir, exist_ok=True)
+        self.log_writer = log_writer(self.log_file, self.segment_bytes, self.segment_records, self.log_file_exenstion, self.log_format,
+                                     self.fsync_policy, self.fsync_every, self.fsync_interval_ms,
+                                     checkpoint=self._checkpoint_log_position)
+        self.log_writer.open(self.log_positions.get(self.server_name, 0))
+
+    def _checkpoint_log_position(self, sequence_number):
+        self.log_positions[self.server_name] = sequence_number
+
+    async def query(self, subject):
+        await self._round_trip()
+        return [(s, predicate, obj, timestamp) for (s, predicate), (obj, timestamp) in self.triples.items() if s == subject]
+
+    async def update(self, subject, predicate, new_object):
+        timestamp = int(time.time() * 1000)
+        await self._round_trip()
+        self.triples[(subject, predicate)] = (new_object, timestamp)
+        await asyncio.to_thread(self.log_writer.append, subject, predicate, new_object, timestamp)
+
+    def _log_reader(self, log_file):
+        if log_file not in self.log_readers:
+            self.log_readers[log_file] = log_reader(log_file, self.log_file_exenstion)
+        return self.log_readers[log_file]
+
+    async def _apply_log_batch(self, records):
+        # Last-writer-wins with the same tie rule as the databases: only a strictly newer record
+        # replaces. Like them, the batch is first reduced to its newest record per key.
+        await self._round_trip()
+        changed = []
+        for row in newest_per_key(records).values():
+            subject, predicate, obj, timestamp = row[:4]
+            current = self.triples.get((subject, predicate))
+            if current is None or current[1] < timestamp:
+                self.triples[(subject, predicate)] = (obj, timestamp)
+                changed.append(row)
+        return changed
+
+    async def _replay_records(self, records, log_pos, server_name=None, relog=True):
+        # log_replay decides which records are applied. Returns the last position read and the
+        # number of records read.
+        replay = log_replay(self.server_name, self.version_vector, self.merge_batch_size, log_pos, server_name)
+
+        async def flush_batch(rows, log_pos, advances):
+            changed = await self._apply_log_batch(rows)
+            if changed and relog:
+                await asyncio.to_thread(self.log_writer.append_many, changed)
+            if server_name is not None:
+                self.log_positions[server_name] = log_pos
+                replay.saved(advances)
+
+        return await replay_log(replay, records, flush_batch)
+
+    async def merge(self, server_name):
+        # Merges into one server share its version vector, so they run one at a time
+        async with self.merge_lock:
+            log_position = self.log_positions.get(server_name, 0)
+            log_file = os.path.join(self.logs_dir, server_name)
+            _, count = await self._replay_records(self._log_reader(log_file).read(log_position), log_position, server_name)
+            return count
+
+    async def recover(self):
+        async with self.merge_lock:
+            self.triples = {}
+            await self._replay_records(self._log_reader(self.log_file).read(0), 0, relog=False)
+
+    async def disconnect(self):
+        if self.log_writer:
+            await asyncio.to_thread(self.log_writer.close)
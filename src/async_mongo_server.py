@@ -0,0 +1,214 @@
+import asyncio
+from pymongo import AsyncMongoClient, UpdateOne
+from time import time
+import os
+from .async_server_interface import async_server, replay_log
+from .server_interface import log_replay
+from .log_reader import log_reader
+from .log_writer import log_writer, FSYNC_INTERVAL
+from .snapshot import list_snapshots, read_snapshot
+from .log_format import TEXT_FORMAT, newest_per_key
+
+
+class async_mongo_server(async_server):
+    """mongo_server on PyMongo's asyncio client.
+
+    The client's connection pool is capped at max_in_flight, which bounds the requests
+    this server has outstanding however many merges share the event loop. Log records are
+    read and written with the same log_reader / log_writer as the synchronous server.
+    """
+
+    def __init__(self, host, port, database, max_in_flight=8, merge_batch_size=1000, log_format=TEXT_FORMAT,
+                 fsync_policy=FSYNC_INTERVAL, fsync_every=100, fsync_interval_ms=50,
+                 segment_bytes=64 * 1024 * 1024, segment_records=None):
+        self.server_name = "mongo"
+        self.host = host
+        self.port = port
+        self.database = database
+        self.max_in_flight = max_in_flight
+        self.client = None
+        self.loop = None
+        self.log_file = "mongo"
+        self.log_writer = None
+        self.segment_bytes = segment_bytes
+        self.segment_records = segment_records
+        self.log_file_exenstion = ".log"
+        self.log_format = log_format
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval_ms = fsync_interval_ms
+        self.log_readers = {}
+        self.merge_batch_size = merge_batch_size
+        self.version_vector = {}
+        self.merge_lock = asyncio.Lock()
+
+    @property
+    def sequence_number(self):
+        return self.log_writer.sequence_number if self.log_writer else None
+
+    async def connect(self):
+        try:
+            self.loop = asyncio.get_running_loop()
+            self.client = AsyncMongoClient(self.host, self.port, maxPoolSize=self.max_in_flight)
+            self.db = self.client[self.database]
+            print("Connected to MongoDB database!")
+
+            parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+            logs_dir = os.path.join(parent_dir, "logs")
+            self.log_file = os.path.join(logs_dir, self.log_file)
+
+            mongo_row = await self.db.log_positions.find_one({"server_name": self.server_name})
+            if mongo_row is None:
+                await self.disconnect()
+                raise ValueError("Error: 'log_positions' table not initialized for MongoDB.")
+
+            self.version_vector = {row["origin"]: row["origin_seq"] async for row in self.db.version_vector.find({}, {"_id": 0})}
+
+            self.log_writer = log_writer(self.log_file, self.segment_bytes, self.segment_records, self.log_file_exenstion, self.log_format,
+                                         self.fsync_policy, self.fsync_every, self.fsync_interval_ms,
+                                         checkpoint=self._checkpoint_log_position)
+            self.log_writer.open(mongo_row["log_position"])
+
+        except Exception as error:
+            print("Error connecting to MongoDB database:", error)
+
+    def _checkpoint_log_position(self, sequence_number):
+        # Runs on the log writer's thread; the write itself is scheduled on the event loop
+        future = asyncio.run_coroutine_threadsafe(self._save_log_position(self.server_name, sequence_number), self.loop)
+        future.result(timeout=10)
+
+    async def _save_log_position(self, server_name, log_pos):
+        await self.db.log_positions.update_one(
+            {"server_name": server_name},
+            {"$set": {"log_position": log_pos}}
+        )
+
+    async def query(self, subject):
+        try:
+            triples = self.db.triples.find({"subject": subject})
+            return [(triple["subject"], triple["predicate"], triple["object"], triple["timestamp"]) async for triple in triples]
+        except Exception as error:
+            print("Error querying database:", error)
+            return []
+
+    async def update(self, subject, predicate, new_object):
+        try:
+            timestamp = int(time() * 1000)
+            await self.db.triples.update_one({"subject": subject, "predicate": predicate}, {"$set": {"object": new_object, "timestamp": timestamp}}, upsert=True)
+            await asyncio.to_thread(self.log_writer.append, subject, predicate, new_object, timestamp)
+        except Exception as error:
+            print("Error updating pair:", error)
+
+    def _log_reader(self, log_file):
+        # One reader per log, so its sparse offset index stays loaded between merges
+        if log_file not in self.log_readers:
+            self.log_readers[log_file] = log_reader(log_file, self.log_file_exenstion)
+        return self.log_readers[log_file]
+
+    async def _apply_log_batch(self, records):
+        # Same pipeline upserts and change detection as mongo_server._apply_log_batch
+        latest = newest_per_key(records)
+
+        if not latest:
+            return []
+
+        rows = list(latest.values())
+        operations = []
+        for subject, predicate, obj, timestamp, *_ in rows:
+            newer = {"$lt": [{"$ifNull": ["$timestamp", -1]}, timestamp]}
+            operations.append(UpdateOne(
+                {"subject": subject, "predicate": predicate},
+                [{"$set": {
+                    "object": {"$cond": [newer, {"$literal": obj}, "$object"]},
+                    "timestamp": {"$cond": [newer, timestamp, "$timestamp"]},
+                }}],
+                upsert=True
+            ))
+
+        result = await self.db.triples.bulk_write(operations, ordered=False)
+
+        upserted = set(result.upserted_ids)
+        existing_rows = [i for i in range(len(rows)) if i not in upserted]
+        if result.modified_count == len(existing_rows):
+            return rows
+        if result.modified_count == 0:
+            return [rows[i] for i in sorted(upserted)]
+
+        current = {}
+        subjects = list({rows[i][0] for i in existing_rows})
+        async for doc in self.db.triples.find({"subject": {"$in": subjects}}, {"subject": 1, "predicate": 1, "object": 1, "timestamp": 1}):
+            current[(doc["subject"], doc["predicate"])] = (doc.get("object"), doc.get("timestamp"))
+
+        changed = set(upserted)
+        for i in existing_rows:
+            subject, predicate, obj, timestamp = rows[i][:4]
+            if current.get((subject, predicate)) == (obj, timestamp):
+                changed.add(i)
+        return [rows[i] for i in sorted(changed)]
+
+    async def _replay_records(self, records, log_pos, server_name=None, relog=True):
+        # Applies log records in batches of merge_batch_size, storing the peer's position and
+        # version vector advances after every batch. log_replay decides which records are
+        # applied. Returns the last position read and the number of records read.
+        replay = log_replay(self.server_name, self.version_vector, self.merge_batch_size, log_pos, server_name)
+
+        async def flush_batch(rows, log_pos, advances):
+            changed = await self._apply_log_batch(rows)
+            if changed and relog:
+                await asyncio.to_thread(self.log_writer.append_many, changed)
+
+            if server_name is not None:
+                await self._save_log_position(server_name, log_pos)
+                if advances:
+                    await self.db.version_vector.bulk_write([UpdateOne({"origin": origin}, {"$max": {"origin_seq": origin_seq}}, upsert=True)
+                                                             for origin, origin_seq in advances.items()], ordered=False)
+                    replay.saved(advances)
+
+        return await replay_log(replay, records, flush_batch)
+
+    async def merge(self, server_name):
+        # Merges into one server share its version vector, so they run one at a time
+        try:
+            async with self.merge_lock:
+                log_position = await self.db.log_positions.find_one({"server_name": server_name})
+                if log_position is None:
+                    raise ValueError(f"Log position not found for '{server_name}' server")
+
+                log_pos = log_position.get("log_position", 0)
+                parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+                logs_dir = os.path.join(parent_dir, "logs")
+                log_file = os.path.join(logs_dir, server_name)
+                _, count = await self._replay_records(self._log_reader(log_file).read(log_pos), log_pos, server_name)
+                return count
+
+        except Exception as e:
+            print("Error merging MongoDB database:", e)
+        return 0
+
+    async def recover(self):
+        try:
+            async with self.merge_lock:
+                log_pos = 0
+                for sequence_number, path in list_snapshots(self.log_file):
+                    try:
+                        await self._replay_records(read_snapshot(path), 0, relog=False)
+                        log_pos = sequence_number
+                        break
+                    except ValueError as error:
+                        print("Skipping damaged snapshot:", error)
+
+                await self._replay_records(self._log_reader(self.log_file).read(log_pos), log_pos, relog=False)
+
+        except Exception as e:
+            print("Error recovering MongoDB database:", e)
+
+    async def disconnect(self):
+        try:
+            if self.log_writer:
+                # close() stores a final checkpoint through the event loop, so it must not block it
+                await asyncio.to_thread(self.log_writer.close)
+            if self.client:
+                await self.client.close()
+                print("Disconnected from MongoDB database.")
+        except Exception as error:
+            print("Error disconnecting from MongoDB database:", error)
@@ -0,0 +1,218 @@
+import asyncio
+from neo4j import AsyncGraphDatabase
+import time
+import os
+from .async_server_interface import async_server, replay_log
+from .server_interface import log_replay
+from .log_reader import log_reader
+from .log_writer import log_writer, FSYNC_INTERVAL
+from .snapshot import list_snapshots, read_snapshot
+from .log_format import TEXT_FORMAT, newest_per_key
+from .neo4j_server import MERGE_ROWS_QUERY, UPSERT_ROWS_QUERY, QUERY_SUBJECT_QUERY, SAVE_LOG_POSITION_QUERY, SAVE_VERSION_VECTOR_QUERY
+
+
+class async_neo4j_server (async_server):
+    """neo4j_server on the driver's asyncio API (AsyncGraphDatabase).
+
+    The driver's connection pool is capped at max_in_flight, which bounds the requests
+    this server has outstanding however many merges share the event loop. Cypher and log
+    handling are shared with the synchronous server.
+    """
+
+    def __init__(self, uri, user, password, max_in_flight=8, merge_batch_size=1000, log_format=TEXT_FORMAT,
+                 fsync_policy=FSYNC_INTERVAL, fsync_every=100, fsync_interval_ms=50,
+                 segment_bytes=64 * 1024 * 1024, segment_records=None):
+        self.server_name = "neo4j"
+        self.uri = uri
+        self.user = user
+        self.password = password
+        self.max_in_flight = max_in_flight
+        self.driver = None
+        self.loop = None
+        self.log_file = "neo4j"
+        self.log_writer = None
+        self.segment_bytes = segment_bytes
+        self.segment_records = segment_records
+        self.log_file_exenstion = ".log"
+        self.log_format = log_format
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval_ms = fsync_interval_ms
+        self.log_readers = {}
+        self.merge_batch_size = merge_batch_size
+        self.version_vector = {}
+        self.merge_lock = asyncio.Lock()
+
+    @property
+    def sequence_number(self):
+        return self.log_writer.sequence_number if self.log_writer else None
+
+    async def connect(self):
+        try:
+            self.loop = asyncio.get_running_loop()
+            self.driver = AsyncGraphDatabase.driver(self.uri, auth=(self.user, self.password), max_connection_pool_size=self.max_in_flight)
+            print("Connected to Neo4j database!")
+
+            parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+            logs_dir = os.path.join(parent_dir, "logs")
+            self.log_file = os.path.join(logs_dir, self.log_file)
+
+            stored_sequence_number = await self._load_log_position(self.server_name)
+            if stored_sequence_number is None:
+                await self.disconnect()
+                raise ValueError("Error: 'LogPosition' node not found for Neo4j.")
+
+            async with self.driver.session() as session:
+                result = await session.run("MATCH (v:VersionVector) RETURN v.origin AS origin, v.origin_seq AS origin_seq")
+                self.version_vector = {record["origin"]: record["origin_seq"] async for record in result}
+
+            self.log_writer = log_writer(self.log_file, self.segment_bytes, self.segment_records, self.log_file_exenstion, self.log_format,
+                                         self.fsync_policy, self.fsync_every, self.fsync_interval_ms,
+                                         checkpoint=self._checkpoint_log_position)
+            self.log_writer.open(stored_sequence_number)
+
+        except Exception as e:
+            print("Error connecting to Neo4j database:", e)
+
+    def _checkpoint_log_position(self, sequence_number):
+        # Runs on the log writer's thread; the write itself is scheduled on the event loop
+        future = asyncio.run_coroutine_threadsafe(self._save_log_position(self.server_name, sequence_number), self.loop)
+        future.result(timeout=10)
+
+    async def _load_log_position(self, server_name):
+        async with self.driver.session() as session:
+            result = await session.run("MATCH (lp:LogPosition {server_name: $server_name}) RETURN lp.log_position AS log_position", server_name=server_name)
+            record = await result.single()
+        return record["log_position"] if record else None
+
+    async def _save_log_position(self, server_name, log_pos, session=None):
+        async def save(tx):
+            result = await tx.run(SAVE_LOG_POSITION_QUERY, server_name=server_name, log_position=log_pos)
+            await result.consume()
+
+        if session is not None:
+            await session.execute_write(save)
+            return
+        async with self.driver.session() as session:
+            await session.execute_write(save)
+
+    async def _save_version_vector(self, session, origins):
+        rows = [{"origin": origin, "origin_seq": origin_seq} for origin, origin_seq in origins.items()]
+
+        async def save(tx):
+            result = await tx.run(SAVE_VERSION_VECTOR_QUERY, rows=rows)
+            await result.consume()
+
+        await session.execute_write(save)
+
+    async def query(self, subject):
+        try:
+            async with self.driver.session() as session:
+                result = await session.run(QUERY_SUBJECT_QUERY, subject=subject)
+                return [(record["subject"], record["predicate"], record["object"], record["timestamp"]) async for record in result]
+
+        except Exception as error:
+            print("Error querying Neo4j database:", error)
+            return []
+
+    async def update(self, subject, predicate, new_object):
+        try:
+            timestamp = int(time.time() * 1000)  # Current Unix Epoch Milliseconds
+            rows = [{"subject": subject, "predicate": predicate, "object": new_object, "timestamp": timestamp}]
+
+            async def upsert(tx):
+                result = await tx.run(UPSERT_ROWS_QUERY, rows=rows)
+                await result.consume()
+
+            async with self.driver.session() as session:
+                await session.execute_write(upsert)
+            await asyncio.to_thread(self.log_writer.append, subject, predicate, new_object, timestamp)
+        except Exception as error:
+            print("Error updating triple:", error)
+
+    def _log_reader(self, log_file):
+        # One reader per log, so its sparse offset index stays loaded between merges
+        if log_file not in self.log_readers:
+            self.log_readers[log_file] = log_reader(log_file, self.log_file_exenstion)
+        return self.log_readers[log_file]
+
+    async def _apply_log_batch(self, session, records):
+        # Same last-writer-wins rules as neo4j_server._apply_log_batch
+        latest = newest_per_key(records)
+
+        if not latest:
+            return []
+
+        rows = [{"subject": subject, "predicate": predicate, "object": obj, "timestamp": timestamp} for subject, predicate, obj, timestamp, *_ in latest.values()]
+
+        async def apply_rows(tx):
+            result = await tx.run(MERGE_ROWS_QUERY, rows=rows)
+            return {(record["subject"], record["predicate"]) async for record in result}
+
+        changed = await session.execute_write(apply_rows)
+        return [row for key, row in latest.items() if key in changed]
+
+    async def _replay_records(self, session, records, log_pos, server_name=None, relog=True):
+        # Applies log records in batches of merge_batch_size, storing the peer's position and
+        # version vector advances with every batch. log_replay decides which records are
+        # applied. Returns the last position read and the number of records read.
+        replay = log_replay(self.server_name, self.version_vector, self.merge_batch_size, log_pos, server_name)
+
+        async def flush_batch(rows, log_pos, advances):
+            changed = await self._apply_log_batch(session, rows)
+            if changed and relog:
+                await asyncio.to_thread(self.log_writer.append_many, changed)
+            if server_name is not None:
+                await self._save_log_position(server_name, log_pos, session)
+                if advances:
+                    await self._save_version_vector(session, advances)
+                    replay.saved(advances)
+
+        return await replay_log(replay, records, flush_batch)
+
+    async def merge(self, server_name):
+        # Merges into one server share its version vector, so they run one at a time
+        try:
+            async with self.merge_lock:
+                log_position = await self._load_log_position(server_name)
+                if log_position is None:
+                    raise ValueError(f"Log position not found for '{server_name}' server")
+
+                parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+                logs_dir = os.path.join(parent_dir, "logs")
+                log_file = os.path.join(logs_dir, server_name)
+                async with self.driver.session() as session:
+                    _, count = await self._replay_records(session, self._log_reader(log_file).read(log_position), log_position, server_name)
+                return count
+
+        except Exception as e:
+            print("Error merging Neo4j database:", e)
+        return 0
+
+    async def recover(self):
+        try:
+            async with self.merge_lock, self.driver.session() as session:
+                log_pos = 0
+                for sequence_number, path in list_snapshots(self.log_file):
+                    try:
+                        await self._replay_records(session, read_snapshot(path), 0, relog=False)
+                        log_pos = sequence_number
+                        break
+                    except ValueError as error:
+                        print("Skipping damaged snapshot:", error)
+
+                await self._replay_records(session, self._log_reader(self.log_file).read(log_pos), log_pos, relog=False)
+
+        except Exception as e:
+            print("Error recovering Neo4j database:", e)
+
+    async def disconnect(self):
+        try:
+            if self.log_writer:
+                # close() stores a final checkpoint through the event loop, so it must not block it
+                await asyncio.to_thread(self.log_writer.close)
+            if self.driver:
+                await self.driver.close()
+            print("Disconnected from Neo4j database.")
+        except Exception as error:
+            print("Error disconnecting from Neo4j database:", error)
@@ -0,0 +1,216 @@
+import asyncio
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+import time
+import os
+from .async_server_interface import async_server, replay_log
+from .server_interface import log_replay
+from .log_reader import log_reader
+from .log_writer import log_writer, FSYNC_INTERVAL
+from .snapshot import list_snapshots, read_snapshot
+from .log_format import TEXT_FORMAT, newest_per_key
+
+# Last-writer-wins for a batch passed as four parallel arrays, in one statement
+MERGE_ROWS_QUERY = """
+INSERT INTO triples (subject, predicate, object, timestamp)
+SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::bigint[])
+ON CONFLICT (subject, predicate) DO UPDATE SET object = EXCLUDED.object, timestamp = EXCLUDED.timestamp
+WHERE triples.timestamp < EXCLUDED.timestamp
+RETURNING subject, predicate
+"""
+
+SAVE_VERSION_VECTOR_QUERY = """
+INSERT INTO version_vector (origin, origin_seq)
+SELECT * FROM unnest(%s::text[], %s::bigint[])
+ON CONFLICT (origin) DO UPDATE SET origin_seq = GREATEST(version_vector.origin_seq, EXCLUDED.origin_seq)
+"""
+
+
+class async_postgres_server (async_server):
+    """postgres_server on psycopg 3's asyncio API.
+
+    Requests run on a pool of at most max_in_flight connections, so merges from different
+    peers proceed concurrently under one event loop. Log records are read and written
+    with the same log_reader / log_writer as the synchronous server, so the two can be
+    used on the same database and logs.
+    """
+
+    def __init__(self, host, port, database, user, password, max_in_flight=8, merge_batch_size=1000, log_format=TEXT_FORMAT,
+                 fsync_policy=FSYNC_INTERVAL, fsync_every=100, fsync_interval_ms=50,
+                 segment_bytes=64 * 1024 * 1024, segment_records=None):
+        self.server_name = "postgres"
+        self.conninfo = psycopg.conninfo.make_conninfo(host=host, port=port, dbname=database, user=user, password=password)
+        self.max_in_flight = max_in_flight
+        self.pool = None
+        self.loop = None
+        self.log_file = "postgres"
+        self.log_writer = None
+        self.segment_bytes = segment_bytes
+        self.segment_records = segment_records
+        self.log_file_exenstion = ".log"
+        self.log_format = log_format
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval_ms = fsync_interval_ms
+        self.log_readers = {}
+        self.merge_batch_size = merge_batch_size
+        self.version_vector = {}
+        self.merge_lock = asyncio.Lock()
+
+    @property
+    def sequence_number(self):
+        return self.log_writer.sequence_number if self.log_writer else None
+
+    async def connect(self):
+        try:
+            self.loop = asyncio.get_running_loop()
+            self.pool = AsyncConnectionPool(self.conninfo, min_size=1, max_size=self.max_in_flight, open=False)
+            await self.pool.open()
+            print("Connected to PostgreSQL database!")
+
+            stored_sequence_number = await self._load_log_position(self.server_name)
+            if stored_sequence_number is None:
+                await self.disconnect()
+                raise ValueError("Error: 'log_positions' table not initialized for PostgreSQL.")
+
+            async with self.pool.connection() as conn:
+                cur = await conn.execute("SELECT origin, origin_seq FROM version_vector")
+                self.version_vector = dict(await cur.fetchall())
+
+            parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+            logs_dir = os.path.join(parent_dir, "logs")
+            self.log_file = os.path.join(logs_dir, self.log_file)
+
+            self.log_writer = log_writer(self.log_file, self.segment_bytes, self.segment_records, self.log_file_exenstion, self.log_format,
+                                         self.fsync_policy, self.fsync_every, self.fsync_interval_ms,
+                                         checkpoint=self._checkpoint_log_position)
+            self.log_writer.open(stored_sequence_number)
+
+        except Exception as error:
+            print("Error connecting to PostgreSQL database:", error)
+
+    def _checkpoint_log_position(self, sequence_number):
+        # Runs on the log writer's thread; the write itself is scheduled on the event loop
+        future = asyncio.run_coroutine_threadsafe(self._save_log_position(self.server_name, sequence_number), self.loop)
+        future.result(timeout=10)
+
+    async def _load_log_position(self, server_name):
+        async with self.pool.connection() as conn:
+            cur = await conn.execute("SELECT log_position FROM log_positions WHERE server_name = %s", (server_name,))
+            row = await cur.fetchone()
+        return row[0] if row else None
+
+    async def _save_log_position(self, server_name, log_pos, conn=None):
+        if conn is not None:
+            await conn.execute("UPDATE log_positions SET log_position = %s WHERE server_name = %s", (log_pos, server_name))
+            return
+        async with self.pool.connection() as conn:
+            await conn.execute("UPDATE log_positions SET log_position = %s WHERE server_name = %s", (log_pos, server_name))
+
+    async def query(self, subject):
+        try:
+            async with self.pool.connection() as conn:
+                cur = await conn.execute("SELECT subject, predicate, object, timestamp FROM triples WHERE subject = %s", (subject,))
+                return await cur.fetchall()
+        except psycopg.Error as error:
+            print("Error querying database:", error)
+            return []
+
+    async def update(self, subject, predicate, new_object):
+        try:
+            timestamp = int(time.time() * 1000)  # Current Unix Epoch Milliseconds
+            async with self.pool.connection() as conn:
+                await conn.execute("INSERT INTO triples (subject, predicate, object, timestamp) VALUES (%s, %s, %s, %s) ON CONFLICT (subject, predicate) DO UPDATE SET object = EXCLUDED.object, timestamp = EXCLUDED.timestamp", (subject, predicate, new_object, timestamp))
+            await asyncio.to_thread(self.log_writer.append, subject, predicate, new_object, timestamp)
+        except psycopg.Error as error:
+            print("Error updating triple:", error)
+
+    def _log_reader(self, log_file):
+        # One reader per log, so its sparse offset index stays loaded between merges
+        if log_file not in self.log_readers:
+            self.log_readers[log_file] = log_reader(log_file, self.log_file_exenstion)
+        return self.log_readers[log_file]
+
+    async def _apply_log_batch(self, conn, records):
+        # Same last-writer-wins rules as postgres_server._apply_log_batch
+        latest = newest_per_key(records)
+
+        if not latest:
+            return []
+
+        columns = [list(column) for column in zip(*(row[:4] for row in latest.values()))]
+        cur = await conn.execute(MERGE_ROWS_QUERY, columns)
+        changed = {(subject, predicate) for subject, predicate in await cur.fetchall()}
+        return [row for key, row in latest.items() if key in changed]
+
+    async def _replay_records(self, records, log_pos, server_name=None, relog=True):
+        # Every batch is one transaction on a pooled connection, which also stores the peer's
+        # log position and version vector advances; changed rows are re-logged once it has
+        # committed. log_replay decides which records are applied. Returns the last position
+        # read and the number of records read.
+        replay = log_replay(self.server_name, self.version_vector, self.merge_batch_size, log_pos, server_name)
+
+        async def flush_batch(rows, log_pos, advances):
+            async with self.pool.connection() as conn:
+                async with conn.transaction():
+                    changed = await self._apply_log_batch(conn, rows)
+                    if server_name is not None:
+                        await self._save_log_position(server_name, log_pos, conn)
+                        if advances:
+                            await conn.execute(SAVE_VERSION_VECTOR_QUERY, [list(advances), list(advances.values())])
+            replay.saved(advances)
+
+            if changed and relog:
+                await asyncio.to_thread(self.log_writer.append_many, changed)
+
+        return await replay_log(replay, records, flush_batch)
+
+    async def merge(self, server_name):
+        # Merges into one server share its version vector, so they run one at a time
+        try:
+            async with self.merge_lock:
+                log_position = await self._load_log_position(server_name)
+                if log_position is None:
+                    raise ValueError(f"Log position not found for '{server_name}' server")
+
+                parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+                logs_dir = os.path.join(parent_dir, "logs")
+                log_file = os.path.join(logs_dir, server_name)
+                _, count = await self._replay_records(self._log_reader(log_file).read(log_position), log_position, server_name)
+                return count
+
+        except psycopg.Error as e:
+            print("Error during merge:", e)
+        except Exception as e:
+            print("Unexpected error:", e)
+        return 0
+
+    async def recover(self):
+        try:
+            async with self.merge_lock:
+                log_pos = 0
+                for sequence_number, path in list_snapshots(self.log_file):
+                    try:
+                        await self._replay_records(read_snapshot(path), 0, relog=False)
+                        log_pos = sequence_number
+                        break
+                    except ValueError as error:
+                        print("Skipping damaged snapshot:", error)
+
+                await self._replay_records(self._log_reader(self.log_file).read(log_pos), log_pos, relog=False)
+
+        except psycopg.Error as e:
+            print("Error during recover:", e)
+        except Exception as e:
+            print("Unexpected error:", e)
+
+    async def disconnect(self):
+        try:
+            if self.log_writer:
+                # close() stores a final checkpoint through the event loop, so it must not block it
+                await asyncio.to_thread(self.log_writer.close)
+            if self.pool:
+                await self.pool.close()
+            print("Disconnected from PostgreSQL database.")
+        except psycopg.Error as error:
+            print("Error disconnecting from PostgreSQL database:", error)
@@ -0,0 +1,65 @@
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+
+class async_server (ABC):
+    @abstractmethod
+    async def connect(self):
+        pass
+
+    @abstractmethod
+    async def query(self, subject):
+        pass
+
+    @abstractmethod
+    async def update(self, subject, predicate, new_object):
+        pass
+
+    @abstractmethod
+    async def merge (self, server_name) :
+        pass
+
+    @abstractmethod
+    async def recover (self) :
+        pass
+
+    @abstractmethod
+    async def disconnect(self):
+        pass
+
+
+async def merge_concurrently(merges):
+    """Runs (server, peer server name) merges concurrently; returns the records each one read.
+
+    Merges of different pairs only share the event loop; each backend bounds its own
+    in-flight requests. Merges into the same server queue on its merge_lock, since they
+    share its version vector. A pair listed twice is merged once.
+    """
+    pairs = list(dict.fromkeys((server, server_name) for server, server_name in merges))
+    results = await asyncio.gather(*(server.merge(server_name) for server, server_name in pairs))
+    return {(server.server_name, server_name): records for (server, server_name), records in zip(pairs, results)}
+
+
+async def read_in_batches(records, batch_size):
+    """Yields lists of up to batch_size items of a blocking iterator, each read on a worker thread.
+
+    Log and snapshot readers do file I/O, which would otherwise stall the event loop for
+    every merge sharing it.
+    """
+    records = iter(records)
+    while True:
+        batch = await asyncio.to_thread(lambda: list(itertools.islice(records, batch_size)))
+        if not batch:
+            return
+        yield batch
+
+
+async def replay_log(replay, records, flush):
+    """log_replay.run() for a coroutine flush(rows, log_pos, advances), reading records off the event loop."""
+    async for chunk in read_in_batches(records, replay.batch_size):
+        for record in chunk:
+            if replay.add(record):
+                await flush(*replay.take())
+    if replay.last_flush_due():
+        await flush(*replay.take())
+    return replay.log_pos, replay.count
@@ -0,0 +1,161 @@
+import time
+import threading
+from collections import OrderedDict
+from .server_interface import server
+
+
+class cached_server (server):
+    """Read-through LRU cache of query(subject) results in front of any server.
+
+    Holds at most max_entries subjects, evicting the least recently used; with ttl_s set,
+    entries also expire that many seconds after they were read from the database. The
+    wrapped server reports every committed write through its change listener, so exactly
+    the subjects touched by update(), update_many(), load(), merge(), recover() and
+    apply_triples() are invalidated, whether or not the call went through the wrapper.
+
+    Safe to use from several threads. A miss reads the database outside the lock, so a
+    write may commit in between; its result is then not cached, since the invalidation
+    counter has moved on while it was read. Counters are returned by stats().
+    """
+
+    def __init__(self, server, max_entries=10000, ttl_s=None):
+        self.server = server
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.invalidation_count = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        server.add_change_listener(self._invalidate_rows)
+
+    def __getattr__(self, name):
+        # Everything the cache does not wrap (server_name, sequence_number, ...) is the server's
+        return getattr(self.server, name)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations, "invalidations": self.invalidations}
+
+    def _invalidate_rows(self, rows):
+        with self.lock:
+            self.invalidation_count += 1
+            for row in rows:
+                if self.entries.pop(row[0], None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.invalidation_count += 1
+            self.entries.clear()
+
+    def _lookup(self, subject):
+        # Returns the cached rows of subject or None; the caller holds the lock
+        entry = self.entries.get(subject)
+        if entry is None:
+            return None
+        rows, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.entries[subject]
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(subject)
+        return rows
+
+    def _store(self, subject, rows, invalidation_count):
+        # The caller holds the lock
+        if invalidation_count != self.invalidation_count:
+            return
+        expires = time.monotonic() + self.ttl_s if self.ttl_s is not None else None
+        self.entries[subject] = (rows, expires)
+        self.entries.move_to_end(subject)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def query(self, subject):
+        with self.lock:
+            rows = self._lookup(subject)
+            if rows is not None:
+                self.hits += 1
+                return list(rows)
+            self.misses += 1
+            invalidation_count = self.invalidation_count
+
+        rows = self.server.query(subject)
+        with self.lock:
+            self._store(subject, tuple(rows), invalidation_count)
+        return rows
+
+    def query_many(self, subjects):
+        result = []
+        missing = []
+        with self.lock:
+            for subject in dict.fromkeys(subjects):
+                rows = self._lookup(subject)
+                if rows is not None:
+                    self.hits += 1
+                    result.extend(rows)
+                else:
+                    self.misses += 1
+                    missing.append(subject)
+            invalidation_count = self.invalidation_count
+
+        if missing:
+            fetched = {subject: [] for subject in missing}
+            for row in self.server.query_many(missing):
+                fetched[row[0]].append(row)
+            with self.lock:
+                for subject, rows in fetched.items():
+                    self._store(subject, tuple(rows), invalidation_count)
+            for rows in fetched.values():
+                result.extend(rows)
+        return result
+
+    def add_change_listener(self, listener):
+        self.server.add_change_listener(listener)
+
+    def match(self, subject=None, predicate=None, object=None, limit=None):
+        # Pattern queries are not cached
+        return self.server.match(subject, predicate, object, limit)
+
+    def connect(self):
+        return self.server.connect()
+
+    def _write_to_log(self, subject, predicate, new_object, timestamp):
+        return self.server._write_to_log(subject, predicate, new_object, timestamp)
+
+    def update(self, subject, predicate, new_object):
+        return self.server.update(subject, predicate, new_object)
+
+    def update_many(self, triples):
+        return self.server.update_many(triples)
+
+    def load(self, file_path):
+        return self.server.load(file_path)
+
+    def merge(self, server_name):
+        return self.server.merge(server_name)
+
+    def log_positions(self):
+        return self.server.log_positions()
+
+    def apply_triples(self, rows):
+        return self.server.apply_triples(rows)
+
+    def recover(self):
+        return self.server.recover()
+
+    def snapshot(self):
+        return self.server.snapshot()
+
+    def compact_log(self):
+        return self.server.compact_log()
+
+    def disconnect(self):
+        self.clear()
+        return self.server.disconnect()
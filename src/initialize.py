@@ -2,6 +2,7 @@ import psycopg2
 from pymongo import MongoClient
 from neo4j import GraphDatabase
 import os
+import sys
 import shutil
 
 # Database connection details for PostgreSQL
@@ -10,6 +11,8 @@ postgres_port = 5432
 postgres_database = "nosql_proj"
 postgres_user = "shlok"
 postgres_password = "shlok"
+# 0 keeps one triples table; N > 0 hash-partitions it by subject into N partitions
+postgres_partitions = 0
 
 # Database connection details for MongoDB
 mongo_host = "localhost"
@@ -32,6 +35,32 @@ def connect_postgres():
     conn = psycopg2.connect(host=postgres_host, port=postgres_port, database=postgres_database, user=postgres_user, password=postgres_password)
     return conn
 
+def create_postgres_triples(cur, partitions=0):
+    """Creates the triples table, hash-partitioned by subject into partitions tables if partitions > 0.
+
+    The primary key contains the partition key, so it stays unique across partitions and
+    ON CONFLICT (subject, predicate) upserts keep working. Indexes created on the parent are
+    created on every partition, and lookups by subject are pruned to a single partition.
+    """
+    cur.execute("DROP TABLE IF EXISTS triples")
+    cur.execute(f"""
+        CREATE TABLE triples (
+            subject TEXT NOT NULL,
+            predicate TEXT NOT NULL,
+            object TEXT NOT NULL,
+            timestamp BIGINT NOT NULL,
+            PRIMARY KEY (subject, predicate)
+        ){" PARTITION BY HASH (subject)" if partitions > 0 else ""}
+    """)
+    for remainder in range(partitions):
+        cur.execute(f"CREATE TABLE triples_p{remainder} PARTITION OF triples FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})")
+
+    # The primary key already serves lookups by subject on a partitioned table
+    if partitions == 0:
+        cur.execute("CREATE INDEX ON triples (subject)")
+    cur.execute("CREATE INDEX ON triples (predicate)")
+    cur.execute("CREATE INDEX ON triples (object)")
+
 def connect_mongo():
     """Connects to the MongoDB database and returns a database object."""
     client = MongoClient(mongo_host, mongo_port)
@@ -53,12 +82,17 @@ def initialize_log_positions():
             session.run (cypher_query)
             #session.run("CALL apoc.schema.assert({}, {})")
 
-            session.run("CREATE INDEX FOR (s:Subject) ON (s.value)")
-            session.run("CREATE INDEX FOR (r:Predicate) ON (r.value)")
-            session.run("CREATE INDEX FOR (o:Object) ON (o.value)")
+            # Subjects and objects are unique nodes (the constraints are backed by indexes);
+            # Predicate is a relationship type, so its index is a relationship property index.
+            # Same schema as neo4j_server.SCHEMA_QUERIES.
+            session.run("CREATE CONSTRAINT subject_value FOR (s:Subject) REQUIRE s.value IS UNIQUE")
+            session.run("CREATE CONSTRAINT object_value FOR (o:Object) REQUIRE o.value IS UNIQUE")
+            session.run("CREATE INDEX predicate_value FOR ()-[r:Predicate]-() ON (r.value)")
 
             # Create LogPosition constraint
             session.run("CREATE CONSTRAINT FOR (lp:LogPosition) REQUIRE lp.server_name IS UNIQUE")
+            # One VersionVector node per origin holds the highest origin sequence number seen from it
+            session.run("CREATE CONSTRAINT FOR (v:VersionVector) REQUIRE v.origin IS UNIQUE")
 
             # Insert log positions
             session.run("CREATE (lp:LogPosition {server_name: 'neo4j', log_position: 0})")
@@ -72,22 +106,8 @@ def initialize_log_positions():
     if conn:
         try:
             cur = conn.cursor()
-            cur.execute("DROP TABLE IF EXISTS triples")
             # Create the triples table
-            cur.execute("""
-                CREATE TABLE triples (
-                    subject TEXT NOT NULL,
-                    predicate TEXT NOT NULL,
-                    object TEXT NOT NULL,
-                    timestamp BIGINT NOT NULL,
-                    PRIMARY KEY (subject, predicate)
-                )
-            """)
-
-            cur.execute("CREATE INDEX ON triples (subject)")
-            cur.execute("CREATE INDEX ON triples (predicate)")
-            cur.execute("CREATE INDEX ON triples (object)")
-
+            create_postgres_triples(cur, postgres_partitions)
             conn.commit()
             cur.close()
         except psycopg2.Error as error:
@@ -103,6 +123,8 @@ def initialize_log_positions():
     postgres_cur.execute("INSERT INTO log_positions (server_name, log_position) VALUES ('neo4j', 0)")
     postgres_cur.execute("INSERT INTO log_positions (server_name, log_position) VALUES ('mongo', 0)")
     postgres_cur.execute("INSERT INTO log_positions (server_name, log_position) VALUES ('postgres', 0)")  # Insert PostgreSQL position
+    postgres_cur.execute("DROP TABLE IF EXISTS version_vector")
+    postgres_cur.execute("CREATE TABLE version_vector (origin TEXT PRIMARY KEY, origin_seq BIGINT NOT NULL)")
     postgres_conn.commit()
     postgres_conn.close()
 
@@ -110,15 +132,26 @@ def initialize_log_positions():
     mongo_db = connect_mongo()
     mongo_db.triples.drop()
     collection = mongo_db['triples']
-    collection.create_index([("subject", 1)])  
+    # The unique (subject, predicate) index serves the upserts and lookups by subject alike
+    collection.create_index([("subject", 1), ("predicate", 1)], unique=True)
     collection.create_index([("predicate", 1)]) 
     collection.create_index([("object", 1)])  
 
+    # Collection of mongo_server's subject layout; subjects are the _id, the wildcard index
+    # covers lookups by predicate and by predicate and object
+    mongo_db.subjects.drop()
+    mongo_db.subjects.create_index([("predicates.$**", 1)])
+
     mongo_db.log_positions.drop()
     mongo_db.log_positions.insert_one({"server_name": "mongo", "log_position": 0})
     mongo_db.log_positions.insert_one({"server_name": "postgres", "log_position": 0}) 
     mongo_db.log_positions.insert_one({"server_name": "neo4j", "log_position": 0}) 
 
+    mongo_db.version_vector.drop()
+    mongo_db.version_vector.create_index([("origin", 1)], unique=True)
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        postgres_partitions = int(sys.argv[1])
     initialize_log_positions()
     print("Initialization completed successfully.")
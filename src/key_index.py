@@ -0,0 +1,161 @@
+import threading
+from array import array
+
+MASK64 = (1 << 64) - 1
+
+
+def key_hash(subject, predicate):
+    # 64-bit key hash, never 0 (0 marks an empty slot). Python's string hashing is seeded per
+    # process, which is fine for an index that only ever lives in one process.
+    h = hash((subject, predicate)) & MASK64
+    return h or 1
+
+
+class bloom_filter:
+    """Bloom filter over 64-bit key hashes in a fixed bytearray of bits // 8 bytes.
+
+    With k hashes and n keys the false positive rate is about (1 - e^(-k*n/bits))^k:
+    9.6 bits and 7 hashes a key give about 1%, so 1.2 MB covers a million keys.
+    """
+
+    def __init__(self, bits, hashes=7):
+        self.bits = max(8, bits)
+        self.hashes = hashes
+        self.data = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, h):
+        # Double hashing from the two halves of the key hash
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, h):
+        for position in self._positions(h):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, h):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(h))
+
+
+class key_index:
+    """In-memory (subject, predicate) -> latest timestamp index, used to filter merges.
+
+    Keys are stored as 64-bit hashes in an open-addressing table held in two arrays
+    (array('Q') for hashes, array('q') for timestamps), 16 bytes a slot. The table doubles
+    while at most half full, up to the capacity needed for max_keys, and never past it:
+    a million keys take at most 2**21 slots, i.e. 32 MiB. Once max_keys keys are indexed,
+    new keys are not added, the known ones keep being updated.
+
+    The index only ever holds timestamps the database already has, so a record whose
+    timestamp is not newer than the indexed one is stale and can be dropped. A key that is
+    missing is definitely absent from the database while every key fits in the table; past
+    that, an optional Bloom filter of bloom_bits bits over every key seen keeps answering
+    "definitely absent". Two keys with the same 64-bit hash would share a slot; with a
+    million keys the odds of any such pair are about 3 in 100 million.
+
+    build() fills the index from a dump, record_rows() keeps it current and is meant to be
+    registered as a server's change listener.
+    """
+
+    def __init__(self, max_keys=1000000, bloom_bits=None, bloom_hashes=7):
+        self.max_keys = max_keys
+        self.max_slots = 1024
+        while self.max_slots < 2 * max_keys:
+            self.max_slots *= 2
+        self.bloom = bloom_filter(bloom_bits, bloom_hashes) if bloom_bits else None
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # Not safe against concurrent use; build() runs before the index is shared
+        self.slots = min(1024, self.max_slots)
+        self.hashes = array("Q", bytes(8 * self.slots))
+        self.timestamps = array("q", bytes(8 * self.slots))
+        self.count = 0
+        self.complete = True
+        if self.bloom is not None:
+            self.bloom = bloom_filter(self.bloom.bits, self.bloom.hashes)
+
+    def __len__(self):
+        return self.count
+
+    def memory_bytes(self):
+        bloom_bytes = len(self.bloom.data) if self.bloom is not None else 0
+        return self.hashes.itemsize * len(self.hashes) + self.timestamps.itemsize * len(self.timestamps) + bloom_bytes
+
+    def _slot(self, h):
+        # Linear probing; returns the slot holding h or the empty slot where it would go
+        mask = self.slots - 1
+        slot = h & mask
+        hashes = self.hashes
+        while hashes[slot] != 0 and hashes[slot] != h:
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow(self):
+        old_hashes, old_timestamps = self.hashes, self.timestamps
+        self.slots *= 2
+        self.hashes = array("Q", bytes(8 * self.slots))
+        self.timestamps = array("q", bytes(8 * self.slots))
+        for h, timestamp in zip(old_hashes, old_timestamps):
+            if h:
+                slot = self._slot(h)
+                self.hashes[slot] = h
+                self.timestamps[slot] = timestamp
+
+    def add(self, subject, predicate, timestamp):
+        h = key_hash(subject, predicate)
+        with self.lock:
+            self._add(h, timestamp)
+
+    def _add(self, h, timestamp):
+        if self.bloom is not None:
+            self.bloom.add(h)
+
+        slot = self._slot(h)
+        if self.hashes[slot] == h:
+            if self.timestamps[slot] < timestamp:
+                self.timestamps[slot] = timestamp
+            return
+
+        if self.count >= self.max_keys:
+            self.complete = False
+            return
+        if 2 * (self.count + 1) > self.slots and self.slots < self.max_slots:
+            self._grow()
+            slot = self._slot(h)
+        self.hashes[slot] = h
+        self.timestamps[slot] = timestamp
+        self.count += 1
+
+    def build(self, rows):
+        self.clear()
+        with self.lock:
+            for subject, predicate, obj, timestamp in rows:
+                self._add(key_hash(subject, predicate), timestamp)
+        return self
+
+    def record_rows(self, rows):
+        with self.lock:
+            for row in rows:
+                self._add(key_hash(row[0], row[1]), row[3])
+
+    def timestamp(self, subject, predicate):
+        h = key_hash(subject, predicate)
+        with self.lock:
+            slot = self._slot(h)
+            return self.timestamps[slot] if self.hashes[slot] == h else None
+
+    def is_stale(self, subject, predicate, timestamp):
+        # Only a strictly newer record replaces a stored one
+        known = self.timestamp(subject, predicate)
+        return known is not None and timestamp <= known
+
+    def definitely_absent(self, subject, predicate):
+        h = key_hash(subject, predicate)
+        with self.lock:
+            if self.hashes[self._slot(h)] == h:
+                return False
+            if self.complete:
+                return True
+            return self.bloom is not None and h not in self.bloom
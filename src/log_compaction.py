@@ -0,0 +1,102 @@
+import os
+import threading
+from .log_reader import log_reader
+from .log_manifest import log_manifest
+from .log_format import detect_format, encode_record, shard_header
+
+
+def compact_log(log_file, extension=".log"):
+    """Rewrites the sealed shards of log_file keeping only the newest record per (subject, predicate).
+
+    Sealed shards are the ones listed in the log's manifest: the writer never appends to
+    them again. The surviving record for a key is the one with the highest timestamp, the
+    earliest of them on a tie, which is what a last-writer-wins replay of the whole range
+    would have kept; the last record of every shard survives as well. Surviving records keep
+    their sequence numbers and every shard keeps its sequence range, so a peer whose log
+    position points into a compacted shard still resumes at the right record. Rewritten shards are marked
+    compacted in the manifest; returns the number of records dropped.
+    """
+    reader = log_reader(log_file, extension)
+    manifest = log_manifest(log_file)
+    shards = [entry["shard"] for entry in manifest.shards]
+
+    # Pass 1: the surviving sequence number of every key in the sealed range
+    newest = {}
+    for shard in shards:
+        for record in reader.read_shard(shard):
+            key = (record.subject, record.predicate)
+            current = newest.get(key)
+            if current is None or current[0] < record.timestamp:
+                newest[key] = (record.timestamp, record.seq)
+    keep = {seq for _, seq in newest.values()}
+    newest = None
+    # Each shard's last record is kept too. Peers advance their log position to the last
+    # record they read, so dropping it would leave them short of our sequence number and
+    # report lag that never clears.
+    keep.update(entry["last_seq"] for entry in manifest.shards)
+
+    # Pass 2: rewrite the shards that hold dead records, streaming survivors to a temporary file
+    compacted = {}
+    dropped = 0
+    for shard in shards:
+        path = reader.shard_file(shard)
+        log_format = detect_format(path)
+        tmp_file = path + ".tmp"
+        total = 0
+        kept = 0
+        with open(tmp_file, "wb") as out:
+            out.write(shard_header(log_format))
+            for record in reader.read_shard(shard):
+                total += 1
+                if record.seq in keep:
+                    out.write(encode_record(log_format, *record))
+                    kept += 1
+            out.flush()
+            os.fsync(out.fileno())
+
+        if kept == total:
+            os.remove(tmp_file)
+            continue
+        os.replace(tmp_file, path)
+
+        compacted[shard] = {"records": kept, "bytes": os.path.getsize(path), "compacted": True}
+        dropped += total - kept
+
+    if dropped:
+        with manifest.update() as entries:
+            for entry in entries:
+                if entry["shard"] in compacted:
+                    entry.setdefault("original_records", entry["records"])
+                    entry.update(compacted[entry["shard"]])
+        # Offsets into rewritten shards are stale; readers rebuild those index entries on demand
+        reader.drop_index_shards(compacted.keys())
+
+    return dropped
+
+
+class log_compactor:
+    """Runs server.compact_log() every interval_s seconds on a daemon thread."""
+
+    def __init__(self, server, interval_s=300):
+        self.server = server
+        self.interval_s = interval_s
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval_s):
+            try:
+                self.server.compact_log()
+            except Exception as error:
+                print("Error compacting log:", error)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="log-compactor-" + self.server.server_name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
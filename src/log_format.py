@@ -0,0 +1,227 @@
+import os
+import sys
+import zlib
+from collections import namedtuple
+
+# origin / origin_seq name the node that made the update and its sequence number there. They
+# are only written for records relayed from another node's log; None means the record
+# originated at the log's owner under this seq (see record_origin()).
+log_record = namedtuple("log_record", ["seq", "subject", "predicate", "object", "timestamp", "origin", "origin_seq"], defaults=(None, None))
+
+TEXT_FORMAT = "text"
+BINARY_FORMAT = "binary"
+
+# Binary shards start with an 8 byte header: magic, format version, 3 reserved bytes. The
+# leading NUL can never start a text shard, whose lines begin with a sequence number.
+BINARY_MAGIC = b"\x00TRL"
+BINARY_VERSION = 1
+BINARY_HEADER = BINARY_MAGIC + bytes([BINARY_VERSION, 0, 0, 0])
+CRC_SIZE = 4
+
+# Text records are tab separated, one per line
+TEXT_SEPARATORS = ("\t", "\n", "\r")
+
+
+def encode_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise IndexError("Truncated varint")
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def shard_header(log_format):
+    return BINARY_HEADER if log_format == BINARY_FORMAT else b""
+
+
+def detect_format(shard_file):
+    """Returns the format of an existing shard, or None if it is empty."""
+    with open(shard_file, "rb") as f:
+        head = f.read(len(BINARY_HEADER))
+
+    if not head:
+        return None
+    if head.startswith(BINARY_MAGIC):
+        if len(head) == len(BINARY_HEADER) and head[4] != BINARY_VERSION:
+            raise ValueError(f"Unsupported log format version {head[4]} in '{shard_file}'")
+        return BINARY_FORMAT
+    return TEXT_FORMAT
+
+
+def fits_text(*values):
+    """Returns whether the text format can store these values, i.e. none holds a tab or line break."""
+    return not any(value is not None and any(separator in value for separator in TEXT_SEPARATORS) for value in values)
+
+
+def encode_record(log_format, seq, subject, predicate, obj, timestamp, origin=None, origin_seq=None):
+    if log_format == BINARY_FORMAT:
+        # <varint payload length> <payload> <crc32 of payload, little endian>
+        # payload: <varint seq> <varint timestamp> then subject, predicate, object as <varint length><utf-8>,
+        # then for relayed records <varint origin_seq> <varint length><utf-8 origin>. The payload
+        # length tells a reader whether the origin is there, so untagged records are unchanged.
+        payload = bytearray(encode_varint(seq))
+        payload += encode_varint(timestamp)
+        for value in (subject, predicate, obj):
+            data = value.encode("utf-8")
+            payload += encode_varint(len(data))
+            payload += data
+        if origin is not None:
+            data = origin.encode("utf-8")
+            payload += encode_varint(origin_seq)
+            payload += encode_varint(len(data))
+            payload += data
+        return encode_varint(len(payload)) + bytes(payload) + zlib.crc32(payload).to_bytes(CRC_SIZE, "little")
+
+    if not fits_text(subject, predicate, obj, origin):
+        raise ValueError(f"Record {seq} ({subject}, {predicate}) has a tab or line break, which the text log format cannot store; use the binary format")
+    if origin is not None:
+        return f"{seq}\t{subject}\t{predicate}\t{obj}\t{timestamp}\t{origin}\t{origin_seq}\n".encode("utf-8")
+    return f"{seq}\t{subject}\t{predicate}\t{obj}\t{timestamp}\n".encode("utf-8")
+
+
+def parse_text_line(line):
+    fields = line.rstrip("\n").split("\t")
+    if len(fields) == 7:
+        seq, subject, predicate, obj, timestamp, origin, origin_seq = fields
+        return log_record(int(seq), subject, predicate, obj, int(timestamp), origin, int(origin_seq))
+    seq, subject, predicate, obj, timestamp = fields
+    return log_record(int(seq), subject, predicate, obj, int(timestamp))
+
+
+def record_origin(record, log_owner):
+    """Returns (origin, origin_seq) of a record read from log_owner's log."""
+    if record.origin is None:
+        return log_owner, record.seq
+    return record.origin, record.origin_seq
+
+
+def newest_per_key(rows):
+    """Reduces rows of (subject, predicate, object, timestamp, ...) to the newest row per key.
+
+    Ties keep the earlier row, as a strict < comparison would. The returned dict is ordered
+    by the position of each kept row in rows, so changed rows re-logged from it stay in the
+    order they were read, and the records of every origin in origin_seq order. A node that
+    reads them then never skips a record because a later one of the same origin came first.
+    """
+    latest = {}
+    for position, row in enumerate(rows):
+        key = (row[0], row[1])
+        existing = latest.get(key)
+        if existing is None or existing[1][3] < row[3]:
+            latest[key] = (position, row)
+    return {key: row for key, (_, row) in sorted(latest.items(), key=lambda item: item[1][0])}
+
+
+def iter_binary_records(buf, offset, path=""):
+    """Yields (offset, next offset, record) from a memoryview over a binary shard.
+
+    Strings are decoded straight from slices of the view, without copying the record
+    first. A record running past the end of the buffer is one still being written and ends
+    the iteration; a complete record with a bad checksum raises ValueError.
+    """
+    end = len(buf)
+    while offset < end:
+        try:
+            length, payload_start = decode_varint(buf, offset)
+        except IndexError:
+            return
+        payload_end = payload_start + length
+        if payload_end + CRC_SIZE > end:
+            return
+
+        with buf[payload_start:payload_end] as payload:
+            crc = int.from_bytes(bytes(buf[payload_end:payload_end + CRC_SIZE]), "little")
+            if zlib.crc32(payload) != crc:
+                raise ValueError(f"Checksum mismatch in log shard '{path}' at offset {offset}")
+
+            seq, pos = decode_varint(payload, 0)
+            timestamp, pos = decode_varint(payload, pos)
+            values = []
+            for _ in range(3):
+                size, pos = decode_varint(payload, pos)
+                with payload[pos:pos + size] as value:
+                    values.append(str(value, "utf-8"))
+                pos += size
+
+            origin = origin_seq = None
+            if pos < length:
+                origin_seq, pos = decode_varint(payload, pos)
+                size, pos = decode_varint(payload, pos)
+                with payload[pos:pos + size] as value:
+                    origin = str(value, "utf-8")
+
+        next_offset = payload_end + CRC_SIZE
+        yield offset, next_offset, log_record(seq, values[0], values[1], values[2], timestamp, origin, origin_seq)
+        offset = next_offset
+
+
+def convert_log(log_file, to_format, extension=".log"):
+    """Rewrites every shard of log_file (e.g. logs/postgres) in to_format.
+
+    Shards are rewritten one at a time through a temporary file and os.replace(). The
+    sparse offset index is removed since its offsets no longer apply, and shard sizes in the
+    manifest are updated. Run it while the owning server is stopped.
+
+    Converting to text first checks every record, and raises ValueError without rewriting
+    anything if a value holds a tab or line break.
+    """
+    from .log_reader import log_reader
+    from .log_manifest import log_manifest
+
+    reader = log_reader(log_file, extension=extension)
+    manifest = log_manifest(log_file)
+    shards = []
+    shard = 0
+    while os.path.exists(reader.shard_file(shard)):
+        if detect_format(reader.shard_file(shard)) not in (None, to_format):
+            shards.append(shard)
+        shard += 1
+
+    if to_format == TEXT_FORMAT:
+        for shard in shards:
+            for record in reader.read_shard(shard):
+                encode_record(TEXT_FORMAT, *record)
+
+    for shard in shards:
+        shard_file = reader.shard_file(shard)
+        tmp_file = shard_file + ".tmp"
+        with open(tmp_file, "wb") as out:
+            out.write(shard_header(to_format))
+            for record in reader.read_shard(shard):
+                out.write(encode_record(to_format, *record))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_file, shard_file)
+
+    if os.path.exists(reader.index_file):
+        os.remove(reader.index_file)
+    if shards and manifest.exists():
+        with manifest.update() as entries:
+            for entry in entries:
+                entry["bytes"] = os.path.getsize(reader.shard_file(entry["shard"]))
+    return len(shards)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[2] not in (TEXT_FORMAT, BINARY_FORMAT):
+        sys.exit("Usage: python3 -m src.log_format <log file prefix, e.g. logs/postgres> <text|binary>")
+    try:
+        count = convert_log(sys.argv[1], sys.argv[2])
+    except ValueError as error:
+        sys.exit(f"Error converting '{sys.argv[1]}': {error}")
+    print(f"Converted {count} shard(s) of '{sys.argv[1]}' to {sys.argv[2]}.")
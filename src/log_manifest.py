@@ -0,0 +1,94 @@
+import os
+import json
+import bisect
+import fcntl
+from contextlib import contextmanager
+
+
+def manifest_file(log_file):
+    return log_file + ".manifest"
+
+
+class log_manifest:
+    """The sealed shards of one log, persisted as JSON in <log_file>.manifest.
+
+    Shards roll by size or record count, so a sequence number can no longer be mapped to
+    its shard arithmetically. Every sealed shard has an entry
+    {"shard", "first_seq", "last_seq", "records", "bytes", "compacted"}; the shard after the
+    last sealed one is the one being appended to. Ranges are contiguous: a shard covers
+    first_seq = previous last_seq + 1 up to last_seq, even after compaction removed records
+    from it, so the shard holding a sequence number is found by binary search on last_seq.
+
+    Writers (the log writer sealing a shard, compaction rewriting one) modify the manifest
+    inside update(), which holds an exclusive lock and reloads the file first.
+    """
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.path = manifest_file(log_file)
+        self.shards = []
+        self.last_seqs = []
+        self.mtime = None
+        self.refresh()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _load(self):
+        shards = []
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                shards = json.load(f).get("shards", [])
+        self.shards = shards
+        self.last_seqs = [entry["last_seq"] for entry in shards]
+
+    def refresh(self):
+        """Reloads the manifest if it changed on disk; returns the entries that changed."""
+        mtime = os.stat(self.path).st_mtime_ns if os.path.exists(self.path) else None
+        if mtime == self.mtime:
+            return []
+        previous = {entry["shard"]: entry for entry in self.shards}
+        self._load()
+        self.mtime = mtime
+        return [entry for entry in self.shards if previous.get(entry["shard"]) != entry]
+
+    def _save(self):
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"shards": self.shards}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.path)
+        self.last_seqs = [entry["last_seq"] for entry in self.shards]
+        self.mtime = os.stat(self.path).st_mtime_ns
+
+    @contextmanager
+    def update(self):
+        """Context for modifying self.shards; the manifest is reloaded first and saved after."""
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._load()
+                yield self.shards
+                self._save()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def entry(self, shard):
+        for entry in self.shards:
+            if entry["shard"] == shard:
+                return entry
+        return None
+
+    def last_sealed_seq(self):
+        return self.last_seqs[-1] if self.last_seqs else 0
+
+    def active_shard(self):
+        return self.shards[-1]["shard"] + 1 if self.shards else 0
+
+    def find_shard(self, seq):
+        """Returns the shard that holds (or will hold) sequence number seq."""
+        i = bisect.bisect_left(self.last_seqs, seq)
+        if i < len(self.shards):
+            return self.shards[i]["shard"]
+        return self.active_shard()
@@ -0,0 +1,198 @@
+import os
+import mmap
+import bisect
+from .log_manifest import log_manifest
+from .log_format import BINARY_FORMAT, BINARY_HEADER, detect_format, parse_text_line, iter_binary_records
+
+
+class log_reader:
+    """Streams the records of one server's sharded log.
+
+    Records are yielded lazily, so memory stays flat whatever the shard size: text shards
+    are read one line at a time, binary shards are memory-mapped and decoded in place. A
+    sparse index of sequence number -> (shard, byte offset) is kept next to the shards in
+    <log_file>.idx and extended while reading, so a reader resuming from a stored log
+    position seeks straight to the first unread record instead of re-reading the shard.
+
+    The shard holding a position is found by binary search in the log's manifest. Compacted
+    shards keep their sequence range but lose records, so reading is driven by sequence
+    numbers, never by record counts, and index entries for a shard are discarded whenever
+    the manifest says it was rewritten.
+    """
+
+    def __init__(self, log_file, extension=".log", index_interval=64):
+        self.log_file = log_file
+        self.extension = extension
+        self.index_interval = index_interval
+        self.index_file = log_file + ".idx"
+        self.index_seqs = []
+        self.index_positions = []
+        self.pending_index = []
+        self._load_index()
+        self.manifest = log_manifest(log_file)
+
+    def shard_file(self, shard):
+        return self.log_file + "_" + str(shard) + self.extension
+
+    def _load_index(self):
+        entries = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r") as f:
+                for line in f:
+                    try:
+                        seq, shard, offset = line.split("\t")
+                        entries[int(seq)] = (int(shard), int(offset))
+                    except ValueError:
+                        # A torn last line from an interrupted append; the entry is rebuilt on the next read
+                        continue
+
+        self.index_seqs = sorted(entries)
+        self.index_positions = [entries[seq] for seq in self.index_seqs]
+
+    def _add_index_entry(self, seq, shard, offset):
+        i = bisect.bisect_left(self.index_seqs, seq)
+        if i < len(self.index_seqs) and self.index_seqs[i] == seq:
+            return
+        self.index_seqs.insert(i, seq)
+        self.index_positions.insert(i, (shard, offset))
+        self.pending_index.append(f"{seq}\t{shard}\t{offset}\n")
+
+    def _save_index(self):
+        if not self.pending_index:
+            return
+        with open(self.index_file, "a") as f:
+            f.writelines(self.pending_index)
+        self.pending_index = []
+
+    def _drop_index(self):
+        self.index_seqs = []
+        self.index_positions = []
+        self.pending_index = []
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+
+    def drop_index_shards(self, shards):
+        """Removes the index entries of the given shards, in memory and on disk."""
+        shards = set(shards)
+        keep = [i for i, position in enumerate(self.index_positions) if position[0] not in shards]
+        self.index_seqs = [self.index_seqs[i] for i in keep]
+        self.index_positions = [self.index_positions[i] for i in keep]
+        self.pending_index = []
+
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            f.writelines(f"{seq}\t{shard}\t{offset}\n" for seq, (shard, offset) in zip(self.index_seqs, self.index_positions))
+        os.replace(tmp_file, self.index_file)
+
+    def _refresh_manifest(self):
+        changed = [entry["shard"] for entry in self.manifest.refresh() if entry.get("compacted")]
+        if changed:
+            keep = [i for i, position in enumerate(self.index_positions) if position[0] not in changed]
+            self.index_seqs = [self.index_seqs[i] for i in keep]
+            self.index_positions = [self.index_positions[i] for i in keep]
+
+    def is_compacted(self, shard):
+        self._refresh_manifest()
+        entry = self.manifest.entry(shard)
+        return bool(entry and entry.get("compacted"))
+
+    def _seek_position(self, after_seq):
+        # Start from the closest indexed record at or before the first unread one, as long as
+        # it lies in the shard the manifest resolves that record to; otherwise from the shard
+        # start. A log without a manifest predates it and is walked from its first shard.
+        i = bisect.bisect_right(self.index_seqs, after_seq + 1) - 1
+        if not self.manifest.exists():
+            if i >= 0:
+                return self.index_seqs[i], self.index_positions[i][0], self.index_positions[i][1]
+            return None, 0, 0
+
+        shard = self.manifest.find_shard(after_seq + 1)
+        if i >= 0 and self.index_positions[i][0] == shard:
+            return self.index_seqs[i], shard, self.index_positions[i][1]
+        return None, shard, 0
+
+    def _iter_text_shard(self, path, offset):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                # A line without its newline is still being written; stop before it
+                if not line.endswith(b"\n"):
+                    return
+                next_offset = offset + len(line)
+                yield offset, next_offset, parse_text_line(line.decode("utf-8"))
+                offset = next_offset
+
+    def _iter_binary_shard(self, path, offset):
+        offset = max(offset, len(BINARY_HEADER))
+        while os.path.getsize(path) > offset:
+            size = os.path.getsize(path)
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                buf = memoryview(mapped)
+                try:
+                    for start, next_offset, record in iter_binary_records(buf, offset, path):
+                        yield start, next_offset, record
+                        offset = next_offset
+                finally:
+                    buf.release()
+
+            # Remap only if the shard grew while it was being read
+            if os.path.getsize(path) == size:
+                return
+
+    def iter_shard(self, shard, offset=0):
+        """Yields (offset, next offset, record) for the records of one shard from offset on."""
+        path = self.shard_file(shard)
+        log_format = detect_format(path)
+        if log_format is None:
+            return iter(())
+        if log_format == BINARY_FORMAT:
+            return self._iter_binary_shard(path, offset)
+        return self._iter_text_shard(path, offset)
+
+    def _valid_index_entry(self, seq, shard, offset):
+        try:
+            for _, _, record in self.iter_shard(shard, offset):
+                return record.seq == seq
+        except (ValueError, UnicodeDecodeError):
+            pass
+        return False
+
+    def read_shard(self, shard):
+        """Yields every record of a single shard."""
+        for _, _, record in self.iter_shard(shard):
+            yield record
+
+    def read(self, after_seq=0):
+        """Yields every record with a sequence number greater than after_seq, in order."""
+        self._refresh_manifest()
+        indexed_seq, shard, offset = self._seek_position(after_seq)
+        if indexed_seq is not None and not self._valid_index_entry(indexed_seq, shard, offset):
+            # The shard was rewritten under the index; rebuild it from scratch
+            self._drop_index()
+            offset = 0
+
+        # Sealed shards are known to exist; only the shard being appended to is looked up
+        last_shard = self.manifest.active_shard() if self.manifest.exists() else None
+        try:
+            while True:
+                if last_shard is not None and shard > last_shard:
+                    break
+                if (last_shard is None or shard == last_shard) and not os.path.exists(self.shard_file(shard)):
+                    break
+
+                for position, _, record in self.iter_shard(shard, offset):
+                    if (record.seq - 1) % self.index_interval == 0:
+                        self._add_index_entry(record.seq, shard, position)
+
+                    if record.seq > after_seq:
+                        yield record
+
+                if shard == last_shard:
+                    # The writer may have sealed this shard and rolled over while it was read
+                    self._refresh_manifest()
+                    last_shard = self.manifest.active_shard()
+                shard += 1
+                offset = 0
+        finally:
+            self._save_index()
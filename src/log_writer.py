@@ -0,0 +1,240 @@
+import os
+import time
+import threading
+from .log_reader import log_reader
+from .log_manifest import log_manifest
+from .log_format import TEXT_FORMAT, BINARY_FORMAT, detect_format, encode_record, fits_text, shard_header
+from .metrics import registry
+
+FSYNC_ALWAYS = "always"
+FSYNC_EVERY_N = "every_n"
+FSYNC_INTERVAL = "interval"
+
+
+class log_writer:
+    """Long-lived, append-only writer for one server's sharded log.
+
+    A shard is sealed and a new one started once it holds segment_bytes bytes or, if set,
+    segment_records records; each sealed shard is recorded in the log's manifest with its
+    sequence range and size. The current shard stays open and every append() /
+    append_many() call is written out in one go, so readers see it immediately. fsync is
+    group-committed according to
+    fsync_policy: after every call ("always"), once fsync_every records are pending
+    ("every_n"), or by the background thread every fsync_interval_ms ("interval").
+
+    The same thread checkpoints the last durable sequence number through checkpoint(seq)
+    every checkpoint_interval_ms, so update() no longer waits on a log position round trip.
+    The stored checkpoint may lag behind the log; open() finds the true tail by scanning
+    the last shard.
+
+    Rows may carry a trailing (origin, origin_seq) when they relay another node's update;
+    the log's own updates are written untagged.
+
+    A text shard cannot hold a value with a tab or line break. Such a row is written to a
+    binary shard started for it instead, so a row committed to the database is always
+    logged; the shard after that one is back in log_format.
+    """
+
+    def __init__(self, log_file, segment_bytes=64 * 1024 * 1024, segment_records=None, extension=".log", log_format=TEXT_FORMAT,
+                 fsync_policy=FSYNC_INTERVAL, fsync_every=100, fsync_interval_ms=50,
+                 checkpoint=None, checkpoint_interval_ms=100):
+        if fsync_policy not in (FSYNC_ALWAYS, FSYNC_EVERY_N, FSYNC_INTERVAL):
+            raise ValueError(f"Unknown fsync policy '{fsync_policy}'")
+
+        self.log_file = log_file
+        self.segment_bytes = segment_bytes
+        self.segment_records = segment_records
+        self.extension = extension
+        self.log_format = log_format
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval_ms = fsync_interval_ms
+        self.checkpoint = checkpoint
+        self.checkpoint_interval_ms = checkpoint_interval_ms
+
+        self.reader = log_reader(log_file, extension)
+        self.manifest = log_manifest(log_file)
+        self.lock = threading.RLock()
+        self.sequence_number = None
+        self.synced_sequence_number = None
+        self.checkpointed_sequence_number = None
+        self.shard = None
+        self.current_log_file = None
+        self.current_log_format = None
+        self.file = None
+        self.shard_first_seq = None
+        self.shard_records = 0
+        self.shard_bytes = 0
+        self.unsynced_records = 0
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _shard_entry(self, shard, first_seq, last_seq, records):
+        return {"shard": shard, "first_seq": first_seq, "last_seq": last_seq, "records": records,
+                "bytes": os.path.getsize(self.reader.shard_file(shard)), "compacted": False}
+
+    def _build_manifest(self):
+        # Logs written before the manifest existed: every shard but the last is sealed
+        shards = []
+        last_seq = 0
+        shard = 0
+        while os.path.exists(self.reader.shard_file(shard + 1)):
+            records = 0
+            for record in self.reader.read_shard(shard):
+                records += 1
+                last_seq = max(last_seq, record.seq)
+            first_seq = shards[-1]["last_seq"] + 1 if shards else 1
+            shards.append(self._shard_entry(shard, first_seq, last_seq, records))
+            shard += 1
+
+        with self.manifest.update() as entries:
+            entries[:] = shards
+
+    def _recover_tail(self, stored_sequence_number):
+        # Scans the shard being appended to for its last complete record. Bytes after it were
+        # torn by a crash mid-append and are truncated so new records are not written behind them.
+        shard = self.manifest.active_shard()
+        path = self.reader.shard_file(shard)
+        last_seq = self.manifest.last_sealed_seq()
+        records = 0
+        if os.path.exists(path):
+            end = None
+            for _, next_offset, record in self.reader.iter_shard(shard):
+                last_seq = record.seq
+                end = next_offset
+                records += 1
+
+            if end is not None and os.path.getsize(path) > end:
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+
+        self.shard_records = records
+        return max(stored_sequence_number, last_seq)
+
+    def _open_shard(self, log_format=None):
+        self.shard = self.manifest.active_shard()
+        self.current_log_file = self.reader.shard_file(self.shard)
+        self.shard_first_seq = self.manifest.last_sealed_seq() + 1
+
+        # A shard keeps the format it was started in; new or empty shards use log_format,
+        # self.log_format unless given
+        self.current_log_format = None
+        if os.path.exists(self.current_log_file):
+            self.current_log_format = detect_format(self.current_log_file)
+        if self.current_log_format is None:
+            self.current_log_format = log_format or self.log_format
+            with open(self.current_log_file, "wb") as file:
+                file.write(shard_header(self.current_log_format))
+
+        self.file = open(self.current_log_file, "ab")
+        self.shard_bytes = self.file.tell()
+
+    def _seal_shard(self, next_format=None):
+        # A sealed shard is made durable and recorded in the manifest before the next one starts
+        self._sync()
+        self.file.close()
+        entry = self._shard_entry(self.shard, self.shard_first_seq, self.sequence_number, self.shard_records)
+        with self.manifest.update() as entries:
+            entries.append(entry)
+        self.shard_records = 0
+        self._open_shard(next_format)
+
+    def _switch_to_binary(self):
+        # An empty text shard has no header yet and is simply restarted as a binary one
+        if self.shard_records:
+            self._seal_shard(BINARY_FORMAT)
+        else:
+            self.file.close()
+            self._open_shard(BINARY_FORMAT)
+
+    def open(self, stored_sequence_number):
+        """Opens the log for appending after recovering its tail; returns the sequence number."""
+        with self.lock:
+            if not self.manifest.exists():
+                self._build_manifest()
+            self.sequence_number = self._recover_tail(stored_sequence_number)
+            self.synced_sequence_number = self.sequence_number
+            self.checkpointed_sequence_number = stored_sequence_number
+            self._open_shard()
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="log-writer-" + os.path.basename(self.log_file), daemon=True)
+        self.thread.start()
+        return self.sequence_number
+
+    def _sync(self):
+        if self.file is None:
+            return
+        self.file.flush()
+        if self.unsynced_records:
+            os.fsync(self.file.fileno())
+            self.unsynced_records = 0
+        self.synced_sequence_number = self.sequence_number
+
+    def append(self, subject, predicate, obj, timestamp):
+        return self.append_many([(subject, predicate, obj, timestamp)])
+
+    def append_many(self, rows):
+        """Appends rows of (subject, predicate, object, timestamp[, origin, origin_seq]); returns the last sequence number."""
+        with self.lock:
+            appended = 0
+            for row in rows:
+                if self.current_log_format == TEXT_FORMAT and not fits_text(*row[:3], *row[4:5]):
+                    self._switch_to_binary()
+                data = encode_record(self.current_log_format, self.sequence_number + 1, *row)
+                self.sequence_number += 1
+                self.file.write(data)
+                self.unsynced_records += 1
+                self.shard_records += 1
+                self.shard_bytes += len(data)
+                appended += len(data)
+
+                if self.shard_bytes >= self.segment_bytes or (self.segment_records and self.shard_records >= self.segment_records):
+                    self._seal_shard()
+
+            self.file.flush()
+            registry.increment("log_append_bytes_total", appended, log=os.path.basename(self.log_file))
+            if self.fsync_policy == FSYNC_ALWAYS or (self.fsync_policy == FSYNC_EVERY_N and self.unsynced_records >= self.fsync_every):
+                self._sync()
+
+            return self.sequence_number
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _checkpoint(self):
+        sequence_number = self.synced_sequence_number
+        if self.checkpoint is None or sequence_number == self.checkpointed_sequence_number:
+            return
+        try:
+            self.checkpoint(sequence_number)
+            self.checkpointed_sequence_number = sequence_number
+        except Exception as error:
+            print("Error checkpointing log position:", error)
+
+    def _run(self):
+        interval = min(self.fsync_interval_ms, self.checkpoint_interval_ms) if self.fsync_policy == FSYNC_INTERVAL else self.checkpoint_interval_ms
+        last_checkpoint = time.monotonic()
+        while not self.stop_event.wait(interval / 1000):
+            if self.fsync_policy == FSYNC_INTERVAL:
+                self.sync()
+            if (time.monotonic() - last_checkpoint) * 1000 >= self.checkpoint_interval_ms:
+                self._checkpoint()
+                last_checkpoint = time.monotonic()
+
+    def close(self):
+        """Makes every appended record durable, stores the final checkpoint and closes the shard."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        with self.lock:
+            if self.file is None:
+                return
+            self._sync()
+            self.file.close()
+            self.file = None
+        self._checkpoint()
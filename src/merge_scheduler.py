@@ -0,0 +1,62 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+merge_report = namedtuple("merge_report", ["rounds", "records", "seconds"])
+
+
+class merge_scheduler:
+    """Merges any number of servers with each other until none has unread peer log records.
+
+    A round asks every server for its log_positions() and compares them with each peer's
+    sequence number. Each server with unread peer records then gets one job that merges
+    those peers one after another. Jobs for different servers run in parallel on a pool
+    of workers. A server is never merged into by two threads at once; its merges would
+    only queue up behind its merge_lock.
+
+    Merging re-logs the records that won, so one round can leave new suffixes for the
+    next. Rounds repeat until nothing is pending, or a round reads no records, or
+    max_rounds is reached.
+    """
+
+    def __init__(self, servers, workers=None, max_rounds=100):
+        self.servers = {server.server_name: server for server in servers}
+        self.workers = workers or len(self.servers)
+        self.max_rounds = max_rounds
+
+    def pending_merges(self):
+        """Returns {server name: [names of the peers whose logs it has not fully read]}."""
+        pending = {}
+        for name, server in self.servers.items():
+            positions = server.log_positions()
+            peers = [peer_name for peer_name, peer in self.servers.items()
+                     if peer_name != name and positions.get(peer_name, 0) < (peer.sequence_number or 0)]
+            if peers:
+                pending[name] = peers
+        return pending
+
+    def _merge_server(self, name, peers):
+        server = self.servers[name]
+        return sum(server.merge(peer_name) or 0 for peer_name in peers)
+
+    def run(self):
+        """Merges until quiescent; returns a merge_report of rounds, records read and wall time."""
+        start = time.monotonic()
+        rounds = 0
+        records = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while rounds < self.max_rounds:
+                pending = self.pending_merges()
+                if not pending:
+                    break
+
+                rounds += 1
+                futures = [pool.submit(self._merge_server, name, peers) for name, peers in pending.items()]
+                shipped = sum(future.result() for future in futures)
+                records += shipped
+
+                # Pending merges that read nothing are failing; retrying them would spin
+                if shipped == 0:
+                    break
+
+        return merge_report(rounds, records, time.monotonic() - start)
@@ -0,0 +1,117 @@
+import hashlib
+import time
+from collections import namedtuple
+
+DIGEST_SIZE = 16
+DIGEST_MOD = 1 << (8 * DIGEST_SIZE)
+
+sync_report = namedtuple("sync_report", ["divergent_buckets", "digests_compared", "sent", "received", "changed", "seconds"])
+
+
+def key_bucket(subject, predicate, buckets):
+    """Returns the bucket of a (subject, predicate) key; the same on every node."""
+    digest = hashlib.blake2b(f"{subject}\x00{predicate}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % buckets
+
+
+def row_digest(subject, predicate, obj, timestamp):
+    digest = hashlib.blake2b(f"{subject}\x00{predicate}\x00{obj}\x00{int(timestamp)}".encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+    return int.from_bytes(digest, "little")
+
+
+class merkle_tree:
+    """Merkle tree over a server's (subject, predicate, object, timestamp) rows.
+
+    Rows are bucketed by a hash of their key into fanout ** depth leaves. A leaf's digest
+    is the sum of its rows' digests modulo 2**128. The sum does not depend on row order,
+    so the tree is built in one pass over an unordered dump. Each inner node hashes its
+    children's digests. Two servers holding the same rows have the same root. Otherwise
+    walking down from the root only where digests differ finds the divergent buckets
+    after comparing about fanout digests per level for each of them.
+    """
+
+    def __init__(self, fanout=16, depth=3):
+        self.fanout = fanout
+        self.depth = depth
+        self.buckets = fanout ** depth
+        self.levels = None
+        self.rows = 0
+
+    def build(self, rows):
+        leaves = [0] * self.buckets
+        count = 0
+        for subject, predicate, obj, timestamp in rows:
+            bucket = key_bucket(subject, predicate, self.buckets)
+            leaves[bucket] = (leaves[bucket] + row_digest(subject, predicate, obj, timestamp)) % DIGEST_MOD
+            count += 1
+
+        level = [leaf.to_bytes(DIGEST_SIZE, "little") for leaf in leaves]
+        levels = [level]
+        while len(level) > 1:
+            level = [hashlib.blake2b(b"".join(level[i:i + self.fanout]), digest_size=DIGEST_SIZE).digest()
+                     for i in range(0, len(level), self.fanout)]
+            levels.append(level)
+
+        # levels[0] is the root, levels[depth] the leaves
+        self.levels = levels[::-1]
+        self.rows = count
+        return self
+
+    @property
+    def root(self):
+        return self.levels[0][0]
+
+    def level(self, depth, nodes):
+        """Returns the digests of the given nodes at depth, as a peer would be sent them."""
+        return [self.levels[depth][node] for node in nodes]
+
+
+def divergent_buckets(tree_a, tree_b):
+    """Returns (buckets whose digests differ, number of digests compared) by walking both trees top-down."""
+    if tree_a.fanout != tree_b.fanout or tree_a.depth != tree_b.depth:
+        raise ValueError("Merkle trees were built with different shapes")
+
+    compared = 1
+    if tree_a.root == tree_b.root:
+        return [], compared
+
+    nodes = [0]
+    for depth in range(1, tree_a.depth + 1):
+        children = [node * tree_a.fanout + i for node in nodes for i in range(tree_a.fanout)]
+        compared += len(children)
+        digests_a = tree_a.level(depth, children)
+        digests_b = tree_b.level(depth, children)
+        nodes = [child for child, digest_a, digest_b in zip(children, digests_a, digests_b) if digest_a != digest_b]
+    return nodes, compared
+
+
+def _bucket_rows(server, buckets, total_buckets):
+    return [row for row in server._dump_triples() if key_bucket(row[0], row[1], total_buckets) in buckets]
+
+
+def merkle_tree_of(server, fanout=16, depth=3):
+    """Builds the Merkle tree of a server's current triples from a streamed dump."""
+    return merkle_tree(fanout, depth).build(server._dump_triples())
+
+
+def merkle_sync(server_a, server_b, fanout=16, depth=3):
+    """Repairs two servers against each other by exchanging Merkle tree levels.
+
+    Only the triples in divergent buckets are transferred, in both directions, and applied
+    last-writer-wins with apply_triples(). Rows that win are logged, so other nodes pick
+    them up on their next merge. Unlike a merge, this does not depend on either log, so it
+    also repairs nodes whose logs were lost, compacted away or are far behind. Returns a
+    sync_report.
+    """
+    start = time.monotonic()
+    tree_a = merkle_tree_of(server_a, fanout, depth)
+    tree_b = merkle_tree_of(server_b, fanout, depth)
+    buckets, compared = divergent_buckets(tree_a, tree_b)
+    if not buckets:
+        return sync_report(0, compared, 0, 0, 0, time.monotonic() - start)
+
+    buckets = set(buckets)
+    rows_a = _bucket_rows(server_a, buckets, tree_a.buckets)
+    rows_b = _bucket_rows(server_b, buckets, tree_b.buckets)
+    changed = server_b.apply_triples(rows_a) + server_a.apply_triples(rows_b)
+    return sync_report(len(buckets), compared, len(rows_a), len(rows_b), changed, time.monotonic() - start)
@@ -0,0 +1,196 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+PREFIX = "triplestore_"
+
+# Upper bounds of the latency buckets in seconds, from 50 µs to 60 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class histogram:
+    """Fixed-bucket histogram of latencies in seconds; the last bucket counts everything above the bounds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Interpolates linearly inside the bucket holding the q-th observation. Above the last
+        # bound nothing is known, so, as le="+Inf" in the Prometheus output, that is infinity.
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if i == len(self.buckets):
+                    return float("inf")
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * max(0.0, rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class metrics_registry:
+    """Process-wide counters and latency histograms, each keyed by a name and its labels.
+
+    Names in use:
+    - operation_seconds{server, operation}: latency of the server's public operations
+    - backend_round_trip_seconds{server, call}: latency of single database round trips
+    - merge_records_total{server, source, outcome}: log records replayed from source, by
+      outcome read / skipped / applied / relogged
+    - log_append_bytes_total{log}: bytes appended to a log
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = histogram()
+            self.histograms[key].observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        if amount:
+            key = self._key(name, labels)
+            with self.lock:
+                self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name, **labels):
+        with self.lock:
+            return self.counters.get(self._key(name, labels), 0)
+
+    def histogram(self, name, **labels):
+        with self.lock:
+            return self.histograms.get(self._key(name, labels))
+
+    def items(self):
+        """Returns copies of the (name, labels, histogram) and (name, labels, value) entries, sorted."""
+        with self.lock:
+            histograms = []
+            for (name, labels), entry in sorted(self.histograms.items()):
+                copy = histogram(entry.buckets)
+                copy.counts, copy.count, copy.sum = list(entry.counts), entry.count, entry.sum
+                histograms.append((name, dict(labels), copy))
+            counters = [(name, dict(labels), value) for (name, labels), value in sorted(self.counters.items())]
+        return histograms, counters
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+registry = metrics_registry()
+
+
+def timed_operation(method):
+    # Records every call of a server method as operation_seconds{server, operation}
+    @wraps(method)
+    def timed(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            registry.observe("operation_seconds", time.perf_counter() - start, server=self.server_name, operation=method.__name__)
+    return timed
+
+
+def replication_lag(servers):
+    """Returns {(server, peer): records}: how many of the peer's log records the server has not merged yet.
+
+    The peer's sequence_number is its last appended record and the server's log_positions()
+    holds how far it has read the peer's log.
+    """
+    lag = {}
+    for server in servers:
+        positions = server.log_positions()
+        for peer in servers:
+            if peer is server or peer.sequence_number is None:
+                continue
+            lag[(server.server_name, peer.server_name)] = max(0, peer.sequence_number - positions.get(peer.server_name, 0))
+    return lag
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def prometheus_text(servers=()):
+    """Dumps the registry, and the replication lag between servers, in the Prometheus text format."""
+    histograms, counters = registry.items()
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for name, labels, entry in histograms:
+        name = PREFIX + name
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(entry.buckets + ("+Inf",), entry.counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_labels_text(dict(labels, le=bound))} {cumulative}")
+        lines.append(f"{name}_sum{_labels_text(labels)} {entry.sum}")
+        lines.append(f"{name}_count{_labels_text(labels)} {entry.count}")
+
+    for name, labels, value in counters:
+        name = PREFIX + name
+        declare(name, "counter")
+        lines.append(f"{name}{_labels_text(labels)} {value}")
+
+    lag = replication_lag(servers) if servers else {}
+    if lag:
+        declare(PREFIX + "replication_lag_records", "gauge")
+        for (server, peer), records in sorted(lag.items()):
+            lines.append(f"{PREFIX}replication_lag_records{_labels_text({'server': server, 'peer': peer})} {records}")
+    return "\n".join(lines) + "\n"
+
+
+def stats_report(servers=()):
+    """Human-readable summary: latency percentiles, counters and replication lag."""
+    histograms, counters = registry.items()
+    lines = []
+    for name, labels, entry in histograms:
+        p50, p99 = entry.quantile(0.5), entry.quantile(0.99)
+        lines.append(f"{name} {' '.join(f'{k}={v}' for k, v in labels.items())}: {entry.count} calls, "
+                     f"mean {entry.sum / entry.count * 1000:.2f} ms, p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms")
+    for name, labels, value in counters:
+        lines.append(f"{name} {' '.join(f'{k}={v}' for k, v in labels.items())}: {value}")
+    for (server, peer), records in sorted((replication_lag(servers) if servers else {}).items()):
+        lines.append(f"replication lag {server} <- {peer}: {records} records")
+    return "\n".join(lines) if lines else "No operations recorded yet."
@@ -1,28 +1,108 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, InsertOne, UpdateOne, monitoring
 from time import time
 import os
+import re
 import sys
-from .server_interface import server
+import threading
+from .server_interface import server, log_replay
+from .metrics import registry, timed_operation
+from .log_reader import log_reader
+from .log_writer import log_writer, FSYNC_INTERVAL
+from .log_compaction import compact_log
+from .snapshot import write_snapshot, list_snapshots, read_snapshot, prune_snapshots
+from .log_format import TEXT_FORMAT, newest_per_key
+from .triple_file import read_triple_batches, stamp_triples
+
+# One document per triple in the 'triples' collection, or one document per subject in the
+# 'subjects' collection: {_id: subject, predicates: {predicate: {object, timestamp}}}
+TRIPLE_LAYOUT = "triple"
+SUBJECT_LAYOUT = "subject"
+
+# Predicates are field names in the subject layout, where '.' and '$' have a meaning of their own
+_FIELD_ESCAPES = str.maketrans({"%": "%25", ".": "%2E", "$": "%24"})
+_FIELD_UNESCAPES = {"%25": "%", "%2E": ".", "%24": "$"}
+
+
+def _predicate_field(predicate):
+    return "predicates." + predicate.translate(_FIELD_ESCAPES)
+
+
+def _field_predicate(field):
+    return re.sub("%(25|2E|24)", lambda match: _FIELD_UNESCAPES[match.group(0)], field)
+
+
+def _subject_rows(doc):
+    subject = doc["_id"]
+    return [(subject, _field_predicate(field), value["object"], value["timestamp"]) for field, value in doc.get("predicates", {}).items()]
+
+
+class round_trip_listener(monitoring.CommandListener):
+    # Records every command sent to MongoDB as backend_round_trip_seconds, by command name
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        registry.observe("backend_round_trip_seconds", event.duration_micros / 1e6, server="mongo", call=event.command_name)
+
+    def failed(self, event):
+        registry.observe("backend_round_trip_seconds", event.duration_micros / 1e6, server="mongo", call=event.command_name)
 
 
 class mongo_server(server):
-    def __init__(self, host, port, database):
+    """Triple store on MongoDB.
+
+    MongoClient is thread-safe and pools its own connections: up to max_pool_size, keeping
+    min_pool_size open, with callers waiting at most wait_queue_timeout_ms for one. Queries
+    and updates from several threads therefore run side by side, also while a merge is in
+    progress. merge(), recover() and apply_triples() are serialized by merge_lock, since they
+    share the version vector.
+
+    With layout=TRIPLE_LAYOUT every triple is a document of 'triples', whose unique
+    (subject, predicate) index serves the upserts and rules out duplicate keys. With
+    layout=SUBJECT_LAYOUT every subject is one document of 'subjects' holding its predicates
+    as a map with a timestamp per predicate, so query() is a single point read by _id and a
+    merge decides last-writer-wins per predicate field within that document.
+    """
+
+    def __init__(self, host, port, database, merge_batch_size=1000, log_format=TEXT_FORMAT,
+                 fsync_policy=FSYNC_INTERVAL, fsync_every=100, fsync_interval_ms=50, snapshots_kept=2,
+                 segment_bytes=64 * 1024 * 1024, segment_records=None, load_batch_size=10000, key_index=None,
+                 max_pool_size=100, min_pool_size=0, wait_queue_timeout_ms=None, layout=TRIPLE_LAYOUT):
         self.server_name = "mongo"
         self.host = host
         self.port = port
         self.database = database
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms
+        self.merge_lock = threading.Lock()
         self.client = None
-        self.sequence_number = None
         self.log_file = "mongo"
-        self.log_file_shard = None
-        self.current_log_file = None
-        self.shard_value = 100
+        self.log_writer = None
+        self.segment_bytes = segment_bytes
+        self.segment_records = segment_records
         self.log_file_exenstion = ".log"
+        self.log_format = log_format
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval_ms = fsync_interval_ms
+        self.log_readers = {}
+        self.merge_batch_size = merge_batch_size
+        self.snapshots_kept = snapshots_kept
+        self.load_batch_size = load_batch_size
+        self.version_vector = {}
+        self.key_index = key_index
+        self.layout = layout
+
+    @property
+    def sequence_number(self):
+        return self.log_writer.sequence_number if self.log_writer else None
 
     
     def connect(self):
         try:
-            self.client = MongoClient(self.host, self.port)
+            self.client = MongoClient(self.host, self.port, maxPoolSize=self.max_pool_size, minPoolSize=self.min_pool_size,
+                                      waitQueueTimeoutMS=self.wait_queue_timeout_ms, event_listeners=[round_trip_listener()])
             self.db = self.client[self.database]
             print("Connected to MongoDB database!")
 
@@ -35,12 +115,18 @@ class mongo_server(server):
                 log_positions_collection = mongo_db["log_positions"]
                 mongo_row = log_positions_collection.find_one({"server_name": "mongo"})
                 if mongo_row:
-                    self.sequence_number = mongo_row["log_position"]
+                    stored_sequence_number = mongo_row["log_position"]
                 else:
                     self.disconnect()
                     sys.exit("Error: 'log_positions' table not initialized for MongoDB. Exiting...")
 
-                self._update_log_shard() 
+                self.version_vector = {row["origin"]: row["origin_seq"] for row in mongo_db.version_vector.find({}, {"_id": 0})}
+
+                self.log_writer = log_writer(self.log_file, self.segment_bytes, self.segment_records, self.log_file_exenstion, self.log_format,
+                                             self.fsync_policy, self.fsync_every, self.fsync_interval_ms,
+                                             checkpoint=self._checkpoint_log_position)
+                self.log_writer.open(stored_sequence_number)
+                self._build_key_index()
 
             except Exception as error:
                 print("Error querying database:", error)
@@ -48,38 +134,33 @@ class mongo_server(server):
         except Exception as error:
             print("Error connecting to MongoDB database:", error)
     
-    def _update_log_shard (self) :
-        self.log_file_shard = self.sequence_number // self.shard_value
-        self.current_log_file = self.log_file + "_" + str(self.log_file_shard) + self.log_file_exenstion
-        if os.path.exists(self.current_log_file):
-                pass
-        else:
-            with open(self.current_log_file, "w") as file:
-                pass
-
-
     def _write_to_log(self, subject, predicate, new_object, timestamp):
         try:
-            with open(self.current_log_file, "a") as file:
-                self.sequence_number += 1
-                log_entry = f"{self.sequence_number}\t{subject}\t{predicate}\t{new_object}\t{timestamp}\n"
-                file.write(log_entry)
-
-                # Update the log position in the MongoDB collection
-                self.db.log_positions.update_one(
-                    {"server_name": self.server_name},
-                    {"$set": {"log_position": self.sequence_number}}
-                )
-            
-            if (self.sequence_number % self.shard_value == 0) :
-                    self._update_log_shard()
+            self.log_writer.append(subject, predicate, new_object, timestamp)
+        except Exception as error:
+            print("Error writing to log file:", error)
 
+    def _write_many_to_log(self, rows):
+        try:
+            self.log_writer.append_many(rows)
         except Exception as error:
             print("Error writing to log file:", error)
 
 
+    def _checkpoint_log_position(self, sequence_number):
+        # Update the log position in the MongoDB collection
+        self.db.log_positions.update_one(
+            {"server_name": self.server_name},
+            {"$set": {"log_position": sequence_number}}
+        )
+
+
+    @timed_operation
     def query(self, subject):
         try:
+            if self.layout == SUBJECT_LAYOUT:
+                doc = self.db.subjects.find_one({"_id": subject})
+                return _subject_rows(doc) if doc else []
             # Find the subject document by subject name
             triples = self.db.triples.find({"subject": subject})
             return [(triple["subject"], triple["predicate"], triple["object"], triple["timestamp"]) for triple in triples]
@@ -88,117 +169,360 @@ class mongo_server(server):
             return []
 
 
+    @timed_operation
+    def query_many(self, subjects):
+        try:
+            if self.layout == SUBJECT_LAYOUT:
+                return [row for doc in self.db.subjects.find({"_id": {"$in": list(subjects)}}) for row in _subject_rows(doc)]
+            triples = self.db.triples.find({"subject": {"$in": list(subjects)}})
+            return [(triple["subject"], triple["predicate"], triple["object"], triple["timestamp"]) for triple in triples]
+        except Exception as error:
+            print("Error querying database:", error)
+            return []
+
+
+    def match(self, subject=None, predicate=None, object=None, limit=None):
+        # Triple pattern query; None matches anything. The cursor fetches merge_batch_size
+        # documents per round trip, so rows stream instead of being loaded at once.
+        pattern = {field: value for field, value in (("subject", subject), ("predicate", predicate), ("object", object)) if value is not None}
+        try:
+            if self.layout == SUBJECT_LAYOUT:
+                yield from self._match_subjects(subject, predicate, object, limit)
+                return
+            triples = self.db.triples.find(pattern, {"_id": 0, "subject": 1, "predicate": 1, "object": 1, "timestamp": 1}, batch_size=self.merge_batch_size)
+            if limit is not None:
+                triples = triples.limit(limit)
+            for triple in triples:
+                yield (triple["subject"], triple["predicate"], triple["object"], triple["timestamp"])
+        except Exception as error:
+            print("Error querying database:", error)
+
+
+    def _match_subjects(self, subject, predicate, object, limit):
+        # A subject is looked up by _id and a predicate through the wildcard index on the
+        # predicates map; an object alone cannot be indexed there and scans every document
+        pattern = {}
+        projection = None
+        if subject is not None:
+            pattern["_id"] = subject
+        if predicate is not None:
+            field = _predicate_field(predicate)
+            pattern[field] = {"$exists": True}
+            if object is not None:
+                pattern[field + ".object"] = object
+            projection = {field: 1}
+
+        count = 0
+        for doc in self.db.subjects.find(pattern, projection, batch_size=self.merge_batch_size):
+            for row in _subject_rows(doc):
+                if limit is not None and count >= limit:
+                    return
+                if (predicate is None or row[1] == predicate) and (object is None or row[2] == object):
+                    count += 1
+                    yield row
+
+
+    @timed_operation
     def update(self, subject, predicate, new_object):
         try:
-            timestamp = int(time() * 1000)
-            self.db.triples.update_one({"subject": subject, "predicate": predicate}, {"$set": {"object": new_object, "timestamp": timestamp}}, upsert=True)
-            self._write_to_log (subject, predicate, new_object, timestamp)
+            with self._locked_keys([(subject, predicate)]):
+                timestamp = int(time() * 1000)
+                if self.layout == SUBJECT_LAYOUT:
+                    self.db.subjects.update_one({"_id": subject}, {"$set": {_predicate_field(predicate): {"object": new_object, "timestamp": timestamp}}}, upsert=True)
+                else:
+                    self.db.triples.update_one({"subject": subject, "predicate": predicate}, {"$set": {"object": new_object, "timestamp": timestamp}}, upsert=True)
+                self._write_to_log (subject, predicate, new_object, timestamp)
+                self._notify_change([(subject, predicate, new_object, timestamp)])
         except Exception as error:
             print("Error updating pair:", error)
 
 
+    def _upsert_rows(self, rows):
+        # One unordered bulk_write of upserts; rows hold one record per key, so the upserts cannot race
+        if rows and self.layout == SUBJECT_LAYOUT:
+            # One upsert per subject document, later rows of a key replacing earlier ones
+            fields = {}
+            for subject, predicate, obj, timestamp in rows:
+                fields.setdefault(subject, {})[_predicate_field(predicate)] = {"object": obj, "timestamp": timestamp}
+            self.db.subjects.bulk_write([UpdateOne({"_id": subject}, {"$set": values}, upsert=True) for subject, values in fields.items()], ordered=False)
+        elif rows:
+            operations = [UpdateOne({"subject": subject, "predicate": predicate}, {"$set": {"object": obj, "timestamp": timestamp}}, upsert=True)
+                          for subject, predicate, obj, timestamp in rows]
+            self.db.triples.bulk_write(operations, ordered=False)
+
+    @timed_operation
+    def update_many(self, triples):
+        try:
+            triples = list(triples)
+            with self._locked_keys([triple[:2] for triple in triples]):
+                rows = stamp_triples(triples, int(time() * 1000))
+                self._upsert_rows(rows)
+                self._write_many_to_log(rows)
+                self._notify_change(rows)
+        except Exception as error:
+            print("Error updating pairs:", error)
+
+
+    @timed_operation
+    def load(self, file_path):
+        # Rows are logged with one append per batch
+        loaded = 0
+        try:
+            for rows in read_triple_batches(file_path, self.load_batch_size):
+                with self._locked_keys([row[:2] for row in rows]):
+                    self._upsert_rows(rows)
+                    self.log_writer.append_many(rows)
+                    self._notify_change(rows)
+                loaded += len(rows)
+        except Exception as error:
+            print("Error loading triples:", error)
+        return loaded
+
+
+    def log_positions(self):
+        # Our own document holds our checkpointed sequence number, the others how far we have read each peer
+        try:
+            return {row["server_name"]: row["log_position"] for row in self.db.log_positions.find({}, {"_id": 0})}
+        except Exception as error:
+            print("Error querying database:", error)
+            return {}
+
+
+    def _log_reader(self, log_file):
+        # One reader per log, so its sparse offset index stays loaded between merges
+        if log_file not in self.log_readers:
+            self.log_readers[log_file] = log_reader(log_file, self.log_file_exenstion)
+        return self.log_readers[log_file]
+
+    def _apply_log_batch(self, records):
+        # Last-writer-wins for a whole batch in one unordered bulk_write. Each upsert is an
+        # aggregation pipeline that only replaces object/timestamp when the incoming timestamp
+        # is newer, so the comparison happens inside the database. Unordered upserts on the same
+        # key could race each other, so the batch is first reduced to its newest record per key.
+        # Rows may carry trailing origin fields; the rows that changed are returned whole.
+        latest = newest_per_key(records)
+
+        if not latest:
+            return []
+        if self.layout == SUBJECT_LAYOUT:
+            changed = {(row[0], row[1]) for row in self._apply_subject_batch(list(latest.values()))}
+            return [row for key, row in latest.items() if key in changed]
+
+        # The key stripes are held until the bulk write is done: update() records a key in the
+        # key_index while holding its stripe, so no key can appear between the check and the insert
+        with self._locked_keys(latest):
+            # Keys the key_index knows are absent are plain inserts, which need no change detection
+            rows = list(latest.values())
+            inserts = []
+            if self.key_index is not None:
+                inserts = [row for row in rows if self.key_index.definitely_absent(row[0], row[1])]
+                if inserts:
+                    inserted = {(row[0], row[1]) for row in inserts}
+                    rows = [row for row in rows if (row[0], row[1]) not in inserted]
+
+            operations = []
+            for subject, predicate, obj, timestamp, *_ in rows:
+                newer = {"$lt": [{"$ifNull": ["$timestamp", -1]}, timestamp]}
+                operations.append(UpdateOne(
+                    {"subject": subject, "predicate": predicate},
+                    [{"$set": {
+                        "object": {"$cond": [newer, {"$literal": obj}, "$object"]},
+                        "timestamp": {"$cond": [newer, timestamp, "$timestamp"]},
+                    }}],
+                    upsert=True
+                ))
+            # Appended after the updates, so upserted_ids still index into rows
+            operations.extend(InsertOne({"subject": subject, "predicate": predicate, "object": obj, "timestamp": timestamp})
+                              for subject, predicate, obj, timestamp, *_ in inserts)
+
+            result = self.db.triples.bulk_write(operations, ordered=False)
+
+        # Upserts are reported by index; modifications only by count. The two common cases
+        # (every existing key replaced, or none) need no further lookup, anything in between
+        # is resolved with one read of the keys that were not upserted. A key that already held
+        # the identical record is indistinguishable from a replaced one and is re-logged as well.
+        # The changed rows are returned in the order they were read.
+        upserted = set(result.upserted_ids)
+        existing_rows = [i for i in range(len(rows)) if i not in upserted]
+        if result.modified_count == len(existing_rows):
+            return list(latest.values())
+
+        changed = {(row[0], row[1]) for row in inserts}
+        changed.update((rows[i][0], rows[i][1]) for i in upserted)
+        if result.modified_count > 0:
+            current = {}
+            subjects = list({rows[i][0] for i in existing_rows})
+            for doc in self.db.triples.find({"subject": {"$in": subjects}}, {"subject": 1, "predicate": 1, "object": 1, "timestamp": 1}):
+                current[(doc["subject"], doc["predicate"])] = (doc.get("object"), doc.get("timestamp"))
+
+            for i in existing_rows:
+                subject, predicate, obj, timestamp = rows[i][:4]
+                if current.get((subject, predicate)) == (obj, timestamp):
+                    changed.add((subject, predicate))
+        return [row for key, row in latest.items() if key in changed]
+
+    def _apply_subject_batch(self, rows):
+        # One pipeline upsert per subject document. Each predicate field is replaced only when
+        # the incoming timestamp is newer than the one stored with it, so last-writer-wins is
+        # decided per field inside the database. A key missing from the key_index may still
+        # share its subject's document, so this layout has no plain-insert path.
+        by_subject = {}
+        for row in rows:
+            by_subject.setdefault(row[0], []).append(row)
+        subjects = list(by_subject)
+
+        operations = []
+        for subject in subjects:
+            fields = {}
+            for _, predicate, obj, timestamp, *_ in by_subject[subject]:
+                field = _predicate_field(predicate)
+                newer = {"$lt": [{"$ifNull": ["$" + field + ".timestamp", -1]}, timestamp]}
+                fields[field] = {"$cond": [newer, {"$literal": {"object": obj, "timestamp": timestamp}}, "$" + field]}
+            operations.append(UpdateOne({"_id": subject}, [{"$set": fields}], upsert=True))
+
+        result = self.db.subjects.bulk_write(operations, ordered=False)
+
+        # Every row of an upserted document is new. A modified document may have taken only
+        # some of its fields, which one read of those fields tells apart.
+        upserted = set(result.upserted_ids)
+        changed = [row for i in sorted(upserted) for row in by_subject[subjects[i]]]
+        existing = [subjects[i] for i in range(len(subjects)) if i not in upserted]
+        if result.modified_count == 0 or not existing:
+            return changed
+
+        projection = {_predicate_field(row[1]): 1 for subject in existing for row in by_subject[subject]}
+        current = {}
+        for doc in self.db.subjects.find({"_id": {"$in": existing}}, projection):
+            for subject, predicate, obj, timestamp in _subject_rows(doc):
+                current[(subject, predicate)] = (obj, timestamp)
+        for subject in existing:
+            changed.extend(row for row in by_subject[subject] if current.get((row[0], row[1])) == (row[2], row[3]))
+        return changed
+
+    @timed_operation
+    def apply_triples(self, rows):
+        # Last-writer-wins for rows from outside the logs (Merkle repair); the rows that win
+        # are logged so other nodes pick them up. Returns how many won.
+        changed = 0
+        try:
+            with self.merge_lock:
+                for i in range(0, len(rows), self.merge_batch_size):
+                    batch = [row[:4] for row in self._apply_log_batch(rows[i:i + self.merge_batch_size])]
+                    self._write_many_to_log(batch)
+                    self._notify_change(batch)
+                    changed += len(batch)
+        except Exception as error:
+            print("Error applying triples:", error)
+        return changed
+
+    def _replay_records(self, records, log_pos, server_name=None, relog=True):
+        # Applies log records from log_pos on in batches of merge_batch_size. When replaying
+        # a peer's log, the peer's position and version vector advances are stored after every
+        # batch so an interrupted merge resumes from there. log_replay decides which records
+        # are applied. Returns the last position read and the number of records read.
+        replay = log_replay(self.server_name, self.version_vector, self.merge_batch_size, log_pos, server_name, self.key_index)
+
+        def flush_batch(rows, log_pos, advances):
+            changed = self._apply_log_batch(rows)
+            self._count_merge_records(server_name, applied=len(changed), relogged=len(changed) if relog else 0)
+            if changed and relog:
+                self.log_writer.append_many(changed)
+            if changed:
+                self._notify_change(changed)
+
+            if server_name is not None:
+                self.db.log_positions.update_one(
+                    {"server_name": server_name},
+                    {"$set": {"log_position": log_pos}}
+                )
+                if advances:
+                    self.db.version_vector.bulk_write([UpdateOne({"origin": origin}, {"$max": {"origin_seq": origin_seq}}, upsert=True)
+                                                       for origin, origin_seq in advances.items()], ordered=False)
+                    replay.saved(advances)
+
+        log_pos, count = replay.run(records, flush_batch)
+        self._count_merge_records(server_name, read=count, skipped=replay.skipped)
+        return log_pos, count
+
+    def _restore_latest_snapshot(self):
+        # Restores the newest snapshot that reads back intact and returns the sequence number
+        # it reflects, or 0 if there is none. Its rows are already in our own log.
+        for sequence_number, path in list_snapshots(self.log_file):
+            try:
+                self._replay_records(read_snapshot(path), 0, relog=False)
+                return sequence_number
+            except ValueError as error:
+                print("Skipping damaged snapshot:", error)
+        return 0
+
+    def _dump_triples(self):
+        # MongoClient is thread-safe, so the dump can stream on its own cursor while
+        # update() and merge() keep running
+        if self.layout == SUBJECT_LAYOUT:
+            for doc in self.db.subjects.find({}, batch_size=self.merge_batch_size):
+                yield from _subject_rows(doc)
+            return
+        triples = self.db.triples.find({}, {"_id": 0, "subject": 1, "predicate": 1, "object": 1, "timestamp": 1}, batch_size=self.merge_batch_size)
+        for triple in triples:
+            yield (triple["subject"], triple["predicate"], triple["object"], triple["timestamp"])
+
+    @timed_operation
+    def snapshot(self):
+        # Every record up to the current sequence number is applied before the dump starts;
+        # rows changed while it runs are replayed again on recover, which is harmless
+        sequence_number = self.sequence_number
+        path = write_snapshot(self.log_file, sequence_number, self._dump_triples())
+        prune_snapshots(self.log_file, self.snapshots_kept)
+        return path
+
+    @timed_operation
     def merge(self, server_name):
         try:
-            log_position = self.db.log_positions.find_one({"server_name": server_name})
+            with self.merge_lock:
+                log_position = self.db.log_positions.find_one({"server_name": server_name})
 
-            if log_position is None:
-                raise ValueError(f"Log position not found for '{server_name}' server")
+                if log_position is None:
+                    raise ValueError(f"Log position not found for '{server_name}' server")
 
-            log_pos = log_position.get("log_position", 0)
-            parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-            logs_dir = os.path.join(parent_dir, "logs")
-            
-            while (True) : 
-                log_file_shard = log_pos // self.shard_value
-                log_file = os.path.join(logs_dir, server_name + "_" + str(log_file_shard) + self.log_file_exenstion)
-                new_log_pos = log_pos % self.shard_value
-
-                if os.path.exists(log_file):
-                    with open(log_file, "r") as f:
-                        lines = f.readlines()[new_log_pos:]
-                else:
-                    break
-
-                with open(log_file, "r") as f:
-                    lines = f.readlines()[new_log_pos:]
-                
-                if (len(lines) == 0) :
-                    break
-
-                for line in lines:
-                    line_num, subject, predicate, obj, timestamp = line.strip().split("\t")
-                    timestamp = int(timestamp)
-
-                    existing_record = self.db.triples.find_one({"subject": subject, "predicate": predicate}, {"timestamp": 1})
-        
-                    if existing_record:
-                        existing_timestamp = existing_record.get("timestamp", 0)
-                        if (existing_timestamp < timestamp) :
-                            self.db.triples.update_one({"subject": subject, "predicate": predicate}, {"$set": {"object": obj, "timestamp": timestamp}}, upsert=True)
-                            self._write_to_log (subject, predicate, obj, timestamp)
-                    else:
-                        self.db.triples.update_one({"subject": subject, "predicate": predicate}, {"$set": {"object": obj, "timestamp": timestamp}}, upsert=True)
-                        self._write_to_log (subject, predicate, obj, timestamp)
-                        
-                log_pos += len(lines)
-
-            # Update log position for the current server
-            self.db.log_positions.update_one(
-                {"server_name": server_name},
-                {"$set": {"log_position": log_pos}}
-            )
+                log_pos = log_position.get("log_position", 0)
+                parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+                logs_dir = os.path.join(parent_dir, "logs")
+
+                log_file = os.path.join(logs_dir, server_name)
+                _, count = self._replay_records(self._log_reader(log_file).read(log_pos), log_pos, server_name)
+                return count
 
 
         except Exception as e:
             import traceback
             traceback.print_exc()
+        return 0
 
 
+    @timed_operation
     def recover (self) :
         try :
-            log_pos = 0
-            
-            while (True) : 
-                log_file_shard = log_pos // self.shard_value
-                log_file = os.path.join(self.log_file + "_" + str(log_file_shard) + self.log_file_exenstion)
-                new_log_pos = log_pos % self.shard_value
-
-                if os.path.exists(log_file):
-                    with open(log_file, "r") as f:
-                        lines = f.readlines()[new_log_pos:]
-                else:
-                    break
-
-                with open(log_file, "r") as f:
-                    lines = f.readlines()[new_log_pos:]
-                
-                if (len(lines) == 0) :
-                    break
-
-                for line in lines:
-                    line_num, subject, predicate, obj, timestamp = line.strip().split("\t")
-                    timestamp = int(timestamp)
-
-                    existing_record = self.db.triples.find_one({"subject": subject, "predicate": predicate}, {"timestamp": 1})
-        
-                    if existing_record:
-                        existing_timestamp = existing_record.get("timestamp", 0)
-                        if (existing_timestamp < timestamp) :
-                            self.db.triples.update_one({"subject": subject, "predicate": predicate}, {"$set": {"object": obj, "timestamp": timestamp}}, upsert=True)
-                            self._write_to_log (subject, predicate, obj, timestamp)
-                    else:
-                        self.db.triples.update_one({"subject": subject, "predicate": predicate}, {"$set": {"object": obj, "timestamp": timestamp}}, upsert=True)
-                        self._write_to_log (subject, predicate, obj, timestamp)
-                        
-                log_pos += len(lines)
+            with self.merge_lock:
+                log_pos = self._restore_latest_snapshot()
+
+                # Only the log suffix past the snapshot is replayed. These records come from our
+                # own log, so nothing is re-logged.
+                self._replay_records(self._log_reader(self.log_file).read(log_pos), log_pos, relog=False)
 
         except Exception as e:
             import traceback
             traceback.print_exc()
 
     
+    @timed_operation
+    def compact_log(self):
+        # Only shards the writer has sealed in the manifest are rewritten
+        return compact_log(self.log_file, self.log_file_exenstion)
+
     def disconnect(self):
         try:
+            if self.log_writer:
+                self.log_writer.close()
             if self.client:
                 self.client.close()
                 print("Disconnected from MongoDB database.")
@@ -0,0 +1,103 @@
+import os
+import sys
+from neo4j import GraphDatabase
+from .snapshot import write_snapshot, read_snapshot, snapshot_file
+from .neo4j_server import SCHEMA_QUERIES, MERGE_ROWS_QUERY
+
+# Triples of the old model: one (:Subject)-[:Predicate]->(:Object) path per triple, with
+# the object value and timestamp on a per-triple Object node
+OLD_TRIPLES_QUERY = """
+MATCH (s:Subject)-[r:Predicate]->(o:Object)
+WHERE o.timestamp IS NOT NULL
+RETURN s.value AS subject, r.value AS predicate, o.value AS object, o.timestamp AS timestamp
+"""
+
+DELETE_NODES_QUERY = """
+MATCH (n)
+WHERE n:Subject OR n:Object
+WITH n LIMIT $batch_size
+DETACH DELETE n
+RETURN count(*) AS deleted
+"""
+
+# The plain node value indexes of the old schema: Subject and Object need them gone for
+# their uniqueness constraints, and Predicate is no longer a node label
+OLD_INDEXES_QUERY = """
+SHOW INDEXES YIELD name, entityType, labelsOrTypes, properties, owningConstraint
+WHERE owningConstraint IS NULL AND entityType = 'NODE' AND labelsOrTypes IN [['Subject'], ['Object'], ['Predicate']] AND properties = ['value']
+RETURN name
+"""
+
+
+def _has_old_model(session):
+    return session.run("MATCH (o:Object) WHERE o.timestamp IS NOT NULL RETURN count(o) > 0 AS found").single()["found"]
+
+
+def _apply_rows(session, rows):
+    # Newest row per key, applied last-writer-wins as a merge would
+    latest = {}
+    for row in rows:
+        existing = latest.get((row[0], row[1]))
+        if existing is None or existing[3] < row[3]:
+            latest[(row[0], row[1])] = row
+    params = [{"subject": subject, "predicate": predicate, "object": obj, "timestamp": timestamp} for subject, predicate, obj, timestamp in latest.values()]
+    session.execute_write(lambda tx: tx.run(MERGE_ROWS_QUERY, rows=params).consume())
+
+
+def migrate_graph(driver, work_file, batch_size=10000):
+    """Moves a graph from the old per-triple Object nodes to the model in neo4j_server.
+
+    The old triples are first dumped to a snapshot file next to work_file, then the old
+    Subject and Object nodes are deleted, the old indexes are replaced by the new schema,
+    and the dump is written back last-writer-wins, so keys duplicated by the old MERGE
+    collapse into their newest triple. The dump is only removed once it is written back; a
+    migration that is interrupted resumes from it when run again. Neo4j must not be served
+    while this runs. Returns the number of triples read from the old graph.
+    """
+    dump = snapshot_file(work_file, 0)
+    with driver.session(fetch_size=batch_size) as session:
+        if not os.path.exists(dump + ".json"):
+            if not _has_old_model(session):
+                for query in SCHEMA_QUERIES:
+                    session.run(query).consume()
+                print("Graph already uses the current model.")
+                return 0
+
+            result = session.run(OLD_TRIPLES_QUERY)
+            write_snapshot(work_file, 0, ((record["subject"], record["predicate"], record["object"], record["timestamp"]) for record in result))
+
+            while session.run(DELETE_NODES_QUERY, batch_size=batch_size).single()["deleted"]:
+                pass
+
+        for name in [record["name"] for record in session.run(OLD_INDEXES_QUERY)]:
+            session.run(f"DROP INDEX `{name}` IF EXISTS").consume()
+        for query in SCHEMA_QUERIES:
+            session.run(query).consume()
+
+        migrated = 0
+        rows = []
+        for record in read_snapshot(dump):
+            rows.append((record.subject, record.predicate, record.object, record.timestamp))
+            if len(rows) >= batch_size:
+                _apply_rows(session, rows)
+                migrated += len(rows)
+                rows = []
+        if rows:
+            _apply_rows(session, rows)
+            migrated += len(rows)
+
+    os.remove(dump + ".json")
+    os.remove(dump)
+    return migrated
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        sys.exit("Usage: python3 -m src.neo4j_migration <uri, e.g. bolt://localhost:7687> <user> <password>")
+    parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+    driver = GraphDatabase.driver(sys.argv[1], auth=(sys.argv[2], sys.argv[3]))
+    try:
+        count = migrate_graph(driver, os.path.join(parent_dir, "logs", "neo4j_migration"))
+        print(f"Migrated {count} triple(s) to the unique Subject / Object model.")
+    finally:
+        driver.close()
@@ -2,27 +2,180 @@ from neo4j import GraphDatabase
 import time
 import os
 import sys
+import threading
 import subprocess
-from .server_interface import server
+from .server_interface import server, log_replay
+from .metrics import registry, timed_operation
+from .log_reader import log_reader
+from .log_writer import log_writer, FSYNC_INTERVAL
+from .log_compaction import compact_log
+from .snapshot import write_snapshot, list_snapshots, read_snapshot, prune_snapshots
+from .log_format import TEXT_FORMAT, newest_per_key
+from .triple_file import read_triple_batches, stamp_triples
+
+# Graph model: one (:Subject {value}) node per subject and one (:Object {value}) node per
+# distinct object value, both unique, with one [:Predicate {value, timestamp}] relationship
+# per (subject, predicate) between them. Changing a triple's object moves its relationship
+# to another Object node; an Object node left without relationships is deleted in the same
+# transaction, so hot keys do not pile up orphans.
+SCHEMA_QUERIES = [
+    "CREATE CONSTRAINT subject_value IF NOT EXISTS FOR (s:Subject) REQUIRE s.value IS UNIQUE",
+    "CREATE CONSTRAINT object_value IF NOT EXISTS FOR (o:Object) REQUIRE o.value IS UNIQUE",
+    "CREATE INDEX predicate_value IF NOT EXISTS FOR ()-[r:Predicate]-() ON (r.value)",
+]
+
+# Every write first sets and removes a property on the subject node. That write-locks the
+# node until commit, so two transactions writing the same subject run one after the other
+# instead of both finding no relationship for a key and creating two.
+#
+# The Object node is locked the same way right after MERGE finds or creates it. MERGE
+# takes no write lock on a node it finds, so another transaction could otherwise see the
+# node without relationships and delete it as an orphan before ours links to it.
+
+# Deletes the Object nodes named in `replaced` (a list of lists of values) that no longer
+# have relationships. Each node is write-locked before the check, so a transaction that
+# MERGEd it first has its relationship seen, and one that MERGEs it later waits for the
+# delete and creates a new node. A deadlock between the two is retried by execute_write.
+DELETE_ORPHANED_OBJECTS = """
+CALL {
+    WITH replaced
+    UNWIND replaced AS object_values
+    UNWIND object_values AS value
+    WITH DISTINCT value
+    MATCH (old:Object {value: value})
+    SET old._lock = true
+    REMOVE old._lock
+    WITH old
+    WHERE NOT (old)--()
+    DELETE old
+}
+"""
+
+# Last-writer-wins for a batch of {subject, predicate, object, timestamp} maps: a row
+# replaces the key's relationship only if it has none or an older one. Returns the keys
+# that were written.
+MERGE_ROWS_QUERY = """
+UNWIND $rows AS row
+MERGE (s:Subject {value: row.subject})
+SET s._lock = true
+REMOVE s._lock
+WITH row, s, [(s)-[r:Predicate {value: row.predicate}]->() | r] AS existing,
+     [(s)-[:Predicate {value: row.predicate}]->(old) | old.value] AS old_objects
+WHERE size(existing) = 0 OR existing[0].timestamp < row.timestamp
+MERGE (o:Object {value: row.object})
+SET o._lock = true
+REMOVE o._lock
+FOREACH (old IN existing | DELETE old)
+CREATE (s)-[:Predicate {value: row.predicate, timestamp: row.timestamp}]->(o)
+WITH collect({subject: row.subject, predicate: row.predicate}) AS written, collect(old_objects) AS replaced
+""" + DELETE_ORPHANED_OBJECTS + """
+UNWIND written AS key
+RETURN key.subject AS subject, key.predicate AS predicate
+"""
+
+# Unconditional overwrite for a batch of rows; update() sends a batch of one
+UPSERT_ROWS_QUERY = """
+UNWIND $rows AS row
+MERGE (s:Subject {value: row.subject})
+SET s._lock = true
+REMOVE s._lock
+WITH row, s, [(s)-[:Predicate {value: row.predicate}]->(old) | old.value] AS old_objects
+MERGE (o:Object {value: row.object})
+SET o._lock = true
+REMOVE o._lock
+FOREACH (old IN [(s)-[r:Predicate {value: row.predicate}]->() | r] | DELETE old)
+CREATE (s)-[:Predicate {value: row.predicate, timestamp: row.timestamp}]->(o)
+WITH collect(old_objects) AS replaced
+""" + DELETE_ORPHANED_OBJECTS
+
+QUERY_SUBJECT_QUERY = """
+MATCH (s:Subject {value: $subject})-[r:Predicate]->(o:Object)
+RETURN s.value AS subject, r.value AS predicate, o.value AS object, r.timestamp AS timestamp
+"""
+
+QUERY_SUBJECTS_QUERY = """
+MATCH (s:Subject)-[r:Predicate]->(o:Object)
+WHERE s.value IN $subjects
+RETURN s.value AS subject, r.value AS predicate, o.value AS object, r.timestamp AS timestamp
+"""
+
+def match_query(subject=None, predicate=None, object=None, limit=None):
+    # Only the given values become property constraints, so each one can use its index
+    subject_pattern = " {value: $subject}" if subject is not None else ""
+    predicate_pattern = " {value: $predicate}" if predicate is not None else ""
+    object_pattern = " {value: $object}" if object is not None else ""
+    query = (f"MATCH (s:Subject{subject_pattern})-[r:Predicate{predicate_pattern}]->(o:Object{object_pattern}) "
+             "RETURN s.value AS subject, r.value AS predicate, o.value AS object, r.timestamp AS timestamp")
+    if limit is not None:
+        query += " LIMIT $limit"
+    return query
+
+DUMP_TRIPLES_QUERY = """
+MATCH (s:Subject)-[r:Predicate]->(o:Object)
+RETURN s.value AS subject, r.value AS predicate, o.value AS object, r.timestamp AS timestamp
+"""
+
+SAVE_LOG_POSITION_QUERY = """
+MATCH (lp:LogPosition {server_name: $server_name})
+SET lp.log_position = $log_position
+"""
+
+# Raises the per-origin high-water marks of the version vector
+SAVE_VERSION_VECTOR_QUERY = """
+UNWIND $rows AS row
+MERGE (v:VersionVector {origin: row.origin})
+SET v.origin_seq = CASE WHEN v.origin_seq IS NULL OR v.origin_seq < row.origin_seq THEN row.origin_seq ELSE v.origin_seq END
+"""
 
 
 class neo4j_server (server):
-    def __init__(self, uri, user, password):
+    """Triple store on Neo4j.
+
+    The driver is thread-safe and pools up to max_connection_pool_size connections; callers
+    wait at most connection_acquisition_timeout seconds for one. Every call opens a session
+    of its own, since sessions must not be shared between threads, so queries and updates
+    from several threads run side by side, also while a merge is in progress. merge(),
+    recover() and apply_triples() are serialized by merge_lock, since they share the
+    version vector.
+    """
+
+    def __init__(self, uri, user, password, merge_batch_size=1000, log_format=TEXT_FORMAT,
+                 fsync_policy=FSYNC_INTERVAL, fsync_every=100, fsync_interval_ms=50, snapshots_kept=2,
+                 segment_bytes=64 * 1024 * 1024, segment_records=None, load_batch_size=10000, key_index=None,
+                 max_connection_pool_size=100, connection_acquisition_timeout=60):
+        self.server_name = "neo4j"
         self.uri = uri
         self.user = user
         self.password = password
+        self.max_connection_pool_size = max_connection_pool_size
+        self.connection_acquisition_timeout = connection_acquisition_timeout
+        self.merge_lock = threading.Lock()
         self.driver = None
-        self.sequence_number = None
         self.log_file = "neo4j"
-        self.log_file_shard = None
-        self.current_log_file = None
-        self.shard_value = 100
+        self.log_writer = None
+        self.segment_bytes = segment_bytes
+        self.segment_records = segment_records
         self.log_file_exenstion = ".log"
+        self.log_format = log_format
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval_ms = fsync_interval_ms
+        self.log_readers = {}
+        self.merge_batch_size = merge_batch_size
+        self.snapshots_kept = snapshots_kept
+        self.load_batch_size = load_batch_size
+        self.version_vector = {}
+        self.key_index = key_index
+
+    @property
+    def sequence_number(self):
+        return self.log_writer.sequence_number if self.log_writer else None
 
 
     def connect(self):
         try:
-            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password), max_connection_pool_size=self.max_connection_pool_size,
+                                               connection_acquisition_timeout=self.connection_acquisition_timeout)
             print("Connected to Neo4j database!")
 
             parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
@@ -33,47 +186,47 @@ class neo4j_server (server):
                 result = session.run("MATCH (n:LogPosition) WHERE n.server_name = 'neo4j' RETURN n.log_position AS log_position")
                 neo4j_row = result.single()
                 if neo4j_row:
-                    self.sequence_number = neo4j_row["log_position"]
+                    stored_sequence_number = neo4j_row["log_position"]
                 else:
                     self.disconnect()
                     raise ValueError("Error: 'LogPosition' node not found for Neo4j.")
 
-                self._update_log_shard()
+                result = session.run("MATCH (v:VersionVector) RETURN v.origin AS origin, v.origin_seq AS origin_seq")
+                self.version_vector = {record["origin"]: record["origin_seq"] for record in result}
+
+            self.log_writer = log_writer(self.log_file, self.segment_bytes, self.segment_records, self.log_file_exenstion, self.log_format,
+                                         self.fsync_policy, self.fsync_every, self.fsync_interval_ms,
+                                         checkpoint=self._checkpoint_log_position)
+            self.log_writer.open(stored_sequence_number)
+            self._build_key_index()
 
         except Exception as e:
             print("Error connecting to Neo4j database:", e)
 
     
-    def _update_log_shard (self) :
-        self.log_file_shard = self.sequence_number // self.shard_value
-        self.current_log_file = self.log_file + "_" + str(self.log_file_shard) + self.log_file_exenstion
-        if os.path.exists(self.current_log_file):
-                pass
-        else:
-            with open(self.current_log_file, "w") as file:
-                pass
-            
     def _write_to_log(self, subject, predicate, new_object, timestamp):
         try:
-            with open(self.current_log_file, "a") as file:
-                self.sequence_number += 1
-                log_entry = f"{self.sequence_number}\t{subject}\t{predicate}\t{new_object}\t{timestamp}\n"
-                file.write(log_entry)
-
-                with self.driver.session() as session:
-                    session.run("MATCH (n:LogPosition) WHERE n.server_name = 'neo4j' SET n.log_position = $log_position", log_position=self.sequence_number)
-            
-            if (self.sequence_number % self.shard_value == 0) :
-                self._update_log_shard()
+            self.log_writer.append(subject, predicate, new_object, timestamp)
+        except Exception as error:
+            print("Error writing to log file:", error)
 
+    def _write_many_to_log(self, rows):
+        try:
+            self.log_writer.append_many(rows)
         except Exception as error:
             print("Error writing to log file:", error)
 
+    def _checkpoint_log_position(self, sequence_number):
+        # Runs on the log writer's thread, so it uses a session of its own
+        with self.driver.session() as session:
+            self._save_log_position(session, self.server_name, sequence_number)
+
     
+    @timed_operation
     def query(self, subject):
         try:
-            with self.driver.session() as session:
-                result = session.run("MATCH (s:Subject {value: $subject})-[r]->(o:Object) RETURN s.value AS subject, r.value AS predicate, o.value AS object, o.timestamp AS timestamp", subject=subject)
+            with self.driver.session() as session, self._round_trip("query"):
+                result = session.run(QUERY_SUBJECT_QUERY, subject=subject)
 
                 rows = [(record["subject"], record["predicate"], record["object"], record["timestamp"]) for record in result]
                 return rows
@@ -82,148 +235,251 @@ class neo4j_server (server):
             print("Error querying Neo4j database:", error)
             return []
 
+    @timed_operation
+    def query_many(self, subjects):
+        try:
+            with self.driver.session() as session, self._round_trip("query_many"):
+                result = session.run(QUERY_SUBJECTS_QUERY, subjects=list(subjects))
+                return [(record["subject"], record["predicate"], record["object"], record["timestamp"]) for record in result]
+
+        except Exception as error:
+            print("Error querying Neo4j database:", error)
+            return []
+
     
-    def update(self, subject, predicate, new_object):
+    def match(self, subject=None, predicate=None, object=None, limit=None):
+        # Triple pattern query; None matches anything. The result is consumed as it streams
+        # in, merge_batch_size records per fetch.
         try:
-            timestamp = int(time.time() * 1000)  # Current Unix Epoch Milliseconds
-            
-            with self.driver.session() as session:
-                # Check if the subject and predicate already exist
-                result = session.run("MATCH (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o) RETURN s, r, o", subject=subject, predicate=predicate)
-                record = result.single()
-                
-                if record:
-                    session.run("MATCH (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o) SET o.value = $new_object, o.timestamp = $timestamp", subject=subject, predicate=predicate, new_object=new_object, timestamp=timestamp)
-                else:
-                    session.run("MERGE (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o:Object {value: $new_object, timestamp: $timestamp})", subject=subject, predicate=predicate, new_object=new_object, timestamp=timestamp)
+            with self.driver.session(fetch_size=self.merge_batch_size) as session:
+                result = session.run(match_query(subject, predicate, object, limit), subject=subject, predicate=predicate, object=object, limit=limit)
+                for record in result:
+                    yield (record["subject"], record["predicate"], record["object"], record["timestamp"])
+        except Exception as error:
+            print("Error querying Neo4j database:", error)
 
+    @timed_operation
+    def update(self, subject, predicate, new_object):
+        try:
+            # One statement in one round trip
+            with self._locked_keys([(subject, predicate)]), self.driver.session() as session:
+                timestamp = int(time.time() * 1000)  # Current Unix Epoch Milliseconds
+                self._upsert_rows(session, [(subject, predicate, new_object, timestamp)])
                 self._write_to_log(subject, predicate, new_object, timestamp)
+                self._notify_change([(subject, predicate, new_object, timestamp)])
         except Exception as error:
             print("Error updating triple:", error)
 
 
+    def _upsert_rows(self, session, rows):
+        # One UNWIND write transaction for the whole batch
+        if rows:
+            params = [{"subject": subject, "predicate": predicate, "object": obj, "timestamp": timestamp} for subject, predicate, obj, timestamp in rows]
+            with self._round_trip("upsert"):
+                session.execute_write(lambda tx: tx.run(UPSERT_ROWS_QUERY, rows=params).consume())
 
-    def merge(self, server_name):
+    @timed_operation
+    def update_many(self, triples):
+        try:
+            triples = list(triples)
+            with self._locked_keys([triple[:2] for triple in triples]), self.driver.session() as session:
+                rows = stamp_triples(triples, int(time.time() * 1000))
+                self._upsert_rows(session, rows)
+                self._write_many_to_log(rows)
+                self._notify_change(rows)
+        except Exception as error:
+            print("Error updating triples:", error)
+
+
+    @timed_operation
+    def load(self, file_path):
+        # Rows are logged with one append per batch
+        loaded = 0
         try:
             with self.driver.session() as session:
+                for rows in read_triple_batches(file_path, self.load_batch_size):
+                    with self._locked_keys([row[:2] for row in rows]):
+                        self._upsert_rows(session, rows)
+                        self.log_writer.append_many(rows)
+                        self._notify_change(rows)
+                    loaded += len(rows)
+        except Exception as error:
+            print("Error loading triples:", error)
+        return loaded
+
+
+
+    def log_positions(self):
+        # Our own node holds our checkpointed sequence number, the others how far we have read each peer
+        try:
+            with self.driver.session() as session:
+                result = session.run("MATCH (lp:LogPosition) RETURN lp.server_name AS server_name, lp.log_position AS log_position")
+                return {record["server_name"]: record["log_position"] for record in result}
+        except Exception as error:
+            print("Error querying Neo4j database:", error)
+            return {}
+
+    def _log_reader(self, log_file):
+        # One reader per log, so its sparse offset index stays loaded between merges
+        if log_file not in self.log_readers:
+            self.log_readers[log_file] = log_reader(log_file, self.log_file_exenstion)
+        return self.log_readers[log_file]
+
+    def _round_trip(self, call):
+        # The driver has no per-request hook, so the calls that each take one round trip (one
+        # statement, or one write transaction with its commit) are timed where they are made
+        return registry.timer("backend_round_trip_seconds", server=self.server_name, call=call)
+
+    def _save_log_position(self, session, server_name, log_pos):
+        with self._round_trip("save_log_position"):
+            session.execute_write(lambda tx: tx.run(SAVE_LOG_POSITION_QUERY, server_name=server_name, log_position=log_pos).consume())
+
+    def _save_version_vector(self, session, origins):
+        rows = [{"origin": origin, "origin_seq": origin_seq} for origin, origin_seq in origins.items()]
+        with self._round_trip("save_version_vector"):
+            session.execute_write(lambda tx: tx.run(SAVE_VERSION_VECTOR_QUERY, rows=rows).consume())
+
+    def _apply_log_batch(self, session, records):
+        # Last-writer-wins for a whole batch in one UNWIND statement inside a write transaction.
+        # Only one row per key is sent, so the batch is first reduced to its newest record per
+        # (subject, predicate); ties keep the earlier record, as a strict < comparison would.
+        # Rows may carry trailing origin fields; the rows that changed are returned whole.
+        latest = newest_per_key(records)
+
+        if not latest:
+            return []
+
+        # No insert-only fast path from the key_index: it is local to this process and nothing
+        # in the graph would reject a second relationship for a key it wrongly calls absent
+        rows = [{"subject": subject, "predicate": predicate, "object": obj, "timestamp": timestamp}
+                for subject, predicate, obj, timestamp, *_ in latest.values()]
+
+        def apply_rows(tx):
+            result = tx.run(MERGE_ROWS_QUERY, rows=rows)
+            return {(record["subject"], record["predicate"]) for record in result}
+
+        with self._round_trip("merge_batch"):
+            changed = session.execute_write(apply_rows)
+
+        # Re-log in the order the records were read
+        return [row for key, row in latest.items() if key in changed]
+
+    @timed_operation
+    def apply_triples(self, rows):
+        # Last-writer-wins for rows from outside the logs (Merkle repair); the rows that win
+        # are logged so other nodes pick them up. Returns how many won.
+        changed = 0
+        try:
+            with self.merge_lock, self.driver.session() as session:
+                for i in range(0, len(rows), self.merge_batch_size):
+                    batch = [row[:4] for row in self._apply_log_batch(session, rows[i:i + self.merge_batch_size])]
+                    self._write_many_to_log(batch)
+                    self._notify_change(batch)
+                    changed += len(batch)
+        except Exception as error:
+            print("Error applying triples:", error)
+        return changed
+
+    def _replay_records(self, session, records, log_pos, server_name=None, relog=True):
+        # Applies log records from log_pos on in batches of merge_batch_size, all through
+        # one session. When replaying a peer's log, the peer's position and version vector
+        # advances are stored with every batch so an interrupted merge resumes from there.
+        # log_replay decides which records are applied. Returns the last position read and
+        # the number of records read.
+        replay = log_replay(self.server_name, self.version_vector, self.merge_batch_size, log_pos, server_name, self.key_index)
+
+        def flush_batch(rows, log_pos, advances):
+            changed = self._apply_log_batch(session, rows)
+            self._count_merge_records(server_name, applied=len(changed), relogged=len(changed) if relog else 0)
+            if changed and relog:
+                self.log_writer.append_many(changed)
+            if changed:
+                self._notify_change(changed)
+            if server_name is not None:
+                self._save_log_position(session, server_name, log_pos)
+                if advances:
+                    self._save_version_vector(session, advances)
+                    replay.saved(advances)
+
+        log_pos, count = replay.run(records, flush_batch)
+        self._count_merge_records(server_name, read=count, skipped=replay.skipped)
+        return log_pos, count
+
+    def _restore_latest_snapshot(self, session):
+        # Restores the newest snapshot that reads back intact and returns the sequence number
+        # it reflects, or 0 if there is none. Its rows are already in our own log.
+        for sequence_number, path in list_snapshots(self.log_file):
+            try:
+                self._replay_records(session, read_snapshot(path), 0, relog=False)
+                return sequence_number
+            except ValueError as error:
+                print("Skipping damaged snapshot:", error)
+        return 0
+
+    def _dump_triples(self):
+        # Streams the graph on a session of its own, so update() and merge() keep running
+        with self.driver.session() as session:
+            result = session.run(DUMP_TRIPLES_QUERY)
+            for record in result:
+                yield (record["subject"], record["predicate"], record["object"], record["timestamp"])
+
+    @timed_operation
+    def snapshot(self):
+        # Every record up to the current sequence number is applied before the dump starts;
+        # rows changed while it runs are replayed again on recover, which is harmless
+        sequence_number = self.sequence_number
+        path = write_snapshot(self.log_file, sequence_number, self._dump_triples())
+        prune_snapshots(self.log_file, self.snapshots_kept)
+        return path
+
+    @timed_operation
+    def merge(self, server_name):
+        try:
+            with self.merge_lock, self.driver.session() as session:
                 result = session.run("""
                 MATCH (lp:LogPosition {server_name: $server_name})
                 RETURN lp.log_position AS log_position
                 """, server_name=server_name)
                 record = result.single()
 
-            if record is None:
-                raise ValueError(f"Log position not found for '{server_name}' server")
-            log_position = record["log_position"]
-
-
-            # Read log file from the last read position + 1
-            parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-            logs_dir = os.path.join(parent_dir, "logs")
-            log_pos = log_position
+                if record is None:
+                    raise ValueError(f"Log position not found for '{server_name}' server")
+                log_position = record["log_position"]
 
-            while (True) :
-                log_file_shard = log_pos // self.shard_value
-                log_file = os.path.join(logs_dir, server_name + "_" + str(log_file_shard) + self.log_file_exenstion)
-                new_log_pos = log_pos % self.shard_value
 
-                if os.path.exists(log_file):
-                    with open(log_file, "r") as f:
-                        lines = f.readlines()[new_log_pos:]
-                else:
-                    break
-
-                with open(log_file, "r") as f:
-                    lines = f.readlines()[new_log_pos:]
-
-                if (len(lines) == 0) :
-                    break
-
-                # Process each line from the log file
-                for line in lines:
-                    # Parse line to extract subject, predicate, object, and timestamp
-                    line_num, subject, predicate, obj, timestamp = line.strip().split("\t")
-                    timestamp = int(timestamp)
-
-                    with self.driver.session() as session:
-                        result = session.run("MATCH (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o) RETURN s, r, o", subject=subject, predicate=predicate)
-                        record = result.single()
-
-                        if record is None:
-                            # Insert the record into the database
-                            session.run("MERGE (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o:Object {value: $new_object, timestamp: $timestamp})", subject=subject, predicate=predicate, new_object=obj, timestamp=timestamp)
-                            self._write_to_log (subject, predicate, obj, timestamp)
-                        else:
-                            # Check if the existing record has an older timestamp
-                            existing_timestamp = int(record["o"]["timestamp"])
-                            if existing_timestamp < timestamp:
-                                session.run("MATCH (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o) SET o.value = $new_object, o.timestamp = $timestamp", subject=subject, predicate=predicate, new_object=obj, timestamp=timestamp)
-                                self._write_to_log (subject, predicate, obj, timestamp)
-                
-                log_pos += len (lines)
-
-            try:
-                with self.driver.session() as session:
-                    # Update the log position in the Neo4j database
-                    session.run("""
-                    MATCH (lp:LogPosition {server_name: $server_name})
-                    SET lp.log_position = $log_position
-                    """, server_name=server_name, log_position=log_pos)
-            except Exception as e:
-                print("Error updating log position:", e)
+                # Read log file from the last read position + 1
+                parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+                logs_dir = os.path.join(parent_dir, "logs")
+                log_file = os.path.join(logs_dir, server_name)
+                _, count = self._replay_records(session, self._log_reader(log_file).read(log_position), log_position, server_name)
+                return count
         except Exception as e:
                 print("Error merging Neoj4 database:", e)
+        return 0
 
 
+    @timed_operation
     def recover (self) :
         try :
-            log_pos = 0
+            with self.merge_lock, self.driver.session() as session:
+                log_pos = self._restore_latest_snapshot(session)
 
-            while (True) :
-                log_file_shard = log_pos // self.shard_value
-                log_file = os.path.join(self.log_file + "_" + str(log_file_shard) + self.log_file_exenstion)
-                new_log_pos = log_pos % self.shard_value
-
-                if os.path.exists(log_file):
-                    with open(log_file, "r") as f:
-                        lines = f.readlines()[new_log_pos:]
-                else:
-                    break
-
-                with open(log_file, "r") as f:
-                    lines = f.readlines()[new_log_pos:]
-
-                if (len(lines) == 0) :
-                    break
-
-                # Process each line from the log file
-                for line in lines:
-                    # Parse line to extract subject, predicate, object, and timestamp
-                    line_num, subject, predicate, obj, timestamp = line.strip().split("\t")
-                    timestamp = int(timestamp)
-
-                    with self.driver.session() as session:
-                        result = session.run("MATCH (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o) RETURN s, r, o", subject=subject, predicate=predicate)
-                        record = result.single()
-
-                        if record is None:
-                            # Insert the record into the database
-                            session.run("MERGE (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o:Object {value: $new_object, timestamp: $timestamp})", subject=subject, predicate=predicate, new_object=obj, timestamp=timestamp)
-                            self._write_to_log (subject, predicate, obj, timestamp)
-                        else:
-                            # Check if the existing record has an older timestamp
-                            existing_timestamp = int(record["o"]["timestamp"])
-                            if existing_timestamp < timestamp:
-                                session.run("MATCH (s:Subject {value: $subject})-[r:Predicate {value: $predicate}]->(o) SET o.value = $new_object, o.timestamp = $timestamp", subject=subject, predicate=predicate, new_object=obj, timestamp=timestamp)
-                                self._write_to_log (subject, predicate, obj, timestamp)
-                
-                log_pos += len (lines)
+                # Only the log suffix past the snapshot is replayed. These records come from our
+                # own log, so nothing is re-logged.
+                self._replay_records(session, self._log_reader(self.log_file).read(log_pos), log_pos, relog=False)
 
         except Exception as e:
                 print("Error merging Neoj4 database:", e)
  
+    @timed_operation
+    def compact_log(self):
+        # Only shards the writer has sealed in the manifest are rewritten
+        return compact_log(self.log_file, self.log_file_exenstion)
+
     def disconnect(self):
         try:
+            if self.log_writer:
+                self.log_writer.close()
             self.driver.close()
             print("Disconnected from Neo4j database.")
         except Exception as error:
@@ -0,0 +1,102 @@
+import json
+import socket
+import threading
+from .network_server import DEFAULT_PORT
+
+
+class network_client:
+    """Thin client for network_server.
+
+    One TCP connection, used by one request at a time (calls from several threads take
+    turns). pipeline() sends a whole list of requests in one write and then reads all the
+    answers, which costs one round trip however many requests there are. Failed requests
+    raise RuntimeError with the server's message.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rb")
+        return self
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def pipeline(self, requests):
+        """Sends requests ({"op": ..., "server": ..., arguments}) in one go; returns their results in order."""
+        with self.lock:
+            ids = []
+            lines = []
+            for request in requests:
+                self.next_id += 1
+                ids.append(self.next_id)
+                lines.append(json.dumps(dict(request, id=self.next_id)) + "\n")
+            self.sock.sendall("".join(lines).encode("utf-8"))
+
+            responses = []
+            for request_id in ids:
+                line = self.file.readline()
+                if not line:
+                    raise ConnectionError("Connection closed by the server")
+                response = json.loads(line)
+                if response.get("id") != request_id:
+                    raise ConnectionError(f"Expected the answer to request {request_id}, got {response.get('id')}")
+                responses.append(response)
+
+        # Every answer is read before raising, so the connection stays usable
+        for response in responses:
+            if not response["ok"]:
+                raise RuntimeError(response["error"])
+        return [response["result"] for response in responses]
+
+    def call(self, op, server=None, **args):
+        return self.pipeline([dict(args, op=op, server=server)])[0]
+
+    def ping(self):
+        return self.call("ping")
+
+    def stats(self):
+        """Returns the server's metrics in the Prometheus text format."""
+        return self.call("stats")
+
+    def query(self, server, subject):
+        return [tuple(row) for row in self.call("query", server, subject=subject)]
+
+    def query_many(self, server, subjects):
+        return [tuple(row) for row in self.call("query_many", server, subjects=list(subjects))]
+
+    def match(self, server, subject=None, predicate=None, object=None, limit=None):
+        return [tuple(row) for row in self.call("match", server, subject=subject, predicate=predicate, object=object, limit=limit)]
+
+    def update(self, server, subject, predicate, new_object):
+        self.call("update", server, subject=subject, predicate=predicate, object=new_object)
+
+    def update_many(self, server, triples):
+        self.call("update_many", server, triples=[list(triple) for triple in triples])
+
+    def merge(self, server, peer):
+        """Merges peer's log into server; returns the number of log records read."""
+        return self.call("merge", server, peer=peer)
+
+    def recover(self, server):
+        self.call("recover", server)
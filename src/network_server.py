@@ -0,0 +1,160 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import prometheus_text
+
+DEFAULT_PORT = 9090
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+# Requests that only read; consecutive reads on one connection may run side by side
+READ_OPS = {"ping", "stats", "query", "query_many", "match"}
+
+
+class network_server:
+    """Serves query / update / merge / recover over line-delimited JSON on TCP.
+
+    Every request is one JSON object on one line, for example
+        {"id": 1, "op": "update", "server": "mongo", "subject": "s", "predicate": "p", "object": "o"}
+    and is answered with one line, {"id": 1, "ok": true, "result": ...} or
+    {"id": 1, "ok": false, "error": "..."}. Supported ops are ping, stats (the metrics of
+    all servers in the Prometheus text format), query (subject),
+    query_many (subjects), match (any of subject, predicate, object, and limit), update (subject, predicate, object), update_many (triples),
+    merge (peer: the server whose log is merged into server) and recover.
+
+    Any number of clients may be connected, and each may pipeline requests without
+    waiting for the answers. The blocking server calls run on a pool of `workers` threads.
+    Consecutive reads on a connection run in parallel; a write waits for the requests sent
+    before it and holds back those sent after it, so a connection always reads its own
+    writes. Answers go out in request order, and all answers that are ready at the same
+    time are sent in one write. At most max_pipeline requests per connection are in flight.
+    """
+
+    def __init__(self, servers, host="127.0.0.1", port=DEFAULT_PORT, workers=16, max_pipeline=128):
+        self.servers = {server.server_name: server for server in servers}
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_pipeline = max_pipeline
+        self.executor = None
+
+    def _call(self, request):
+        op = request.get("op")
+        if op == "ping":
+            return "pong"
+        if op == "stats":
+            return prometheus_text(list(self.servers.values()))
+
+        server = self.servers.get(request.get("server"))
+        if server is None:
+            raise ValueError(f"Unknown server '{request.get('server')}'")
+
+        if op == "query":
+            return server.query(request["subject"])
+        elif op == "query_many":
+            return server.query_many(request["subjects"])
+        elif op == "match":
+            return list(server.match(request.get("subject"), request.get("predicate"), request.get("object"), request.get("limit")))
+        elif op == "update":
+            return server.update(request["subject"], request["predicate"], request["object"])
+        elif op == "update_many":
+            return server.update_many([tuple(triple) for triple in request["triples"]])
+        elif op == "merge":
+            if request["peer"] not in self.servers or request["peer"] == server.server_name:
+                raise ValueError(f"Invalid peer '{request['peer']}'")
+            return server.merge(request["peer"])
+        elif op == "recover":
+            return server.recover()
+        raise ValueError(f"Unknown op '{op}'")
+
+    def _handle(self, request):
+        # Runs on a worker thread; always returns the encoded response line
+        try:
+            response = {"id": request.get("id"), "ok": True, "result": self._call(request)}
+        except KeyError as error:
+            response = {"id": request.get("id"), "ok": False, "error": f"Missing argument {error}"}
+        except Exception as error:
+            response = {"id": request.get("id"), "ok": False, "error": str(error)}
+        return (json.dumps(response, default=str) + "\n").encode("utf-8")
+
+    async def _run(self, request, after):
+        # Waits for the requests this one is ordered after; their failures are their own
+        await asyncio.gather(*after, return_exceptions=True)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._handle, request)
+
+    async def _write_responses(self, writer, pending):
+        # pending holds the connection's tasks in request order and None once it is done.
+        # After the client went away, the remaining tasks are still drained so the reading
+        # side never blocks on a full queue.
+        connected = True
+        task = await pending.get()
+        while task is not None:
+            batch = [await task]
+            task = pending.get_nowait() if not pending.empty() else False
+            while task and task.done():
+                batch.append(task.result())
+                task = pending.get_nowait() if not pending.empty() else False
+
+            if connected:
+                try:
+                    writer.write(b"".join(batch))
+                    await writer.drain()
+                except ConnectionError:
+                    connected = False
+            if task is False:
+                task = await pending.get()
+
+    async def _serve_connection(self, reader, writer):
+        pending = asyncio.Queue(self.max_pipeline)
+        responder = asyncio.create_task(self._write_responses(writer, pending))
+        last_write = None
+        since_write = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Request is not a JSON object")
+                except ValueError as error:
+                    error_line = (json.dumps({"id": None, "ok": False, "error": f"Invalid request: {error}"}) + "\n").encode("utf-8")
+                    task = asyncio.get_running_loop().create_future()
+                    task.set_result(error_line)
+                    await pending.put(task)
+                    continue
+
+                if request.get("op") in READ_OPS:
+                    task = asyncio.create_task(self._run(request, [last_write] if last_write else []))
+                    since_write.append(task)
+                else:
+                    task = asyncio.create_task(self._run(request, since_write + ([last_write] if last_write else [])))
+                    last_write = task
+                    since_write = []
+                await pending.put(task)
+
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as error:
+            print("Closing client connection:", error)
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+
+    async def serve(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            listener = await asyncio.start_server(self._serve_connection, self.host, self.port, limit=MAX_LINE_BYTES)
+            print(f"Serving {', '.join(self.servers)} on {self.host}:{self.port}")
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Stopping network server.")
@@ -1,50 +1,133 @@
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+import io
 import time
 import os
 import sys
+import threading
 import subprocess
-from .server_interface import server
+from .server_interface import server, log_replay
+from .metrics import registry, timed_operation
+from .log_reader import log_reader
+from .log_writer import log_writer, FSYNC_INTERVAL
+from .log_compaction import compact_log
+from .snapshot import write_snapshot, list_snapshots, read_snapshot, prune_snapshots
+from .log_format import TEXT_FORMAT, newest_per_key
+from .triple_file import read_triple_batches, stamp_triples
+
+
+class timed_cursor(psycopg2.extensions.cursor):
+    # Every statement is one round trip to the database, recorded as backend_round_trip_seconds
+    def execute(self, query, vars=None):
+        with registry.timer("backend_round_trip_seconds", server="postgres", call="execute"):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with registry.timer("backend_round_trip_seconds", server="postgres", call="executemany"):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        with registry.timer("backend_round_trip_seconds", server="postgres", call="copy"):
+            return super().copy_expert(sql, file, size)
 
 
 class postgres_server (server):
-    def __init__(self, host, port, database, user, password):
+    """Triple store on PostgreSQL.
+
+    Every call borrows a connection from a ThreadedConnectionPool of up to pool_size
+    connections and returns it when done, so queries and updates from several threads run
+    side by side, also while a merge is in progress. merge(), recover() and apply_triples()
+    are serialized by merge_lock, since they share the version vector.
+
+    The triples table may be hash-partitioned by subject (see initialize.py). Statements stay
+    the same: lookups by subject are pruned to one partition and ON CONFLICT upserts are
+    routed to the key's partition.
+    """
+
+    def __init__(self, host, port, database, user, password, merge_batch_size=1000, merge_commit_batches=1, log_format=TEXT_FORMAT,
+                 fsync_policy=FSYNC_INTERVAL, fsync_every=100, fsync_interval_ms=50, snapshots_kept=2,
+                 segment_bytes=64 * 1024 * 1024, segment_records=None, load_batch_size=10000, key_index=None, pool_size=8):
         self.server_name = "postgres"
         self.host = host
         self.port = port
         self.database = database
         self.user = user
         self.password = password
-        self.conn = None
-        self.sequence_number = None
+        self.pool_size = pool_size
+        self.pool = None
+        self.checkpoint_conn = None
+        self.pool_slots = threading.BoundedSemaphore(pool_size)
+        self.merge_lock = threading.Lock()
         self.log_file = "postgres"
-        self.log_file_shard = None
-        self.current_log_file = None
-        self.shard_value = 100
+        self.log_writer = None
+        self.segment_bytes = segment_bytes
+        self.segment_records = segment_records
         self.log_file_exenstion = ".log"
+        self.log_format = log_format
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval_ms = fsync_interval_ms
+        self.log_readers = {}
+        self.merge_batch_size = merge_batch_size
+        self.merge_commit_batches = merge_commit_batches
+        self.snapshots_kept = snapshots_kept
+        self.load_batch_size = load_batch_size
+        self.version_vector = {}
+        self.key_index = key_index
+
+    @property
+    def sequence_number(self):
+        return self.log_writer.sequence_number if self.log_writer else None
     
+    @contextmanager
+    def _connection(self):
+        # Borrows a pooled connection; whatever the caller did not commit is rolled back
+        # before it goes back, so no connection returns to the pool inside a transaction
+        # ThreadedConnectionPool raises instead of waiting when it is exhausted, so callers
+        # first wait for one of pool_size slots
+        with self.pool_slots:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+                self.pool.putconn(conn, close=bool(conn.closed))
+
     def connect(self):
         try:
-            self.conn = psycopg2.connect(host=self.host, port=self.port, database=self.database, user=self.user, password=self.password)
+            self.pool = ThreadedConnectionPool(1, self.pool_size, host=self.host, port=self.port, database=self.database, user=self.user, password=self.password,
+                                               cursor_factory=timed_cursor)
             print("Connected to PostgreSQL database!")
 
             try:
-                cur = self.conn.cursor()
-                cur.execute("SELECT log_position FROM log_positions WHERE server_name = 'postgres'")
-                postgres_row = cur.fetchone()
+                with self._connection() as conn:
+                    cur = conn.cursor()
+                    cur.execute("SELECT log_position FROM log_positions WHERE server_name = 'postgres'")
+                    postgres_row = cur.fetchone()
+                    cur.execute("SELECT origin, origin_seq FROM version_vector")
+                    self.version_vector = dict(cur.fetchall())
+                    cur.close()
+
                 if postgres_row:
-                    self.sequence_number = postgres_row[0]
+                    stored_sequence_number = postgres_row[0]
                 else:
-                    cur.close()
                     self.disconnect()
                     sys.exit("Error: 'log_positions' table not initialized for PostgreSQL. Exiting...")
 
-
                 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
                 logs_dir = os.path.join(parent_dir, "logs")
                 self.log_file = os.path.join(logs_dir, self.log_file)
-                self._update_log_shard ()
 
-                cur.close()
+                # Log positions are checkpointed from the writer's thread on a pooled connection,
+                # so a checkpoint never commits a transaction that is in flight elsewhere
+                self.log_writer = log_writer(self.log_file, self.segment_bytes, self.segment_records, self.log_file_exenstion, self.log_format,
+                                             self.fsync_policy, self.fsync_every, self.fsync_interval_ms,
+                                             checkpoint=self._checkpoint_log_position)
+                self.log_writer.open(stored_sequence_number)
+                self._build_key_index()
 
             except psycopg2.Error as error:
                 print("Error querying database:", error)
@@ -52,40 +135,35 @@ class postgres_server (server):
         except psycopg2.Error as error:
             print("Error connecting to PostgreSQL database:", error)
     
-    def _update_log_shard (self) :
-        self.log_file_shard = self.sequence_number // self.shard_value
-        self.current_log_file = self.log_file + "_" + str(self.log_file_shard) + self.log_file_exenstion
-        if os.path.exists(self.current_log_file):
-                pass
-        else:
-            with open(self.current_log_file, "w") as file:
-                pass
-
-        
     def _write_to_log(self, subject, predicate, new_object, timestamp):
         try:
-            with open(self.current_log_file, "a") as file:
-                self.sequence_number += 1
-                log_entry = f"{self.sequence_number}\t{subject}\t{predicate}\t{new_object}\t{timestamp}\n"
-                file.write(log_entry)
-
-                cur = self.conn.cursor()
-                cur.execute("UPDATE log_positions SET log_position = %s WHERE server_name = %s", (self.sequence_number, self.server_name))
-                self.conn.commit()
-
-                cur.close()
+            self.log_writer.append(subject, predicate, new_object, timestamp)
+        except Exception as error:
+            print("Error writing to log file:", error)
 
-            if (self.sequence_number % self.shard_value == 0) :
-                self._update_log_shard()
+    def _write_many_to_log(self, rows):
+        try:
+            self.log_writer.append_many(rows)
         except Exception as error:
             print("Error writing to log file:", error)
+
+    def _checkpoint_log_position(self, sequence_number):
+        # Runs on the log writer's thread on a connection of its own, outside the pool, so
+        # interval fsyncs never wait for a pool slot
+        if self.checkpoint_conn is None or self.checkpoint_conn.closed:
+            self.checkpoint_conn = psycopg2.connect(host=self.host, port=self.port, database=self.database, user=self.user, password=self.password,
+                                                    cursor_factory=timed_cursor)
+        with self.checkpoint_conn, self.checkpoint_conn.cursor() as cur:
+            cur.execute("UPDATE log_positions SET log_position = %s WHERE server_name = %s", (sequence_number, self.server_name))
     
+    @timed_operation
     def query(self, subject):
         try:
-            cur = self.conn.cursor()
-            cur.execute("SELECT subject, predicate, object, timestamp FROM triples WHERE subject = %s", (subject,))
-            rows = cur.fetchall()
-            cur.close()
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT subject, predicate, object, timestamp FROM triples WHERE subject = %s", (subject,))
+                rows = cur.fetchall()
+                cur.close()
             if rows:
                 return rows
             else:
@@ -94,155 +172,321 @@ class postgres_server (server):
             print("Error querying database:", error)
             return []
 
+    @timed_operation
+    def query_many(self, subjects):
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT subject, predicate, object, timestamp FROM triples WHERE subject = ANY(%s)", (list(subjects),))
+                rows = cur.fetchall()
+                cur.close()
+            return rows
+        except psycopg2.Error as error:
+            print("Error querying database:", error)
+            return []
     
+    def match(self, subject=None, predicate=None, object=None, limit=None):
+        # Triple pattern query; None matches anything. Rows stream through a server-side
+        # cursor merge_batch_size at a time, and the pooled connection is held until the
+        # generator is exhausted or closed.
+        conditions = []
+        params = []
+        for column, value in (("subject", subject), ("predicate", predicate), ("object", object)):
+            if value is not None:
+                conditions.append(f"{column} = %s")
+                params.append(value)
+        sql = "SELECT subject, predicate, object, timestamp FROM triples"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(limit)
+
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor(name="triples_match")
+                cur.itersize = self.merge_batch_size
+                cur.execute(sql, params)
+                for row in cur:
+                    yield row
+                cur.close()
+        except psycopg2.Error as error:
+            print("Error querying database:", error)
+
+    @timed_operation
     def update(self, subject, predicate, new_object):
         try:
-            cur = self.conn.cursor()
-            timestamp = int(time.time() * 1000)  # Current Unix Epoch Milliseconds
-            cur.execute("INSERT INTO triples (subject, predicate, object, timestamp) VALUES (%s, %s, %s, %s) ON CONFLICT (subject, predicate) DO UPDATE SET object = %s, timestamp = %s", (subject, predicate, new_object, timestamp, new_object, timestamp))
-            self.conn.commit()
-            self._write_to_log(subject, predicate, new_object, timestamp)
-            cur.close()
+            with self._locked_keys([(subject, predicate)]), self._connection() as conn:
+                cur = conn.cursor()
+                timestamp = int(time.time() * 1000)  # Current Unix Epoch Milliseconds
+                cur.execute("INSERT INTO triples (subject, predicate, object, timestamp) VALUES (%s, %s, %s, %s) ON CONFLICT (subject, predicate) DO UPDATE SET object = %s, timestamp = %s", (subject, predicate, new_object, timestamp, new_object, timestamp))
+                conn.commit()
+                self._write_to_log(subject, predicate, new_object, timestamp)
+                cur.close()
+            self._notify_change([(subject, predicate, new_object, timestamp)])
         except psycopg2.Error as error:
             print("Error updating triple:", error)
-            self.conn.rollback()
-
 
-    def merge(self, server_name):
+    @timed_operation
+    def update_many(self, triples):
+        # One timestamp and one statement for the whole batch; only the last triple per key is written
         try:
-            cur = self.conn.cursor()
-            # Fetch log position for the other server
-            cur.execute("SELECT log_position FROM log_positions WHERE server_name = %s", (server_name,))
-            log_position = cur.fetchone()
-
-            if log_position is None:
-                raise ValueError(f"Log position not found for '{server_name}' server")
-
-            # Read log file from the last read position + 1
-            parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-            logs_dir = os.path.join(parent_dir, "logs")
-            log_pos = log_position[0]
-
-            while (True) :
-                log_file_shard = log_pos // self.shard_value
-                log_file = os.path.join(logs_dir, server_name + "_" + str(log_file_shard) + self.log_file_exenstion)
-                new_log_pos = log_pos % self.shard_value
-
-                if os.path.exists(log_file):
-                    with open(log_file, "r") as f:
-                        lines = f.readlines()[new_log_pos:]
-                else:
-                    break
-
-                with open(log_file, "r") as f:
-                    lines = f.readlines()[new_log_pos:]
-
-                if (len(lines) == 0) :
-                    break
-
-                for line in lines:
-                    line_num, subject, predicate, obj, timestamp = line.strip().split("\t")
-                    timestamp = int(timestamp)
+            triples = list(triples)
+            with self._locked_keys([triple[:2] for triple in triples]), self._connection() as conn:
+                cur = conn.cursor()
+                timestamp = int(time.time() * 1000)
+                rows = stamp_triples(triples, timestamp)
+                if rows:
+                    execute_values(cur, """
+                        INSERT INTO triples (subject, predicate, object, timestamp) VALUES %s
+                        ON CONFLICT (subject, predicate) DO UPDATE SET object = EXCLUDED.object, timestamp = EXCLUDED.timestamp
+                        """, sorted(rows), page_size=len(rows))
+                conn.commit()
+                self._write_many_to_log(rows)
+                cur.close()
+            self._notify_change(rows)
+        except psycopg2.Error as error:
+            print("Error updating triples:", error)
+
+    def _copy_text(self, value):
+        # Escapes a value for COPY's text format
+        return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+    @timed_operation
+    def load(self, file_path):
+        # Each batch is COPYed into a temporary staging table and upserted from there in one
+        # statement; rows are logged with one append per batch once the batch is committed
+        # Like update(), a batch takes its key stripes before a pooled connection
+        loaded = 0
+        try:
+            for rows in read_triple_batches(file_path, self.load_batch_size):
+                buf = io.StringIO()
+                for row in rows:
+                    buf.write("\t".join(self._copy_text(value) for value in row) + "\n")
+                buf.seek(0)
+                with self._locked_keys([row[:2] for row in rows]), self._connection() as conn:
+                    cur = conn.cursor()
+                    cur.execute("CREATE TEMP TABLE IF NOT EXISTS triples_staging (LIKE triples) ON COMMIT DELETE ROWS")
+                    cur.copy_expert("COPY triples_staging (subject, predicate, object, timestamp) FROM STDIN", buf)
+                    cur.execute("""
+                        INSERT INTO triples (subject, predicate, object, timestamp)
+                        SELECT subject, predicate, object, timestamp FROM triples_staging
+                        ON CONFLICT (subject, predicate) DO UPDATE SET object = EXCLUDED.object, timestamp = EXCLUDED.timestamp
+                        """)
+                    conn.commit()
+                    cur.close()
+                    self.log_writer.append_many(rows)
+                self._notify_change(rows)
+                loaded += len(rows)
 
-                    # Check if the record exists in the PostgreSQL database
-                    cur.execute("SELECT * FROM triples WHERE subject = %s AND predicate = %s", (subject, predicate))
-                    record = cur.fetchone()
+        except psycopg2.Error as e:
+            print("Error during load:", e)
+        except Exception as e:
+            print("Unexpected error:", e)
+        return loaded
 
-                    # If record not found, insert it
-                    if record is None:
-                        # Insert the record into the database
-                        cur.execute("INSERT INTO triples (subject, predicate, object, timestamp) VALUES (%s, %s, %s, %s)", (subject, predicate, obj, timestamp))
-                        self.conn.commit()
+    def log_positions(self):
+        # Our own row holds our checkpointed sequence number, the others how far we have read each peer
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT server_name, log_position FROM log_positions")
+                rows = cur.fetchall()
+                cur.close()
+            return dict(rows)
+        except psycopg2.Error as error:
+            print("Error querying database:", error)
+            return {}
+
+    def _log_reader(self, log_file):
+        # One reader per log, so its sparse offset index stays loaded between merges
+        if log_file not in self.log_readers:
+            self.log_readers[log_file] = log_reader(log_file, self.log_file_exenstion)
+        return self.log_readers[log_file]
+
+    def _apply_log_batch(self, cur, records):
+        # Last-writer-wins for a whole batch in one statement. Only one row per key may
+        # reach ON CONFLICT DO UPDATE, so the batch is first reduced to its newest record
+        # per (subject, predicate); ties keep the earlier record, as a strict < comparison would.
+        # Rows may carry trailing origin fields; the rows that changed are returned whole.
+        # Rows are sent in key order, so concurrent batches lock keys in the same order.
+        latest = newest_per_key(records)
+
+        if not latest:
+            return []
 
-                        self._write_to_log (subject, predicate, obj, timestamp)
-                    else:
-                        # Check if the existing record has an older timestamp
-                        existing_timestamp = int(record[3])
-                        if existing_timestamp < timestamp:
-                            # Update the record with the newer timestamp
-                            cur.execute("INSERT INTO triples (subject, predicate, object, timestamp) VALUES (%s, %s, %s, %s) ON CONFLICT (subject, predicate) DO UPDATE SET object = %s, timestamp = %s", (subject, predicate, obj, timestamp, obj, timestamp))
-                            self.conn.commit()
-                            self._write_to_log (subject, predicate, obj, timestamp)
+        changed = execute_values(cur, """
+            INSERT INTO triples (subject, predicate, object, timestamp) VALUES %s
+            ON CONFLICT (subject, predicate) DO UPDATE SET object = EXCLUDED.object, timestamp = EXCLUDED.timestamp
+            WHERE triples.timestamp < EXCLUDED.timestamp
+            RETURNING subject, predicate
+            """, sorted(row[:4] for row in latest.values()), page_size=len(latest), fetch=True)
+
+        # RETURNING order is unspecified; re-log in the order the records were read
+        changed = {(subject, predicate) for subject, predicate in changed}
+        return [row for key, row in latest.items() if key in changed]
+
+    @timed_operation
+    def apply_triples(self, rows):
+        # Last-writer-wins for rows from outside the logs (Merkle repair); the rows that win
+        # are logged once committed so other nodes pick them up. Returns how many won.
+        try:
+            with self.merge_lock, self._connection() as conn:
+                cur = conn.cursor()
+                changed = []
+                for i in range(0, len(rows), self.merge_batch_size):
+                    changed.extend(row[:4] for row in self._apply_log_batch(cur, rows[i:i + self.merge_batch_size]))
+                conn.commit()
+                self._write_many_to_log(changed)
+                cur.close()
+            self._notify_change(changed)
+            return len(changed)
+        except psycopg2.Error as e:
+            print("Error applying triples:", e)
+            return 0
+
+    def _replay_records(self, cur, records, log_pos, server_name=None, relog=True):
+        # Applies log records from log_pos on in batches of merge_batch_size and commits every
+        # merge_commit_batches batches. Changed rows are re-logged only once their batch is
+        # committed, so every logged record is already visible to a snapshot. When replaying a
+        # peer's log, the peer's position and version vector advances are stored with each
+        # commit so an interrupted merge resumes from there. log_replay decides which records
+        # are applied. Returns the last position read and the number of records read.
+        replay = log_replay(self.server_name, self.version_vector, self.merge_batch_size, log_pos, server_name, self.key_index)
+        changed = []
+        unsaved = {}
+        batches_since_commit = 0
+
+        def commit(log_pos):
+            nonlocal changed, unsaved, batches_since_commit
+            if server_name is not None:
+                cur.execute("UPDATE log_positions SET log_position = %s WHERE server_name = %s", (log_pos, server_name))
+                if unsaved:
+                    execute_values(cur, """
+                        INSERT INTO version_vector (origin, origin_seq) VALUES %s
+                        ON CONFLICT (origin) DO UPDATE SET origin_seq = GREATEST(version_vector.origin_seq, EXCLUDED.origin_seq)
+                        """, list(unsaved.items()))
+            cur.connection.commit()
+            replay.saved(unsaved)
+            unsaved = {}
+            self._count_merge_records(server_name, applied=len(changed), relogged=len(changed) if relog else 0)
+            if changed and relog:
+                self.log_writer.append_many(changed)
+            if changed:
+                self._notify_change(changed)
+            changed = []
+            batches_since_commit = 0
+
+        def flush_batch(rows, log_pos, advances):
+            nonlocal batches_since_commit
+            changed.extend(self._apply_log_batch(cur, rows))
+            unsaved.update(advances)
+            batches_since_commit += 1
+
+            if batches_since_commit >= self.merge_commit_batches:
+                commit(log_pos)
+
+        log_pos, count = replay.run(records, flush_batch)
+        if batches_since_commit:
+            commit(log_pos)
+
+        self._count_merge_records(server_name, read=count, skipped=replay.skipped)
+        return log_pos, count
+
+    def _restore_latest_snapshot(self, cur):
+        # Restores the newest snapshot that reads back intact and returns the sequence number
+        # it reflects, or 0 if there is none. Its rows are already in our own log.
+        for sequence_number, path in list_snapshots(self.log_file):
+            try:
+                self._replay_records(cur, read_snapshot(path), 0, relog=False)
+                return sequence_number
+            except ValueError as error:
+                print("Skipping damaged snapshot:", error)
+        return 0
+
+    def _dump_triples(self):
+        # Streams the table through a server-side cursor inside a read-only snapshot
+        # transaction, on a connection of its own so update() and merge() are never blocked
+        conn = psycopg2.connect(host=self.host, port=self.port, database=self.database, user=self.user, password=self.password)
+        try:
+            conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+            cur = conn.cursor(name="triples_snapshot")
+            cur.itersize = self.merge_batch_size
+            cur.execute("SELECT subject, predicate, object, timestamp FROM triples")
+            for row in cur:
+                yield row
+            cur.close()
+            conn.commit()
+        finally:
+            conn.close()
+
+    @timed_operation
+    def snapshot(self):
+        # Every record up to the current sequence number is committed before the dump starts;
+        # rows changed while it runs are replayed again on recover, which is harmless
+        sequence_number = self.sequence_number
+        path = write_snapshot(self.log_file, sequence_number, self._dump_triples())
+        prune_snapshots(self.log_file, self.snapshots_kept)
+        return path
+
+    @timed_operation
+    def merge(self, server_name):
+        # Uncommitted work is rolled back when the connection goes back to the pool
+        try:
+            with self.merge_lock, self._connection() as conn:
+                cur = conn.cursor()
+                # Fetch log position for the other server
+                cur.execute("SELECT log_position FROM log_positions WHERE server_name = %s", (server_name,))
+                log_position = cur.fetchone()
 
-                log_pos += len(lines)
-                # Update log position for the current server
+                if log_position is None:
+                    raise ValueError(f"Log position not found for '{server_name}' server")
 
-            cur.execute("UPDATE log_positions SET log_position = %s WHERE server_name = %s", (log_pos, server_name))
-            self.conn.commit()
+                # Read log file from the last read position + 1
+                parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+                logs_dir = os.path.join(parent_dir, "logs")
+                log_file = os.path.join(logs_dir, server_name)
+                _, count = self._replay_records(cur, self._log_reader(log_file).read(log_position[0]), log_position[0], server_name)
+                cur.close()
+                return count
 
         except psycopg2.Error as e:
             print("Error during merge:", e)
-            self.conn.rollback()  # Rollback transaction in case of error
         except Exception as e:
             print("Unexpected error:", e)
-            self.conn.rollback()  # Rollback transaction for any unexpected errors
-        finally:
-            if cur:
-                cur.close()  # Close cursor
+        return 0
 
+    @timed_operation
     def recover(self):
         try:
-            cur = self.conn.cursor()
-            log_pos = 0
-
-            while (True) :
-                log_file_shard = log_pos // self.shard_value
-                log_file = os.path.join(self.log_file + "_" + str(log_file_shard) + self.log_file_exenstion)
-                new_log_pos = log_pos % self.shard_value
-
-                if os.path.exists(log_file):
-                    with open(log_file, "r") as f:
-                        lines = f.readlines()[new_log_pos:]
-                else:
-                    break
-
-                with open(log_file, "r") as f:
-                    lines = f.readlines()[new_log_pos:]
-
-                if (len(lines) == 0) :
-                    break
-
-                for line in lines:
-                    line_num, subject, predicate, obj, timestamp = line.strip().split("\t")
-                    timestamp = int(timestamp)
-
-                    # Check if the record exists in the PostgreSQL database
-                    cur.execute("SELECT * FROM triples WHERE subject = %s AND predicate = %s", (subject, predicate))
-                    record = cur.fetchone()
+            with self.merge_lock, self._connection() as conn:
+                cur = conn.cursor()
+                log_pos = self._restore_latest_snapshot(cur)
 
-                    # If record not found, insert it
-                    if record is None:
-                        # Insert the record into the database
-                        cur.execute("INSERT INTO triples (subject, predicate, object, timestamp) VALUES (%s, %s, %s, %s)", (subject, predicate, obj, timestamp))
-                        self.conn.commit()
-
-                        self._write_to_log (subject, predicate, obj, timestamp)
-                    else:
-                        # Check if the existing record has an older timestamp
-                        existing_timestamp = int(record[3])
-                        if existing_timestamp < timestamp:
-                            # Update the record with the newer timestamp
-                            cur.execute("INSERT INTO triples (subject, predicate, object, timestamp) VALUES (%s, %s, %s, %s) ON CONFLICT (subject, predicate) DO UPDATE SET object = %s, timestamp = %s", (subject, predicate, obj, timestamp, obj, timestamp))
-                            self.conn.commit()
-                            self._write_to_log (subject, predicate, obj, timestamp)
-
-                log_pos += len(lines)
-                # Update log position for the current server
+                # Only the log suffix past the snapshot is replayed. These records come from our
+                # own log, so nothing is re-logged.
+                self._replay_records(cur, self._log_reader(self.log_file).read(log_pos), log_pos, relog=False)
+                cur.close()
 
         except psycopg2.Error as e:
             print("Error during recover:", e)
-            self.conn.rollback()  # Rollback transaction in case of error
         except Exception as e:
             print("Unexpected error:", e)
-            self.conn.rollback()  # Rollback transaction for any unexpected errors
-        finally:
-            if cur:
-                cur.close()  # Close cursor
         
     
+    @timed_operation
+    def compact_log(self):
+        # Only shards the writer has sealed in the manifest are rewritten
+        return compact_log(self.log_file, self.log_file_exenstion)
+
     def disconnect(self):
         try:
-            self.conn.close()
+            if self.log_writer:
+                self.log_writer.close()
+            if self.checkpoint_conn:
+                self.checkpoint_conn.close()
+            if self.pool:
+                self.pool.closeall()
             print("Disconnected from PostgreSQL database.")
         except psycopg2.Error as error:
             print("Error disconnecting from PostgreSQL database:", error)
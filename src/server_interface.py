@@ -1,4 +1,15 @@
+import threading
 from abc import ABC, abstractmethod
+from contextlib import ExitStack
+from .metrics import registry
+from .log_format import record_origin
+
+# update(), update_many() and load() overwrite unconditionally, so two threads writing the
+# same key must commit and log in timestamp order; they hold the key's lock stripe to do so.
+# Every server has KEY_LOCK_STRIPES stripes of its own.
+KEY_LOCK_STRIPES = 64
+_stripes_created = threading.Lock()
+
 
 class server (ABC):
     @abstractmethod
@@ -6,30 +17,164 @@ class server (ABC):
         pass
     
     @abstractmethod
-    def _write_to_log(self, subject, predicate, new_object):
+    def _write_to_log(self, subject, predicate, new_object, timestamp):
         pass
 
     @abstractmethod
-    def _update_log_shard (self, subject, predicate, new_object):
+    def query(self, subject):
+        pass
+    
+    @abstractmethod
+    def query_many(self, subjects):
         pass
 
     @abstractmethod
-    def query(self, subject):
+    def match(self, subject=None, predicate=None, object=None, limit=None):
         pass
-    
+
     @abstractmethod
     def update(self, subject, predicate, new_object):
         pass
+
+    @abstractmethod
+    def update_many(self, triples):
+        pass
     
+    @abstractmethod
+    def load(self, file_path):
+        pass
+
     @abstractmethod
     def merge (self, server_name) :
         pass
 
+    @abstractmethod
+    def log_positions (self) :
+        pass
+
+    @abstractmethod
+    def apply_triples (self, rows) :
+        pass
+
     @abstractmethod
     def recover (self) :
         pass
 
+    @abstractmethod
+    def snapshot (self) :
+        pass
+
+    @abstractmethod
+    def compact_log (self) :
+        pass
+
     @abstractmethod
     def disconnect(self):
         pass
 
+    def add_change_listener(self, listener):
+        # listener(rows) is called with the (subject, predicate, object, timestamp) rows of
+        # every write once it is committed, including rows changed by merge() and recover()
+        self.__dict__.setdefault("change_listeners", []).append(listener)
+
+    def _notify_change(self, rows):
+        for listener in self.__dict__.get("change_listeners", ()):
+            listener(rows)
+
+    def _count_merge_records(self, source, **outcomes):
+        # Adds to merge_records_total per outcome; source is the peer whose log is replayed,
+        # or None for our own log during recover()
+        for outcome, records in outcomes.items():
+            registry.increment("merge_records_total", records, server=self.server_name, source=source or self.server_name, outcome=outcome)
+
+    def _build_key_index(self):
+        # Fills the optional key_index from the current triples and keeps it current from then
+        # on; connect() calls this on every reconnect, but the listener is registered once
+        if getattr(self, "key_index", None) is not None:
+            self.key_index.build(self._dump_triples())
+            if self.key_index.record_rows not in self.__dict__.get("change_listeners", ()):
+                self.add_change_listener(self.key_index.record_rows)
+
+    def _locked_keys(self, keys):
+        # Holds the lock stripes of the given (subject, predicate) keys, taken in a fixed order
+        stripes = self.__dict__.get("key_lock_stripes")
+        if stripes is None:
+            with _stripes_created:
+                stripes = self.__dict__.setdefault("key_lock_stripes", [threading.Lock() for _ in range(KEY_LOCK_STRIPES)])
+        stack = ExitStack()
+        for stripe in sorted({hash((subject, predicate)) % KEY_LOCK_STRIPES for subject, predicate in keys}):
+            stack.enter_context(stripes[stripe])
+        return stack
+
+
+class log_replay:
+    """Filters the records of one log replay into the batches a server applies.
+
+    A peer's records that originated at this server, or that were already seen from their
+    origin according to the version vector, are skipped without touching the database.
+    With a key_index, so are a peer's records no newer than what the database holds. A
+    replay of our own log (peer None, as in recover()) keeps every record: after data loss
+    the index is ahead of the database.
+
+    run() calls flush(rows, log_pos, advances) for every batch of up to batch_size rows of
+    (subject, predicate, object, timestamp, origin, origin_seq). log_pos is the position of
+    the last record read and advances are the version vector entries the batch moves. The
+    flush stores both with the batch and then passes advances to saved(). A replay of a
+    peer flushes once more at the end, so a suffix of skipped records still moves the
+    stored position. Replays into one server must not overlap; servers hold their
+    merge_lock around them.
+    """
+
+    def __init__(self, server_name, version_vector, batch_size, log_pos, peer=None, key_index=None):
+        self.server_name = server_name
+        self.version_vector = version_vector
+        self.batch_size = batch_size
+        self.log_pos = log_pos
+        self.peer = peer
+        self.key_index = key_index
+        self.seen = dict(version_vector)
+        self.batch = []
+        self.advances = {}
+        self.count = 0
+        self.skipped = 0
+
+    def add(self, record):
+        # Takes one record; returns whether a full batch is ready
+        self.log_pos = record.seq
+        self.count += 1
+        origin, origin_seq = record_origin(record, self.peer or self.server_name)
+        if self.peer is not None:
+            if origin == self.server_name or origin_seq <= self.seen.get(origin, 0):
+                self.skipped += 1
+                return False
+            self.seen[origin] = self.advances[origin] = origin_seq
+            if self.key_index is not None and self.key_index.is_stale(record.subject, record.predicate, record.timestamp):
+                self.skipped += 1
+                return False
+
+        self.batch.append((record.subject, record.predicate, record.object, record.timestamp, origin, origin_seq))
+        return len(self.batch) >= self.batch_size
+
+    def last_flush_due(self):
+        return bool(self.batch) or self.peer is not None
+
+    def take(self):
+        # The arguments of the next flush; starts a new batch
+        rows, advances = self.batch, self.advances
+        self.batch, self.advances = [], {}
+        return rows, self.log_pos, advances
+
+    def saved(self, advances):
+        # Called once advances are stored; an origin's entry never moves back
+        for origin, origin_seq in advances.items():
+            if origin_seq > self.version_vector.get(origin, 0):
+                self.version_vector[origin] = origin_seq
+
+    def run(self, records, flush):
+        """Replays records through flush(); returns the last position read and the number of records read."""
+        for record in records:
+            if self.add(record):
+                flush(*self.take())
+        if self.last_flush_due():
+            flush(*self.take())
+        return self.log_pos, self.count
@@ -0,0 +1,112 @@
+import os
+import json
+import mmap
+import glob
+import threading
+from .log_format import BINARY_FORMAT, BINARY_HEADER, encode_record, iter_binary_records
+
+SNAPSHOT_EXTENSION = ".snap"
+
+
+def snapshot_file(log_file, sequence_number):
+    return f"{log_file}_snapshot_{sequence_number}{SNAPSHOT_EXTENSION}"
+
+
+def _metadata_file(path):
+    return path + ".json"
+
+
+def write_snapshot(log_file, sequence_number, triples):
+    """Writes (subject, predicate, object, timestamp) rows as a snapshot reflecting sequence_number.
+
+    The dump uses the binary log encoding (one checksummed record per triple, all tagged
+    with sequence_number). It is written to a temporary file and renamed into place, and
+    its metadata file is written last, so a snapshot without metadata is never trusted.
+    """
+    path = snapshot_file(log_file, sequence_number)
+    tmp_file = path + ".tmp"
+    records = 0
+    with open(tmp_file, "wb") as out:
+        out.write(BINARY_HEADER)
+        for subject, predicate, obj, timestamp in triples:
+            out.write(encode_record(BINARY_FORMAT, sequence_number, subject, predicate, obj, int(timestamp)))
+            records += 1
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_file, path)
+
+    tmp_metadata = _metadata_file(path) + ".tmp"
+    with open(tmp_metadata, "w") as f:
+        json.dump({"sequence_number": sequence_number, "records": records, "bytes": os.path.getsize(path)}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_metadata, _metadata_file(path))
+    return path
+
+
+def list_snapshots(log_file):
+    """Returns [(sequence_number, path)] of the complete snapshots of log_file, newest first."""
+    snapshots = []
+    for path in glob.glob(glob.escape(log_file) + "_snapshot_*" + SNAPSHOT_EXTENSION):
+        try:
+            with open(_metadata_file(path), "r") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if os.path.getsize(path) == metadata["bytes"]:
+            snapshots.append((metadata["sequence_number"], path))
+    return sorted(snapshots, reverse=True)
+
+
+def read_snapshot(path):
+    """Yields the snapshot's rows as log records; raises ValueError if the snapshot is damaged."""
+    with open(_metadata_file(path), "r") as f:
+        expected = json.load(f)["records"]
+
+    records = 0
+    if os.path.getsize(path) > len(BINARY_HEADER):
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            buf = memoryview(mapped)
+            try:
+                for _, _, record in iter_binary_records(buf, len(BINARY_HEADER), path):
+                    records += 1
+                    yield record
+            finally:
+                buf.release()
+
+    if records != expected:
+        raise ValueError(f"Snapshot '{path}' holds {records} records, expected {expected}")
+
+
+def prune_snapshots(log_file, keep=2):
+    for _, path in list_snapshots(log_file)[keep:]:
+        os.remove(_metadata_file(path))
+        os.remove(path)
+
+
+class snapshotter:
+    """Runs server.snapshot() every interval_s seconds on a daemon thread."""
+
+    def __init__(self, server, interval_s=600):
+        self.server = server
+        self.interval_s = interval_s
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval_s):
+            try:
+                self.server.snapshot()
+            except Exception as error:
+                print("Error creating snapshot:", error)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="snapshotter-" + self.server.server_name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,57 @@
+import time
+
+
+def parse_triple_line(line):
+    """Splits one line of a triple file into (subject, predicate, object), or None if it holds no triple.
+
+    Lines are tab-separated if they contain a tab, otherwise space-separated as in the YAGO
+    dumps. Only the first two separators split, so an object may contain spaces.
+    """
+    line = line.rstrip("\r\n")
+    if not line.strip():
+        return None
+    fields = line.split("\t", 2) if "\t" in line else line.split(" ", 2)
+    if len(fields) != 3 or not fields[0] or not fields[1]:
+        raise ValueError(f"Expected subject, predicate and object, got '{line}'")
+    return fields[0], fields[1], fields[2]
+
+
+def stamp_triples(triples, timestamp):
+    """Returns (subject, predicate, object, timestamp) rows for triples, keeping the last one per (subject, predicate)."""
+    latest = {}
+    for subject, predicate, obj in triples:
+        # Re-inserting moves a repeated key behind the triples seen since its first occurrence
+        latest.pop((subject, predicate), None)
+        latest[(subject, predicate)] = obj
+    return [(subject, predicate, obj, timestamp) for (subject, predicate), obj in latest.items()]
+
+
+def read_triple_batches(file_path, batch_size=10000):
+    """Streams a triple file as lists of (subject, predicate, object, timestamp) rows.
+
+    Each batch holds up to batch_size lines and is stamped with a single timestamp, strictly
+    greater than the previous batch's, so the file loads as if every line had been passed
+    to update() in order: within a batch only the last line for a (subject, predicate) is
+    kept. Malformed lines are reported and skipped.
+    """
+    previous_timestamp = 0
+    with open(file_path, "r", encoding="utf-8") as f:
+        triples = []
+        for line_number, line in enumerate(f, 1):
+            try:
+                triple = parse_triple_line(line)
+            except ValueError as error:
+                print(f"Skipping line {line_number} of '{file_path}':", error)
+                continue
+            if triple is None:
+                continue
+
+            triples.append(triple)
+            if len(triples) >= batch_size:
+                previous_timestamp = max(int(time.time() * 1000), previous_timestamp + 1)
+                yield stamp_triples(triples, previous_timestamp)
+                triples = []
+
+        if triples:
+            previous_timestamp = max(int(time.time() * 1000), previous_timestamp + 1)
+            yield stamp_triples(triples, previous_timestamp)
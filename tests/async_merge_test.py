@@ -0,0 +1,69 @@
+import asyncio
+import tempfile
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.async_memory_server import async_memory_server
+from src.async_server_interface import merge_concurrently
+from src.triple_file import parse_triple_line
+
+
+def read_yago_dataset(file_path):
+    with open(file_path, encoding='utf-8') as f:
+        for line in f:
+            triple = parse_triple_line(line)
+            if triple:
+                yield triple
+
+
+def check_data_consistency(servers):
+    # Every stand-in must hold the same triples as the first one
+    for server in servers[1:]:
+        if server.triples != servers[0].triples:
+            return 0
+    return 1
+
+
+async def run_test(servers):
+    # Merges every ordered pair concurrently until a round ships nothing
+    pairs = [(server, peer.server_name) for server in servers for peer in servers if server is not peer]
+    rounds = 0
+    while True:
+        rounds += 1
+        shipped = sum((await merge_concurrently(pairs)).values())
+        if shipped == 0:
+            break
+    print(f"Converged after {rounds} rounds")
+    return check_data_consistency(servers)
+
+
+async def perform_tests(yago_file, insert_interval):
+    logs_dir = tempfile.mkdtemp()
+    # The simulated round trip keeps consecutive updates at distinct millisecond timestamps
+    servers = [async_memory_server(name, logs_dir) for name in ("postgres", "mongo", "neo4j")]
+    for server in servers:
+        await server.connect()
+
+    count = 0
+    test_count = 1
+    start = time.time()
+    for subject, predicate, obj in read_yago_dataset(yago_file):
+        await servers[count % 3].update(subject, predicate, obj)
+        count += 1
+
+        if count % insert_interval == 0:
+            res = await run_test(servers)
+            print(f"Test Case {test_count}: {'SUCCESS' if res == 1 else 'FAILED'}")
+            test_count += 1
+
+    res = await run_test(servers)
+    print(f"Test Case {test_count}: {'SUCCESS' if res == 1 else 'FAILED'}")
+    print(f"{count} updates in {time.time() - start:.2f}s")
+
+    for server in servers:
+        await server.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(perform_tests("tests/yago_first_10k.tsv", 1000))
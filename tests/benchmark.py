@@ -0,0 +1,274 @@
+"""Throughput and latency benchmark for one backend, reported as JSON.
+
+Workloads, run in this order against the same backend:
+
+- bulk_insert: the dataset in update_many() batches of --batch-size triples
+- hot_key_updates: --hot-updates update() calls over --hot-keys keys, Zipf(--skew) distributed
+- point_queries: --queries query() calls for subjects drawn uniformly from the dataset
+- pairwise_merge: --merge-rounds times, the peer takes --merge-records new triples and the
+  backend merge()s that suffix of the peer's log
+- recover: recover() from a log split into --shards shards
+
+The dataset is tests/yago_first_10k.tsv, or --rows synthetic triples with --synthetic. Every
+workload reports ops (triples written, queries, or log records read), ops/s over the time
+spent in the calls, p50 / p99 latency per call (one call is a batch for bulk_insert and a
+whole suffix for pairwise_merge and recover), and the peak RSS of the process so far.
+
+--backend memory runs on async_memory_server stand-ins in a temporary logs directory and
+needs no databases; its recover() replays exactly --shards shards of --recover-records
+records. postgres, mongo and neo4j connect like main.py and merge from the --peer backend.
+They write to the real logs, whose whole suffix past the latest snapshot is replayed by
+recover(); run nuke.sh and src/initialize.py first for comparable numbers.
+
+    python3 tests/benchmark.py --backend memory --output memory.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.async_memory_server import async_memory_server
+from src.log_reader import log_reader
+from src.snapshot import list_snapshots
+from src.triple_file import parse_triple_line
+
+DATABASE_BACKENDS = ("postgres", "mongo", "neo4j")
+
+
+class memory_backend:
+    """Runs an async_memory_server on a private event loop behind the synchronous server calls."""
+
+    def __init__(self, server_name, logs_dir, latency_ms=0, segment_records=None):
+        self.loop = asyncio.new_event_loop()
+        self.server = async_memory_server(server_name, logs_dir, latency_ms=latency_ms, segment_records=segment_records)
+        self.server_name = server_name
+
+    @property
+    def sequence_number(self):
+        return self.server.sequence_number
+
+    @property
+    def log_file(self):
+        return self.server.log_file
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def connect(self):
+        self._run(self.server.connect())
+
+    def query(self, subject):
+        return self._run(self.server.query(subject))
+
+    def update(self, subject, predicate, new_object):
+        self._run(self.server.update(subject, predicate, new_object))
+
+    def update_many(self, triples):
+        async def update_all():
+            for subject, predicate, obj in triples:
+                await self.server.update(subject, predicate, obj)
+        self._run(update_all())
+
+    def merge(self, server_name):
+        return self._run(self.server.merge(server_name))
+
+    def recover(self):
+        self._run(self.server.recover())
+
+    def disconnect(self):
+        self._run(self.server.disconnect())
+        self.loop.close()
+
+
+def connect_backend(name, segment_records=None):
+    # Same connection details as main.py
+    if name == "postgres":
+        from src.postgres_server import postgres_server
+        server = postgres_server(host="localhost", port=5432, database="nosql_proj", user="shlok", password="shlok", segment_records=segment_records)
+    elif name == "mongo":
+        from src.mongo_server import mongo_server
+        server = mongo_server(host="localhost", port=27017, database="nosql_proj", segment_records=segment_records)
+    elif name == "neo4j":
+        from src.neo4j_server import neo4j_server
+        server = neo4j_server(uri="bolt://localhost:7687", user="neo4j", password="neo4jpassword", segment_records=segment_records)
+    else:
+        raise ValueError(f"Unknown backend '{name}'")
+    server.connect()
+    return server
+
+
+def read_dataset(file_path):
+    with open(file_path, encoding="utf-8") as f:
+        return [triple for triple in (parse_triple_line(line) for line in f) if triple]
+
+
+def synthetic_triples(count, rng):
+    predicates = ["<isLocatedIn>", "<hasCapital>", "<isLeaderOf>", "<wasBornIn>", "<hasGender>", "<isCitizenOf>", "<livesIn>", "<hasChild>"]
+    return [(f"<subject_{rng.randrange(max(1, count // 4))}>", rng.choice(predicates), f"<object_{i}>") for i in range(count)]
+
+
+def peak_rss_kib():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def report(ops, latencies, **extra):
+    latencies = sorted(latencies)
+    seconds = sum(latencies)
+    return dict({
+        "ops": ops,
+        "calls": len(latencies),
+        "seconds": round(seconds, 6),
+        "ops_per_s": round(ops / seconds, 1) if seconds else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "peak_rss_kib": peak_rss_kib(),
+    }, **extra)
+
+
+def timed(call, *args):
+    start = time.perf_counter()
+    result = call(*args)
+    return result, time.perf_counter() - start
+
+
+def bulk_insert(server, triples, args):
+    latencies = []
+    for i in range(0, len(triples), args.batch_size):
+        latencies.append(timed(server.update_many, triples[i:i + args.batch_size])[1])
+    return report(len(triples), latencies)
+
+
+def hot_key_updates(server, triples, args, rng):
+    keys = list(dict.fromkeys((subject, predicate) for subject, predicate, _ in triples))[:args.hot_keys]
+    weights = [1 / (rank + 1) ** args.skew for rank in range(len(keys))]
+    chosen = rng.choices(keys, weights, k=args.hot_updates)
+    latencies = [timed(server.update, subject, predicate, f"<hot_{i}>")[1] for i, (subject, predicate) in enumerate(chosen)]
+    return report(len(chosen), latencies, keys=len(keys), skew=args.skew)
+
+
+def point_queries(server, triples, args, rng):
+    subjects = list(dict.fromkeys(subject for subject, _, _ in triples))
+    latencies = [timed(server.query, rng.choice(subjects))[1] for _ in range(args.queries)]
+    return report(args.queries, latencies)
+
+
+def pairwise_merge(server, peer, triples, args, rng):
+    # Each round gives the peer a fresh suffix of new objects for existing keys, then merges it
+    records = 0
+    latencies = []
+    for round_number in range(args.merge_rounds):
+        suffix = [(subject, predicate, f"<merged_{round_number}_{i}>") for i, (subject, predicate, _) in enumerate(rng.sample(triples, min(args.merge_records, len(triples))))]
+        peer.update_many(suffix)
+        count, seconds = timed(server.merge, peer.server_name)
+        records += count or 0
+        latencies.append(seconds)
+    return report(records, latencies, peer=peer.server_name)
+
+
+def recover(server):
+    snapshots = list_snapshots(server.log_file)
+    records = server.sequence_number - (snapshots[0][0] if snapshots else 0)
+    reader = log_reader(server.log_file, ".log")
+    shards = 0
+    while os.path.exists(reader.shard_file(shards)) and next(iter(reader.read_shard(shards)), None) is not None:
+        shards += 1
+    _, seconds = timed(server.recover)
+    return report(records, [seconds], shards=shards)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput / latency benchmark of one backend")
+    parser.add_argument("--backend", choices=("memory",) + DATABASE_BACKENDS, default="memory")
+    parser.add_argument("--peer", choices=DATABASE_BACKENDS, help="backend merged from (database backends only)")
+    parser.add_argument("--dataset", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "yago_first_10k.tsv"))
+    parser.add_argument("--synthetic", action="store_true", help="use --rows generated triples instead of --dataset")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--hot-keys", type=int, default=100)
+    parser.add_argument("--hot-updates", type=int, default=5000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--merge-rounds", type=int, default=10)
+    parser.add_argument("--merge-records", type=int, default=1000)
+    parser.add_argument("--recover-records", type=int, default=10000)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--memory-latency-ms", type=float, default=0, help="simulated round trip of the memory backend")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    triples = synthetic_triples(args.rows, rng) if args.synthetic else read_dataset(args.dataset)
+    segment_records = max(1, math.ceil(args.recover_records / args.shards))
+
+    logs_dir = None
+    if args.backend == "memory":
+        logs_dir = tempfile.mkdtemp()
+        server = memory_backend("bench", logs_dir, args.memory_latency_ms)
+        peer = memory_backend("bench_peer", logs_dir, args.memory_latency_ms)
+        server.connect()
+        peer.connect()
+    else:
+        server = connect_backend(args.backend, segment_records)
+        peer = connect_backend(args.peer or ("mongo" if args.backend != "mongo" else "postgres"))
+
+    workloads = {}
+    recovering = None
+    try:
+        workloads["bulk_insert"] = bulk_insert(server, triples, args)
+        workloads["hot_key_updates"] = hot_key_updates(server, triples, args, rng)
+        workloads["point_queries"] = point_queries(server, triples, args, rng)
+        workloads["pairwise_merge"] = pairwise_merge(server, peer, triples, args, rng)
+
+        if args.backend == "memory":
+            # A log of its own, so recover() reads exactly --shards shards
+            recovering = memory_backend("bench_recover", logs_dir, args.memory_latency_ms, segment_records)
+            recovering.connect()
+            recovering.update_many([(triples[i % len(triples)][0], triples[i % len(triples)][1], f"<recover_{i}>") for i in range(args.recover_records)])
+            workloads["recover"] = recover(recovering)
+        else:
+            workloads["recover"] = recover(server)
+    finally:
+        if recovering is not None:
+            recovering.disconnect()
+        server.disconnect()
+        peer.disconnect()
+        if logs_dir is not None:
+            shutil.rmtree(logs_dir, ignore_errors=True)
+
+    result = {
+        "backend": args.backend,
+        "dataset": "synthetic" if args.synthetic else os.path.basename(args.dataset),
+        "triples": len(triples),
+        "config": {name: value for name, value in vars(args).items() if name not in ("output", "dataset")},
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workloads": workloads,
+        "peak_rss_kib": peak_rss_kib(),
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.server_interface import server
+from src.cached_server import cached_server
+
+
+class dict_server (server):
+    """Triples in a dict, reporting writes to its change listeners like the real servers."""
+
+    def __init__(self):
+        self.server_name = "dict"
+        self.triples = {}
+        self.reads = 0
+        self.clock = 0
+
+    def connect(self):
+        pass
+
+    def _write_to_log(self, subject, predicate, new_object, timestamp):
+        pass
+
+    def query(self, subject):
+        self.reads += 1
+        return [(s, p, obj, timestamp) for (s, p), (obj, timestamp) in self.triples.items() if s == subject]
+
+    def query_many(self, subjects):
+        return [row for subject in dict.fromkeys(subjects) for row in self.query(subject)]
+
+    def match(self, subject=None, predicate=None, object=None, limit=None):
+        return iter([])
+
+    def update(self, subject, predicate, new_object):
+        self.update_many([(subject, predicate, new_object)])
+
+    def update_many(self, triples):
+        rows = []
+        for subject, predicate, obj in triples:
+            self.clock += 1
+            self.triples[(subject, predicate)] = (obj, self.clock)
+            rows.append((subject, predicate, obj, self.clock))
+        self._notify_change(rows)
+
+    def load(self, file_path):
+        pass
+
+    def merge(self, server_name):
+        return 0
+
+    def log_positions(self):
+        return {}
+
+    def apply_triples(self, rows):
+        changed = [row for row in rows if self.triples.get((row[0], row[1]), (None, -1))[1] < row[3]]
+        for subject, predicate, obj, timestamp in changed:
+            self.triples[(subject, predicate)] = (obj, timestamp)
+        self._notify_change(changed)
+        return len(changed)
+
+    def recover(self):
+        pass
+
+    def snapshot(self):
+        pass
+
+    def compact_log(self):
+        return 0
+
+    def disconnect(self):
+        pass
+
+
+def invalidated_on_update():
+    backend = dict_server()
+    cache = cached_server(backend, max_entries=2)
+    backend.update("<Alice>", "<livesIn>", "<Paris>")
+    backend.update("<Bob>", "<livesIn>", "<Rome>")
+
+    # A repeated query is served from the cache
+    if cache.query("<Alice>")[0][2] != "<Paris>" or cache.query("<Alice>")[0][2] != "<Paris>" or backend.reads != 1:
+        return False
+
+    # Updates through the wrapper, straight on the server, and applied by a merge all
+    # invalidate the subject they touch and nothing else
+    cache.query("<Bob>")
+    cache.update("<Alice>", "<livesIn>", "<Lyon>")
+    if cache.query("<Alice>")[0][2] != "<Lyon>" or cache.query("<Bob>")[0][2] != "<Rome>" or backend.reads != 3:
+        return False
+    backend.update("<Alice>", "<livesIn>", "<Nice>")
+    if cache.query("<Alice>")[0][2] != "<Nice>" or backend.reads != 4:
+        return False
+    backend.apply_triples([("<Bob>", "<livesIn>", "<Milan>", backend.clock + 1)])
+    if cache.query("<Bob>")[0][2] != "<Milan>" or backend.reads != 5:
+        return False
+
+    # query_many only reads the subjects it misses
+    if sorted(row[2] for row in cache.query_many(["<Alice>", "<Bob>", "<Carol>"])) != ["<Milan>", "<Nice>"] or backend.reads != 6:
+        return False
+
+    # Alice was hit before Bob and Carol was stored last, so Alice was the least recently used
+    stats = cache.stats()
+    return stats["entries"] == 2 and stats["evictions"] == 1 and stats["invalidations"] == 3 and "<Alice>" not in cache.entries
+
+
+if __name__ == "__main__":
+    res = invalidated_on_update()
+    print(f"Cache invalidation: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if res else 1)
@@ -0,0 +1,70 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.key_index import key_index
+from src.server_interface import server
+
+
+def within_max_keys(index):
+    # Every key fits: staleness is exact and a missing key is definitely absent
+    index.build([(f"<subject_{i}>", "<predicate>", f"<object_{i}>", 100 + i) for i in range(8)])
+    index.record_rows([("<subject_3>", "<predicate>", "<newer>", 500)])
+    return (len(index) == 8 and index.complete
+            and index.is_stale("<subject_0>", "<predicate>", 100) and not index.is_stale("<subject_0>", "<predicate>", 101)
+            and index.is_stale("<subject_3>", "<predicate>", 500) and not index.is_stale("<subject_3>", "<predicate>", 501)
+            and not index.definitely_absent("<subject_7>", "<predicate>")
+            and index.definitely_absent("<subject_8>", "<predicate>") and not index.is_stale("<subject_8>", "<predicate>", 0))
+
+
+def past_max_keys(index):
+    # Keys past max_keys are not stored: they are never stale, and only a Bloom filter may
+    # still call a key absent, never one that was seen
+    index.record_rows([(f"<subject_{i}>", "<predicate>", f"<object_{i}>", 100 + i) for i in range(8, 20)])
+    index.record_rows([("<subject_0>", "<predicate>", "<newer>", 900)])
+    if len(index) != 8 or index.complete:
+        return False
+    if not index.is_stale("<subject_0>", "<predicate>", 900) or index.is_stale("<subject_0>", "<predicate>", 901):
+        return False
+    for i in range(8, 20):
+        if index.is_stale(f"<subject_{i}>", "<predicate>", 0) or index.definitely_absent(f"<subject_{i}>", "<predicate>"):
+            return False
+
+    unseen = [index.definitely_absent(f"<unseen_{i}>", "<predicate>") for i in range(100)]
+    if index.bloom is None:
+        return not any(unseen)
+    # 4096 bits for 20 keys; a false positive among 100 lookups is unlikely but allowed
+    return sum(unseen) >= 95
+
+
+class dump_node:
+    """Just the key_index plumbing of server, over a fixed dump."""
+
+    add_change_listener = server.add_change_listener
+    _notify_change = server._notify_change
+    _build_key_index = server._build_key_index
+
+    def __init__(self):
+        self.key_index = key_index(max_keys=8)
+
+    def _dump_triples(self):
+        return [("<subject_0>", "<predicate>", "<object_0>", 100)]
+
+
+def listener_registered_once():
+    # connect() rebuilds the index on every reconnect, but registers its listener only once
+    node = dump_node()
+    node._build_key_index()
+    node._build_key_index()
+    node._notify_change([("<subject_0>", "<predicate>", "<newer>", 200)])
+    return len(node.change_listeners) == 1 and node.key_index.timestamp("<subject_0>", "<predicate>") == 200
+
+
+if __name__ == "__main__":
+    results = []
+    for index in (key_index(max_keys=8), key_index(max_keys=8, bloom_bits=4096)):
+        results.append(within_max_keys(index))
+        results.append(past_max_keys(index))
+    results.append(listener_registered_once())
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
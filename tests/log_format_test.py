@@ -0,0 +1,103 @@
+import asyncio
+import tempfile
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.async_memory_server import async_memory_server
+from src.log_writer import log_writer
+from src.log_reader import log_reader
+from src.log_format import TEXT_FORMAT, BINARY_FORMAT, convert_log, detect_format
+
+
+def write_log(log_file, log_format):
+    # Records of the owner and relayed ones carrying their origin, over several shards
+    writer = log_writer(log_file, segment_records=3, log_format=log_format)
+    writer.open(0)
+    writer.append("<Alice>", "<livesIn>", "<Paris>", 1)
+    writer.append_many([("<Bob>", "<livesIn>", "<Zürich>", 2, "mongo", 7),
+                        ("<Carol>", "<hasName>", "\"Carol \\\"C\\\" Smith\"@en", 3),
+                        ("<Dan>", "<hasAge>", "\"42\"^^xsd:integer", 4, "neo4j", 1)])
+    writer.append("<Alice>", "<livesIn>", "<Lyon>", 5)
+    writer.close()
+    return [(1, "<Alice>", "<livesIn>", "<Paris>", 1, None, None),
+            (2, "<Bob>", "<livesIn>", "<Zürich>", 2, "mongo", 7),
+            (3, "<Carol>", "<hasName>", "\"Carol \\\"C\\\" Smith\"@en", 3, None, None),
+            (4, "<Dan>", "<hasAge>", "\"42\"^^xsd:integer", 4, "neo4j", 1),
+            (5, "<Alice>", "<livesIn>", "<Lyon>", 5, None, None)]
+
+
+def read_log(log_file):
+    return [tuple(record) for record in log_reader(log_file).read(0)]
+
+
+def round_trip(log_format, other_format):
+    # Records read back as written, and again after converting the log both ways
+    log_file = os.path.join(tempfile.mkdtemp(), "postgres")
+    expected = write_log(log_file, log_format)
+    if read_log(log_file) != expected or detect_format(log_file + "_0.log") != log_format:
+        return False
+
+    convert_log(log_file, other_format)
+    if read_log(log_file) != expected or detect_format(log_file + "_0.log") != other_format:
+        return False
+
+    convert_log(log_file, log_format)
+    return read_log(log_file) == expected and detect_format(log_file + "_0.log") == log_format
+
+
+def text_rejects_separators():
+    # A conversion to text fails clearly on a value with a tab or line break, instead of
+    # splitting its record, and leaves the binary log as it was
+    log_file = os.path.join(tempfile.mkdtemp(), "mongo")
+    writer = log_writer(log_file, segment_records=2, log_format=BINARY_FORMAT)
+    writer.open(0)
+    writer.append("<Alice>", "<livesIn>", "<Paris>", 1)
+    writer.append("<Alice>", "<hasName>", "\"Alice\"", 2)
+    writer.append("<Bob>", "<motto>", "\"line one\nline two\"", 3)
+    writer.close()
+
+    try:
+        convert_log(log_file, TEXT_FORMAT)
+        return False
+    except ValueError:
+        pass
+    return detect_format(log_file + "_0.log") == BINARY_FORMAT and len(read_log(log_file)) == 3
+
+
+def text_log_keeps_every_row(segment_records):
+    # A text-format node updating, and merging from a binary peer, values with tabs and line
+    # breaks must log every row it stores: its log alone recovers the same triples
+    logs_dir = tempfile.mkdtemp()
+    node = async_memory_server("postgres", logs_dir, latency_ms=0, log_format=TEXT_FORMAT, segment_records=segment_records)
+    peer = async_memory_server("mongo", logs_dir, latency_ms=0, log_format=BINARY_FORMAT)
+
+    async def run():
+        await node.connect()
+        await peer.connect()
+        await node.update("<Alice>", "<livesIn>", "<Paris>")
+        await node.update("<Alice>", "<motto>", "\"tab\there\"")
+        await node.update("<Alice>", "<hasName>", "\"Alice\"")
+        for i in range(5):
+            await peer.update(f"<Bob_{i}>", "<motto>", f"\"line {i}\nnext\r\"" if i % 2 else f"\"plain {i}\"")
+        await node.merge("mongo")
+        await node.update("<Carol>", "<livesIn>", "<Rome>")
+        await peer.disconnect()
+        await node.disconnect()
+
+        restored = async_memory_server("postgres", logs_dir, latency_ms=0, log_format=TEXT_FORMAT, segment_records=segment_records)
+        await restored.connect()
+        await restored.recover()
+        await restored.disconnect()
+        return restored
+
+    restored = asyncio.run(run())
+    seqs = [record[0] for record in read_log(node.log_file)]
+    return len(node.triples) == 9 and restored.triples == node.triples and seqs == list(range(1, 10))
+
+
+if __name__ == "__main__":
+    results = [round_trip(TEXT_FORMAT, BINARY_FORMAT), round_trip(BINARY_FORMAT, TEXT_FORMAT), text_rejects_separators(),
+               text_log_keeps_every_row(None), text_log_keeps_every_row(2)]
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
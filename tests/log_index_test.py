@@ -0,0 +1,47 @@
+import tempfile
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.log_writer import log_writer
+from src.log_reader import log_reader
+from src.log_format import TEXT_FORMAT, BINARY_FORMAT
+
+
+def append_records(writer, first, last):
+    for i in range(first, last + 1):
+        writer.append(f"<subject_{i}>", "<predicate>", f"<object_{i}>", i)
+
+
+def seeks_across_shards(log_format):
+    # Shards of 7 records and an index entry every 4th record, so entries fall at every
+    # offset within a shard and several shards have none at their start
+    log_file = os.path.join(tempfile.mkdtemp(), "mongo")
+    writer = log_writer(log_file, segment_records=7, log_format=log_format)
+    writer.open(0)
+    append_records(writer, 1, 40)
+
+    expected = list(log_reader(log_file, index_interval=4).read(0))
+    if [record.seq for record in expected] != list(range(1, 41)):
+        return False
+
+    # A new reader loads the index written by the first one
+    reader = log_reader(log_file, index_interval=4)
+    if len({shard for shard, _ in reader.index_positions}) < 5:
+        return False
+    for log_pos in range(41):
+        if list(reader.read(log_pos)) != expected[log_pos:]:
+            return False
+
+    # Records appended after the index was built, into the active shard and past it
+    append_records(writer, 41, 52)
+    writer.close()
+    expected = list(log_reader(log_file).read(0))
+    reader = log_reader(log_file, index_interval=4)
+    return all(list(reader.read(log_pos)) == expected[log_pos:] for log_pos in range(53))
+
+
+if __name__ == "__main__":
+    results = [seeks_across_shards(TEXT_FORMAT), seeks_across_shards(BINARY_FORMAT)]
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
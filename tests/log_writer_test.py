@@ -0,0 +1,102 @@
+import tempfile
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import src.log_writer
+from src.log_writer import log_writer, FSYNC_ALWAYS, FSYNC_EVERY_N, FSYNC_INTERVAL
+from src.log_reader import log_reader
+from src.log_format import TEXT_FORMAT, BINARY_FORMAT, encode_record
+
+# Counts fsync calls made by the writer
+fsyncs = []
+real_fsync = os.fsync
+
+
+def counting_fsync(fd):
+    fsyncs.append(fd)
+    real_fsync(fd)
+
+
+src.log_writer.os.fsync = counting_fsync
+
+
+def torn_tail_is_cut(log_format):
+    # A crash mid-append leaves part of record 6 behind. open() must cut it off, find the
+    # true tail although the checkpoint lags at 2, and continue at 6.
+    log_file = os.path.join(tempfile.mkdtemp(), "postgres")
+    writer = log_writer(log_file, segment_records=3, log_format=log_format)
+    writer.open(0)
+    for i in range(1, 6):
+        writer.append(f"<subject_{i}>", "<p>", f"<object_{i}>", i)
+    writer.close()
+
+    shard_file = log_file + "_1.log"
+    size = os.path.getsize(shard_file)
+    torn = encode_record(log_format, 6, "<torn>", "<p>", "<object>", 6)
+    with open(shard_file, "ab") as f:
+        f.write(torn[:len(torn) // 2])
+
+    checkpoints = []
+    writer = log_writer(log_file, segment_records=3, log_format=log_format, checkpoint=checkpoints.append)
+    if writer.open(2) != 5 or os.path.getsize(shard_file) != size:
+        return False
+    writer.append("<subject_6>", "<p>", "<object_6>", 6)
+    writer.close()
+
+    records = [(record.seq, record.subject) for record in log_reader(log_file).read(0)]
+    return records == [(i, f"<subject_{i}>") for i in range(1, 7)] and checkpoints[-1] == 6
+
+
+def open_writer(fsync_policy, **options):
+    writer = log_writer(os.path.join(tempfile.mkdtemp(), "mongo"), log_format=TEXT_FORMAT, fsync_policy=fsync_policy, **options)
+    writer.open(0)
+    fsyncs.clear()
+    return writer
+
+
+def fsync_always():
+    # Every call is durable before it returns: one fsync per call, not per record
+    writer = open_writer(FSYNC_ALWAYS)
+    writer.append("<s>", "<p>", "<o1>", 1)
+    writer.append_many([("<s>", "<p>", f"<o{i}>", i) for i in range(2, 6)])
+    result = len(fsyncs) == 2 and writer.synced_sequence_number == 5
+    writer.close()
+    return result
+
+
+def fsync_every_n():
+    # Records are group-committed once fsync_every of them are pending
+    writer = open_writer(FSYNC_EVERY_N, fsync_every=3)
+    writer.append("<s>", "<p>", "<o1>", 1)
+    writer.append("<s>", "<p>", "<o2>", 2)
+    if fsyncs or writer.synced_sequence_number != 0:
+        writer.close()
+        return False
+    writer.append("<s>", "<p>", "<o3>", 3)
+    result = len(fsyncs) == 1 and writer.synced_sequence_number == 3
+    writer.close()
+    return result
+
+
+def fsync_interval():
+    # Appends return without an fsync; the background thread syncs and checkpoints shortly after
+    checkpoints = []
+    writer = open_writer(FSYNC_INTERVAL, fsync_interval_ms=200, checkpoint=checkpoints.append, checkpoint_interval_ms=200)
+    writer.append_many([("<s>", "<p>", f"<o{i}>", i) for i in range(1, 11)])
+    if writer.synced_sequence_number != 0:
+        writer.close()
+        return False
+    deadline = time.monotonic() + 2
+    while (writer.synced_sequence_number != 10 or not checkpoints) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    result = writer.synced_sequence_number == 10 and len(fsyncs) >= 1 and checkpoints[-1:] == [10]
+    writer.close()
+    return result
+
+
+if __name__ == "__main__":
+    results = [torn_tail_is_cut(TEXT_FORMAT), torn_tail_is_cut(BINARY_FORMAT), fsync_always(), fsync_every_n(), fsync_interval()]
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,105 @@
+import threading
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.merge_scheduler import merge_scheduler
+
+
+class log_node:
+    """A server over a dict and an in-memory log; merge() reads a peer's log and re-logs the rows that won."""
+
+    def __init__(self, server_name, nodes, delay_s=0.05):
+        self.server_name = server_name
+        self.nodes = nodes
+        self.delay_s = delay_s
+        self.triples = {}
+        self.log = []
+        self.positions = {}
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        nodes[server_name] = self
+
+    @property
+    def sequence_number(self):
+        return len(self.log)
+
+    def update(self, subject, predicate, obj, timestamp):
+        self.triples[(subject, predicate)] = (obj, timestamp)
+        self.log.append((subject, predicate, obj, timestamp, self.server_name))
+
+    def log_positions(self):
+        return dict(self.positions)
+
+    def merge(self, server_name):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        start = self.positions.get(server_name, 0)
+        records = self.nodes[server_name].log[start:]
+        time.sleep(self.delay_s)
+        for subject, predicate, obj, timestamp, origin in records:
+            if origin != self.server_name and self.triples.get((subject, predicate), (None, -1))[1] < timestamp:
+                self.triples[(subject, predicate)] = (obj, timestamp)
+                self.log.append((subject, predicate, obj, timestamp, origin))
+        self.positions[server_name] = start + len(records)
+        with self.lock:
+            self.active -= 1
+        return len(records)
+
+
+class failing_node(log_node):
+    def merge(self, server_name):
+        return 0
+
+
+def merges_until_quiescent():
+    # Records relayed in one round leave suffixes for the next; the scheduler keeps going
+    # until every server has read every peer log, and all end with the same triples
+    nodes = {}
+    a, b, c = log_node("postgres", nodes), log_node("mongo", nodes), log_node("neo4j", nodes)
+    a.update("<Alice>", "<livesIn>", "<Paris>", 1)
+    b.update("<Alice>", "<livesIn>", "<Lyon>", 2)
+    b.update("<Bob>", "<livesIn>", "<Rome>", 3)
+    c.update("<Carol>", "<livesIn>", "<Oslo>", 4)
+
+    scheduler = merge_scheduler([a, b, c])
+    start = time.monotonic()
+    report = scheduler.run()
+    seconds = time.monotonic() - start
+    expected = {("<Alice>", "<livesIn>"): ("<Lyon>", 2), ("<Bob>", "<livesIn>"): ("<Rome>", 3), ("<Carol>", "<livesIn>"): ("<Oslo>", 4)}
+    if not (a.triples == b.triples == c.triples == expected) or scheduler.pending_merges():
+        return False
+    # Each server merges its two peers one after another, never two at once, while the
+    # three servers merge in parallel: a round takes about two merges, not six
+    if any(node.max_active != 1 for node in nodes.values()):
+        return False
+    return report.rounds >= 2 and report.records == sum(len(node.log) for node in nodes.values()) * 2 and seconds < 0.2 * report.rounds
+
+
+def stops_when_nothing_is_read():
+    # A server whose merges read nothing stays pending; the scheduler gives up after one
+    # round instead of spinning until max_rounds
+    nodes = {}
+    a, b = failing_node("postgres", nodes), log_node("mongo", nodes)
+    b.update("<Alice>", "<livesIn>", "<Paris>", 1)
+    report = merge_scheduler([a, b]).run()
+    return report.rounds == 1 and report.records == 0 and not a.triples
+
+
+def stops_at_max_rounds():
+    nodes = {}
+    a, b = log_node("postgres", nodes), log_node("mongo", nodes)
+    a.update("<Alice>", "<livesIn>", "<Paris>", 1)
+    b.update("<Bob>", "<livesIn>", "<Rome>", 2)
+    report = merge_scheduler([a, b], max_rounds=1).run()
+    # Both re-logged the other's row, so after one round each has an unread record in the other's log
+    return report.rounds == 1 and merge_scheduler([a, b]).pending_merges() == {"postgres": ["mongo"], "mongo": ["postgres"]}
+
+
+if __name__ == "__main__":
+    results = [merges_until_quiescent(), stops_when_nothing_is_read(), stops_at_max_rounds()]
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,45 @@
+import math
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.metrics import histogram, registry, prometheus_text, stats_report
+
+
+def quantiles_interpolate():
+    # 100 observations in (0.01, 0.025]: quantiles spread linearly over the bucket
+    entry = histogram()
+    for _ in range(100):
+        entry.observe(0.02)
+    return (entry.quantile(0.0) == 0.01 and math.isclose(entry.quantile(0.5), 0.0175)
+            and math.isclose(entry.quantile(1.0), 0.025) and histogram().quantile(0.5) is None)
+
+
+def overflow_is_infinite():
+    # Observations above the last bound are not reported as 60 s: the quantiles that
+    # fall among them are infinite, those below are not
+    entry = histogram()
+    for _ in range(90):
+        entry.observe(0.02)
+    for _ in range(10):
+        entry.observe(120.0)
+    return entry.quantile(0.5) <= 0.025 and entry.quantile(0.95) == float("inf") and entry.quantile(1.0) == float("inf")
+
+
+def outputs_agree():
+    # The Prometheus output counts the slow calls only in le="+Inf", and the report shows p99 as inf
+    registry.reset()
+    for _ in range(10):
+        registry.observe("operation_seconds", 90.0, server="postgres", operation="merge")
+    text = prometheus_text()
+    report = stats_report()
+    registry.reset()
+    return ('triplestore_operation_seconds_bucket{operation="merge",server="postgres",le="60.0"} 0' in text
+            and 'triplestore_operation_seconds_bucket{operation="merge",server="postgres",le="+Inf"} 10' in text
+            and "p99 inf ms" in report)
+
+
+if __name__ == "__main__":
+    results = [quantiles_interpolate(), overflow_is_infinite(), outputs_agree()]
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
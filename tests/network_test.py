@@ -0,0 +1,126 @@
+import asyncio
+import socket
+import threading
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.network_server import network_server
+from src.network_client import network_client
+
+
+class slow_server:
+    """Triples in a dict; every call takes delay_s, so pipelined requests overlap."""
+
+    def __init__(self, server_name, delay_s=0.05):
+        self.server_name = server_name
+        self.delay_s = delay_s
+        self.triples = {}
+        self.lock = threading.Lock()
+
+    def query(self, subject):
+        time.sleep(self.delay_s)
+        with self.lock:
+            return [(s, p, obj, timestamp) for (s, p), (obj, timestamp) in self.triples.items() if s == subject]
+
+    def query_many(self, subjects):
+        return [row for subject in subjects for row in self.query(subject)]
+
+    def update(self, subject, predicate, new_object):
+        time.sleep(self.delay_s)
+        with self.lock:
+            self.triples[(subject, predicate)] = (new_object, int(time.time() * 1000))
+
+    def update_many(self, triples):
+        for subject, predicate, obj in triples:
+            self.update(subject, predicate, obj)
+
+
+def start_server(servers):
+    # Serves on a free port from a daemon thread, like main.py's network mode
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    threading.Thread(target=network_server(servers, port=port).serve_forever, daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return port
+        except ConnectionError:
+            time.sleep(0.05)
+    raise RuntimeError("Network server did not start")
+
+
+def reads_own_writes(client):
+    # A read pipelined right behind a slow write sees it, and a write pipelined behind a
+    # slow read does not overtake it
+    results = client.pipeline([{"op": "update", "server": "mongo", "subject": "<Alice>", "predicate": "<livesIn>", "object": "<Paris>"},
+                               {"op": "query", "server": "mongo", "subject": "<Alice>"},
+                               {"op": "update", "server": "mongo", "subject": "<Alice>", "predicate": "<livesIn>", "object": "<Lyon>"},
+                               {"op": "query", "server": "mongo", "subject": "<Alice>"}])
+    return ([row[2] for row in results[1]] == ["<Paris>"] and [row[2] for row in results[3]] == ["<Lyon>"]
+            and [row[2] for row in client.query("mongo", "<Alice>")] == ["<Lyon>"])
+
+
+def reads_run_in_parallel(client):
+    # Twenty 50 ms reads in one pipeline answer in order and take far less than a second
+    client.update_many("postgres", [(f"<subject_{i}>", "<p>", f"<object_{i}>") for i in range(20)])
+    start = time.monotonic()
+    results = client.pipeline([{"op": "query", "server": "postgres", "subject": f"<subject_{i}>"} for i in range(20)])
+    seconds = time.monotonic() - start
+    return [[row[2] for row in rows] for rows in results] == [[f"<object_{i}>"] for i in range(20)] and seconds < 0.5
+
+
+def errors_keep_connection(client):
+    # A failed request raises, and the connection keeps answering the requests after it
+    try:
+        client.pipeline([{"op": "ping"}, {"op": "query", "server": "neo4j", "subject": "<Alice>"}])
+        return False
+    except RuntimeError as error:
+        if "Unknown server" not in str(error):
+            return False
+    try:
+        client.call("update", "mongo", subject="<Bob>")
+        return False
+    except RuntimeError as error:
+        if "Missing argument" not in str(error):
+            return False
+    return client.ping() == "pong"
+
+
+class recording_writer:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    async def drain(self):
+        pass
+
+
+def ready_answers_share_a_write():
+    # Answers that are ready together go out in one write, in request order
+    async def run():
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue()
+        for i in range(5):
+            task = loop.create_future()
+            task.set_result(f"{i}\n".encode("utf-8"))
+            pending.put_nowait(task)
+        pending.put_nowait(None)
+        writer = recording_writer()
+        await network_server([])._write_responses(writer, pending)
+        return writer.writes
+
+    return asyncio.run(run()) == [b"0\n1\n2\n3\n4\n"]
+
+
+if __name__ == "__main__":
+    port = start_server([slow_server("mongo"), slow_server("postgres")])
+    with network_client(port=port, timeout=10) as client:
+        results = [reads_own_writes(client), reads_run_in_parallel(client), errors_keep_connection(client)]
+    results.append(ready_answers_share_a_write())
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,131 @@
+"""Compares the single-table and hash-partitioned Postgres triples layouts.
+
+Each layout is created with initialize.create_postgres_triples() in a scratch schema of
+its own (bench_single, bench_partitioned), loaded with the same synthetic triples, and
+then driven with the statements postgres_server uses:
+
+- update: single-row ON CONFLICT upserts, each in its own transaction, as update() does
+- query: point lookups by subject, as query() does
+- merge: last-writer-wins batches of --batch-size rows with RETURNING, as merge() does
+
+Needs the Postgres server from src/initialize.py; the scratch schemas are dropped at the end.
+Prints one JSON object with the ops/s of every workload per layout.
+
+    python3 tests/partition_benchmark.py --rows 200000 --partitions 16
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from psycopg2.extras import execute_values
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.initialize import connect_postgres, create_postgres_triples
+
+UPSERT = """
+INSERT INTO triples (subject, predicate, object, timestamp) VALUES (%s, %s, %s, %s)
+ON CONFLICT (subject, predicate) DO UPDATE SET object = %s, timestamp = %s
+"""
+
+MERGE_BATCH = """
+INSERT INTO triples (subject, predicate, object, timestamp) VALUES %s
+ON CONFLICT (subject, predicate) DO UPDATE SET object = EXCLUDED.object, timestamp = EXCLUDED.timestamp
+WHERE triples.timestamp < EXCLUDED.timestamp
+RETURNING subject, predicate
+"""
+
+PREDICATES = ["isLocatedIn", "hasCapital", "isLeaderOf", "wasBornIn", "hasGender", "isCitizenOf", "livesIn", "hasChild"]
+
+
+def synthetic_rows(count, subjects, timestamp):
+    rows = {}
+    rng = random.Random(42)
+    while len(rows) < count:
+        subject = f"<subject_{rng.randrange(subjects)}>"
+        predicate = rng.choice(PREDICATES)
+        rows[(subject, predicate)] = (subject, predicate, f"<object_{rng.randrange(count)}>", timestamp)
+    return list(rows.values())
+
+
+def timed(operation, count):
+    start = time.perf_counter()
+    operation()
+    return round(count / (time.perf_counter() - start), 1)
+
+
+def bench_layout(conn, schema, partitions, rows, args):
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cur.execute(f"CREATE SCHEMA {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+    create_postgres_triples(cur, partitions)
+    conn.commit()
+
+    rng = random.Random(7)
+    results = {"partitions": partitions}
+
+    def load():
+        for i in range(0, len(rows), args.batch_size):
+            execute_values(cur, MERGE_BATCH, sorted(rows[i:i + args.batch_size]), page_size=args.batch_size, fetch=True)
+            conn.commit()
+    results["load_rows_per_s"] = timed(load, len(rows))
+
+    def update():
+        timestamp = int(time.time() * 1000)
+        for i in range(args.updates):
+            subject, predicate, _, _ = rows[rng.randrange(len(rows))]
+            new_object = f"<updated_{i}>"
+            cur.execute(UPSERT, (subject, predicate, new_object, timestamp + i, new_object, timestamp + i))
+            conn.commit()
+    results["update_ops_per_s"] = timed(update, args.updates)
+
+    def query():
+        for _ in range(args.queries):
+            cur.execute("SELECT subject, predicate, object, timestamp FROM triples WHERE subject = %s", (rows[rng.randrange(len(rows))][0],))
+            cur.fetchall()
+        conn.commit()
+    results["query_ops_per_s"] = timed(query, args.queries)
+
+    # A peer's suffix: half newer versions of existing keys, half stale ones
+    timestamp = int(time.time() * 1000) + args.updates + 1
+    suffix = [(subject, predicate, obj + "_merged", timestamp if i % 2 else 0)
+              for i, (subject, predicate, obj, _) in enumerate(rng.sample(rows, min(args.merge_rows, len(rows))))]
+
+    def merge():
+        for i in range(0, len(suffix), args.batch_size):
+            execute_values(cur, MERGE_BATCH, sorted(suffix[i:i + args.batch_size]), page_size=args.batch_size, fetch=True)
+            conn.commit()
+    results["merge_records_per_s"] = timed(merge, len(suffix))
+
+    cur.execute(f"DROP SCHEMA {schema} CASCADE")
+    conn.commit()
+    cur.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-table vs hash-partitioned triples benchmark")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--merge-rows", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows, max(1, args.rows // 4), 1)
+    conn = connect_postgres()
+    try:
+        report = {
+            "rows": args.rows,
+            "single": bench_layout(conn, "bench_single", 0, rows, args),
+            "partitioned": bench_layout(conn, "bench_partitioned", args.partitions, rows, args),
+        }
+    finally:
+        conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
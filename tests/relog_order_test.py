@@ -0,0 +1,71 @@
+import asyncio
+import tempfile
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.async_memory_server import async_memory_server
+from src.async_server_interface import merge_concurrently
+from src.log_reader import log_reader
+
+
+async def relayed_updates_survive():
+    # c updates K, L and K again. a merges all three in one batch, which it reduces to the
+    # newest record per key, and relays them to b. b must not skip c's L update when it
+    # reads a's relayed records, nor when it then merges c directly.
+    logs_dir = tempfile.mkdtemp()
+    a, b, c = (async_memory_server(name, logs_dir, latency_ms=2) for name in ("a", "b", "c"))
+    for server in (a, b, c):
+        await server.connect()
+
+    await c.update("<s>", "<K>", "<k1>")
+    await c.update("<s>", "<L>", "<l1>")
+    await c.update("<s>", "<K>", "<k2>")
+
+    await a.merge("c")
+    await b.merge("a")
+    await b.merge("c")
+    result = b.triples == c.triples
+
+    for server in (a, b, c):
+        await server.disconnect()
+    return result
+
+
+async def concurrent_merges_into_one_server():
+    # c makes many updates of its own and then relays x's first two, b relays all four of
+    # x's. a merges b and c at the same time, so c's old view of x reaches a last: a's
+    # version vector must still end at x's newest update, its log must hold every origin's
+    # records in origin_seq order, and d reading a must get everything.
+    logs_dir = tempfile.mkdtemp()
+    a, b, c, d, x = (async_memory_server(name, logs_dir, latency_ms=2, merge_batch_size=4) for name in ("a", "b", "c", "d", "x"))
+    for server in (a, b, c, d, x):
+        await server.connect()
+
+    for i in range(20):
+        await c.update(f"<c{i}>", "<P>", f"<o{i}>")
+    await x.update("<s>", "<K>", "<k1>")
+    await x.update("<s>", "<L>", "<l1>")
+    await c.merge("x")
+    await x.update("<s>", "<K>", "<k2>")
+    await x.update("<s>", "<M>", "<m1>")
+    await b.merge("x")
+
+    await merge_concurrently([(a, "b"), (a, "c")])
+    await d.merge("a")
+
+    origin_seqs = {}
+    for record in log_reader(a.log_file).read(0):
+        origin_seqs.setdefault(record.origin, []).append(record.origin_seq)
+    result = (a.version_vector == {"x": 4, "c": 20} and all(seqs == sorted(seqs) for seqs in origin_seqs.values())
+              and d.triples == {**c.triples, **x.triples} and a.triples == d.triples)
+
+    for server in (a, b, c, d, x):
+        await server.disconnect()
+    return result
+
+
+if __name__ == "__main__":
+    results = [asyncio.run(relayed_updates_survive()), asyncio.run(concurrent_merges_into_one_server())]
+    print(f"Relayed updates reach every node: {'SUCCESS' if results[0] else 'FAILED'}")
+    print(f"Concurrent merges into one server: {'SUCCESS' if results[1] else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,90 @@
+import json
+import tempfile
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.snapshot import write_snapshot, list_snapshots, read_snapshot, prune_snapshots, snapshot_file
+
+
+def rows_at(version):
+    return [(f"<subject_{i}>", "<livesIn>", f"<city_{i}_{version}>", 100 * version + i) for i in range(5)]
+
+
+def write_snapshots(log_file):
+    for sequence_number in (10, 20, 30):
+        write_snapshot(log_file, sequence_number, rows_at(sequence_number))
+
+
+def restore_latest(log_file):
+    # The servers' _restore_latest_snapshot(): the newest snapshot that reads back intact wins
+    for sequence_number, path in list_snapshots(log_file):
+        try:
+            return sequence_number, [(record.subject, record.predicate, record.object, record.timestamp) for record in read_snapshot(path)]
+        except ValueError:
+            pass
+    return 0, []
+
+
+def round_trip():
+    # Snapshots list newest first and read back as written, every record tagged with their sequence number
+    log_file = os.path.join(tempfile.mkdtemp(), "postgres")
+    write_snapshots(log_file)
+    snapshots = list_snapshots(log_file)
+    if [sequence_number for sequence_number, _ in snapshots] != [30, 20, 10]:
+        return False
+    records = list(read_snapshot(snapshots[0][1]))
+    return ([(record.subject, record.predicate, record.object, record.timestamp) for record in records] == rows_at(30)
+            and all(record.seq == 30 for record in records) and restore_latest(log_file) == (30, rows_at(30)))
+
+
+def damaged_checksum():
+    # A flipped byte fails its record's checksum; recovery falls back to the snapshot before
+    log_file = os.path.join(tempfile.mkdtemp(), "postgres")
+    write_snapshots(log_file)
+    path = snapshot_file(log_file, 30)
+    with open(path, "r+b") as f:
+        f.seek(os.path.getsize(path) - 8)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    return len(list_snapshots(log_file)) == 3 and restore_latest(log_file) == (20, rows_at(20))
+
+
+def damaged_record_count():
+    # A snapshot missing its last record, with sizes that still agree, reads back short
+    log_file = os.path.join(tempfile.mkdtemp(), "postgres")
+    write_snapshots(log_file)
+    path = snapshot_file(log_file, 30)
+    short = write_snapshot(os.path.join(tempfile.mkdtemp(), "postgres"), 30, rows_at(30)[:-1])
+    os.replace(short, path)
+    with open(path + ".json", "r") as f:
+        metadata = json.load(f)
+    metadata["bytes"] = os.path.getsize(path)
+    with open(path + ".json", "w") as f:
+        json.dump(metadata, f)
+    return restore_latest(log_file) == (20, rows_at(20))
+
+
+def incomplete_snapshots_unlisted():
+    # A snapshot cut short, or one whose metadata was never written, is not listed at all
+    log_file = os.path.join(tempfile.mkdtemp(), "postgres")
+    write_snapshots(log_file)
+    with open(snapshot_file(log_file, 30), "r+b") as f:
+        f.truncate(20)
+    os.remove(snapshot_file(log_file, 20) + ".json")
+    return [sequence_number for sequence_number, _ in list_snapshots(log_file)] == [10] and restore_latest(log_file) == (10, rows_at(10))
+
+
+def prune_keeps_newest():
+    log_file = os.path.join(tempfile.mkdtemp(), "postgres")
+    write_snapshots(log_file)
+    prune_snapshots(log_file, keep=2)
+    return ([sequence_number for sequence_number, _ in list_snapshots(log_file)] == [30, 20]
+            and not os.path.exists(snapshot_file(log_file, 10)) and not os.path.exists(snapshot_file(log_file, 10) + ".json"))
+
+
+if __name__ == "__main__":
+    results = [round_trip(), damaged_checksum(), damaged_record_count(), incomplete_snapshots_unlisted(), prune_keeps_newest()]
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,63 @@
+import tempfile
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.triple_file import parse_triple_line, read_triple_batches
+
+
+def parses_lines():
+    # Tabs split when present, spaces otherwise, and only the first two separators split
+    if parse_triple_line("<Alice>\t<hasName>\t\"Alice Smith\"@en\n") != ("<Alice>", "<hasName>", "\"Alice Smith\"@en"):
+        return False
+    if parse_triple_line("<Alice> <hasName> \"Alice Smith\"@en\r\n") != ("<Alice>", "<hasName>", "\"Alice Smith\"@en"):
+        return False
+    if parse_triple_line("<Alice>\t<motto>\t\"a b\tc\"") != ("<Alice>", "<motto>", "\"a b\tc\""):
+        return False
+    if parse_triple_line("\n") is not None or parse_triple_line("   \r\n") is not None:
+        return False
+    for line in ("<Alice> <livesIn>\n", "\t<livesIn>\t<Paris>\n", "<Alice>\t\t<Paris>\n"):
+        try:
+            parse_triple_line(line)
+            return False
+        except ValueError:
+            pass
+    return True
+
+
+def write_file(lines):
+    path = os.path.join(tempfile.mkdtemp(), "triples.tsv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(lines))
+    return path
+
+
+def batches_load_in_order():
+    # Each batch keeps the last line per (subject, predicate), and later batches carry
+    # larger timestamps, so loading them gives the file's last line per key
+    path = write_file(["<Alice>\t<livesIn>\t<Paris>\n",
+                       "<Bob>\t<livesIn>\t<Rome>\n",
+                       "\n",
+                       "<Alice>\t<livesIn>\t<Lyon>\n",
+                       "<Carol> <livesIn> <Oslo>\n",
+                       "<Alice>\t<livesIn>\t<Nice>\n",
+                       "<Dan>\t<livesIn>\t<Bern>\n"])
+    batches = list(read_triple_batches(path, batch_size=3))
+    if [[row[:3] for row in batch] for batch in batches] != [[("<Bob>", "<livesIn>", "<Rome>"), ("<Alice>", "<livesIn>", "<Lyon>")],
+                                                              [("<Carol>", "<livesIn>", "<Oslo>"), ("<Alice>", "<livesIn>", "<Nice>"), ("<Dan>", "<livesIn>", "<Bern>")]]:
+        return False
+    timestamps = [{row[3] for row in batch} for batch in batches]
+    return all(len(stamps) == 1 for stamps in timestamps) and min(timestamps[1]) > max(timestamps[0])
+
+
+def skips_malformed_lines():
+    # A malformed line is reported and skipped, the lines around it still load
+    path = write_file(["<Alice>\t<livesIn>\t<Paris>\n", "<Bob> <livesIn>\n", "<Carol>\t<livesIn>\t<Oslo>"])
+    batches = list(read_triple_batches(path))
+    return len(batches) == 1 and [row[:3] for row in batches[0]] == [("<Alice>", "<livesIn>", "<Paris>"), ("<Carol>", "<livesIn>", "<Oslo>")]
+
+
+if __name__ == "__main__":
+    results = [parses_lines(), batches_load_in_order(), skips_malformed_lines()]
+    for test_count, res in enumerate(results, 1):
+        print(f"Test Case {test_count}: {'SUCCESS' if res else 'FAILED'}")
+    sys.exit(0 if all(results) else 1)